@@ -2,11 +2,15 @@
 Start up script for Wrestling Nerd.
 '''
 
+import multiprocessing
 import wx
 from wnUI import wnFrame
 import WrestlingNerd_wdr as GUI
 
 if __name__ == '__main__':
+  # let simulation worker processes start from a frozen executable
+  multiprocessing.freeze_support()
+
   # create the frame
   app = wx.PySimpleApp(0)
   frame = wnFrame()
@@ -10,6 +10,7 @@ setup(name='WrestlingNerd',
       description='Wrestling Nerd: Wrestling tournament management software',
       options = {'py2exe': {'compressed': 1, 'optimize': 2}},      
       windows = [{'script': 'WrestlingNerd.py', 'icon_resources': [(1, 'WrestlingNerd_wdr/nerd.ico')]}],
+      console = [{'script': 'wnConvert.py'}, {'script': 'wnGenerator.py'}],
       data_files=[('WrestlingNerd_wdr', ['WrestlingNerd_wdr/bout.png', 'WrestlingNerd_wdr/LogoBitmaps_0.png', 'WrestlingNerd_wdr/nerd16.ico']),
                   ('', ['LICENSE.txt']),
                   ('layouts', ['layouts/CTOpen.yml', 'layouts/CTStates.yml', 'layouts/BCInvite.yml'])]
@@ -0,0 +1,231 @@
+'''
+The archive module keeps an index of a season of tournament files in one small file. The index
+holds the name, teams, weights, wrestlers, place winners, and bouts of every tournament in a folder,
+so season records and pin lists can be looked up without loading any tournament. Updating the index
+only reads the files whose modification time or size changed since they were last indexed.
+
+usage: python wnArchive.py [options] folder [wrestler ...]
+'''
+import cPickle
+import optparse
+import os
+import sys
+import zlib
+
+from wnScoreData import wnResultPin
+import wnConvert
+import wnSettings
+import wnStorage
+
+VERSION = 1
+
+def Describe(tournament):
+  '''Get the parts of a tournament kept in the index as plain data. Bouts are (weight, round,
+  winner, winning team, loser, losing team, result type, result value, result text) tuples, with
+  no loser for a bye.'''
+  tournament.LoadWeights()
+  wrestlers = []
+  for name in tournament.TeamNames:
+    for w in tournament.Teams[name].Wrestlers:
+      wrestlers.append((w.Name, name, w.Weight))
+
+  places = []
+  bouts = []
+  for weight in tournament.Weights:
+    wc = tournament.GetWeightClass(weight)
+    place = 0
+    for pw in wc.GetPlaceWinners():
+      place += 1
+      if pw.Name != 'None':
+        places.append((weight, place, pw.Name, pw.Team))
+
+    # a result is kept in the entry the winner moved into, the loser is in the entries before it
+    for r in wc.Rounds:
+      for e in wc.GetRound(r).entries:
+        if e.Wrestler is None or e.Result is None or e.Previous == []:
+          continue
+        loser = (None, None)
+        for p in e.Previous:
+          if p.Wrestler is not None and p.Wrestler is not e.Wrestler:
+            loser = (p.Wrestler.Name, p.Wrestler.Team.Name)
+        bouts.append((weight, e.Previous[0].Parent.Name, e.Wrestler.Name, e.Wrestler.Team.Name) +
+                     loser + (e.Result.Name, e.Result.Args, str(e.Result)))
+
+  return {'Name' : tournament.Name, 'Teams' : tournament.TeamNames, 'Weights' : tournament.Weights,
+          'Wrestlers' : wrestlers, 'Places' : places, 'Bouts' : bouts}
+
+class wnSeasonIndex(object):
+  '''The season index class holds what is known about the tournament files in a folder and its
+  subfolders. Lookups by wrestler use a table built when the index is read or updated.'''
+  def __init__(self, folder, filename=None):
+    self.folder = folder
+    if filename is None:
+      filename = os.path.join(folder, wnSettings.season_index_name)
+    self.filename = filename
+    self.files = {}
+    self.Read()
+
+  def Read(self):
+    '''Read the index file, if there is one.'''
+    self.files = {}
+    if os.path.exists(self.filename):
+      f = file(self.filename, 'rb')
+      try:
+        data = cPickle.loads(zlib.decompress(f.read()))
+      finally:
+        f.close()
+      # an index from another version is just built again
+      if data['Version'] == VERSION:
+        self.files = data['Files']
+    self.buildTables()
+
+  def Save(self):
+    '''Write the index file beside the old one and move it over it.'''
+    data = zlib.compress(cPickle.dumps({'Version' : VERSION, 'Files' : self.files}, 2))
+    f = file(self.filename + '.tmp', 'wb')
+    try:
+      f.write(data)
+    finally:
+      f.close()
+    wnStorage.ReplaceFile(self.filename + '.tmp', self.filename)
+
+  def Update(self):
+    '''Index the tournament files that are new or changed and forget those that are gone. Return the
+    number of files read and the number forgotten.'''
+    found = {}
+    read = 0
+    for fn, relative in wnConvert.FindFiles([self.folder]):
+      st = os.stat(fn)
+      stamp = (st.st_mtime, st.st_size)
+      found[relative] = True
+      info = self.files.get(relative)
+      if info is not None and info['Stamp'] == stamp:
+        continue
+
+      try:
+        info = Describe(wnStorage.Load(fn))
+      except Exception, e:
+        # remember files that cannot be read so they are not tried again until they change
+        info = {'Error' : '%s: %s' % (e.__class__.__name__, e)}
+      info['Stamp'] = stamp
+      self.files[relative] = info
+      read += 1
+
+    gone = [name for name in self.files if not found.has_key(name)]
+    for name in gone:
+      del self.files[name]
+    self.buildTables()
+    return read, len(gone)
+
+  def buildTables(self):
+    '''Make the table of bouts and places by wrestler name.'''
+    self.records = {}
+    self.places = {}
+    for fn, info in self.files.items():
+      if info.has_key('Error'):
+        continue
+      for bout in info['Bouts']:
+        self.records.setdefault(bout[2], []).append((fn, bout))
+        if bout[4] is not None:
+          self.records.setdefault(bout[4], []).append((fn, bout))
+      for weight, place, name, team in info['Places']:
+        self.places.setdefault(name, []).append((fn, weight, place, team))
+
+  def GetRecord(self, wrestler, team=None):
+    '''Get the season record of a wrestler, optionally only while on the given team. Return the
+    number of wins, the number of losses, and a list of (file, tournament, weight, round, won,
+    opponent, opponent team, result text) tuples. Byes are listed but not counted as wins.'''
+    wins = 0
+    losses = 0
+    bouts = []
+    for fn, bout in self.records.get(wrestler, []):
+      weight, round, winner, winner_team, loser, loser_team, type, args, text = bout
+      won = winner == wrestler and (team is None or winner_team == team)
+      lost = loser == wrestler and (team is None or loser_team == team)
+      if won:
+        if loser is not None:
+          wins += 1
+        bouts.append((fn, self.files[fn]['Name'], weight, round, True, loser, loser_team, text))
+      elif lost:
+        losses += 1
+        bouts.append((fn, self.files[fn]['Name'], weight, round, False, winner, winner_team, text))
+    bouts.sort()
+    return wins, losses, bouts
+
+  def GetPlaces(self, wrestler, team=None):
+    '''Get the places a wrestler won. Return a list of (file, tournament, weight, place) tuples.'''
+    places = [(fn, self.files[fn]['Name'], weight, place)
+              for fn, weight, place, t in self.places.get(wrestler, [])
+              if team is None or t == team]
+    places.sort()
+    return places
+
+  def GetPins(self, max_time=None):
+    '''Get the pins of the season, fastest first, or only those no longer than the given time in
+    seconds. Return a list of (pin time, wrestler, team, file, tournament, weight, round) tuples.'''
+    pins = []
+    for fn, info in self.files.items():
+      for bout in info.get('Bouts', []):
+        weight, round, winner, team, loser, loser_team, type, args, text = bout
+        if type == 'Pin' and (max_time is None or args <= max_time):
+          pins.append((args, winner, team, fn, info['Name'], weight, round))
+    pins.sort()
+    return pins
+
+  def GetErrors(self):
+    '''Get the files that could not be indexed. Return a list of (file, error) pairs.'''
+    errors = [(fn, info['Error']) for fn, info in self.files.items() if info.has_key('Error')]
+    errors.sort()
+    return errors
+
+  def GetWrestlers(self):
+    '''Get the names of all the wrestlers in the season.'''
+    names = {}
+    for info in self.files.values():
+      for name, team, weight in info.get('Wrestlers', []):
+        names[name] = True
+    names = names.keys()
+    names.sort()
+    return names
+
+  Errors = property(fget=GetErrors)
+  Wrestlers = property(fget=GetWrestlers)
+
+def main(args):
+  parser = optparse.OptionParser(usage='%prog [options] folder [wrestler ...]',
+                                 description='Index the tournament files in a folder and print the '
+                                 'season record of the given wrestlers.')
+  parser.add_option('-t', '--team', dest='team', default=None,
+                    help='only count bouts wrestled for this team')
+  parser.add_option('-p', '--pins', dest='pins', type='int', default=None,
+                    help='list the pins no longer than this many seconds')
+  options, args = parser.parse_args(args)
+  if args == []:
+    parser.error('no folder given')
+
+  index = wnSeasonIndex(args[0])
+  read, gone = index.Update()
+  index.Save()
+  print '%d files read, %d removed, %d indexed' % (read, gone, len(index.files))
+  for fn, error in index.Errors:
+    print '%s: %s' % (fn, error)
+
+  for name in args[1:]:
+    wins, losses, bouts = index.GetRecord(name, options.team)
+    print
+    print '%s: %d-%d' % (name, wins, losses)
+    for fn, tourn, weight, round, won, opponent, team, text in bouts:
+      print '  %-30s %-6s %-12s %s %s (%s) %s' % (tourn, weight, round, ['L', 'W'][won], opponent,
+                                                  team, text)
+    for fn, tourn, weight, place in index.GetPlaces(name, options.team):
+      print '  %-30s %-6s place %d' % (tourn, weight, place)
+
+  if options.pins is not None:
+    print
+    for pin in index.GetPins(options.pins):
+      print '%-6s %-25s %-20s %-30s %s' % (str(wnResultPin(pin[0])),
+                                           pin[1], pin[2], pin[4], pin[5])
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,330 @@
+'''
+The array data module defines a flat copy of a built tournament. Every weight class is stored as
+parallel lists indexed by entry, so calculations over a whole tournament can run without walking the
+bracket object graph. NumPy is optional. When it is installed, the team scores for all weight classes
+are computed in one vectorized pass.
+'''
+try:
+  import numpy
+except ImportError:
+  numpy = None
+
+# codes stored for the result in each entry
+RESULT_NONE = 0
+RESULT_BYE = 1
+RESULT_DECISION = 2
+RESULT_PIN = 3
+RESULT_DEFAULT = 4
+result_codes = {'Bye' : RESULT_BYE, 'Decision' : RESULT_DECISION, 'Pin' : RESULT_PIN,
+                'Default' : RESULT_DEFAULT}
+
+def getNumber(n):
+  '''Get an entry number from a topology table, where a missing link is None.'''
+  if n is None:
+    return -1
+  return n
+
+class wnWeightArrays(object):
+  '''The weight arrays class holds the topology and the current state of one weight class. Entries
+  are numbered round by round in layout order. Links to other entries hold an entry number or -1.
+  The links are copied from the compiled topology of the layout when one is given, instead of being
+  worked out from the entries.'''
+  def __init__(self, weight, team_index, topology=None):
+    self.Name = weight.Name
+    self.RoundNames = list(weight.Rounds)
+
+    # number all the entries first so links can be stored as numbers
+    entries = []
+    for r in self.RoundNames:
+      entries += weight.GetRound(r).entries
+    number = dict([(entries[i], i) for i in range(len(entries))])
+
+    # topology
+    self.ids = []
+    self.round = []
+    self.next_win = []
+    self.next_lose = []
+    self.previous = []
+    self.is_origin = []
+    self.adv_points = []
+    self.place_points = []
+
+    # state
+    self.wrestler = []
+    self.wrestler_team = []
+    self.wrestler_scoring = []
+    self.team = []
+    self.is_scoring = []
+    self.result_code = []
+    self.result_points = []
+
+    # weights built before the layout was compiled are walked instead
+    copied = topology is not None and len(topology) == len(entries)
+    if copied:
+      self.copyTopology(topology)
+
+    wrestlers = {}
+    for e in entries:
+      round = e.Parent
+      self.ids.append(e.ID)
+      if not copied:
+        self.round.append(self.RoundNames.index(round.Name))
+        self.next_win.append(number.get(e.NextWin, -1))
+        self.next_lose.append(number.get(e.NextLose, -1))
+        self.previous.append([number[p] for p in e.Previous])
+        self.is_origin.append(int(e.Previous == [] and round.next_win is not None))
+        self.adv_points.append(round.RoundPoints.AdvPoints)
+        self.place_points.append(round.RoundPoints.PlacePoints)
+
+      # wrestlers are the same if they have the same name and team
+      w = e.Wrestler
+      if w is None:
+        self.wrestler.append(-1)
+        self.team.append(-1)
+      else:
+        key = (w.Name, w.Team)
+        if not wrestlers.has_key(key):
+          wrestlers[key] = len(wrestlers)
+          self.wrestler_team.append(team_index.get(w.Team.Name, -1))
+          self.wrestler_scoring.append(w.IsScoring)
+        self.wrestler.append(wrestlers[key])
+        self.team.append(team_index.get(w.Team.Name, -1))
+      self.is_scoring.append(int(e.is_scoring))
+
+      if e.Result is None:
+        self.result_code.append(RESULT_NONE)
+        self.result_points.append(0.0)
+      else:
+        self.result_code.append(result_codes.get(e.Result.Name, RESULT_NONE))
+        self.result_points.append(float(e.Result.Points))
+
+  def __len__(self):
+    return len(self.ids)
+
+  def copyTopology(self, topology):
+    '''Fill the topology lists from the table of a compiled layout.'''
+    rounds = topology.Rounds
+    self.round = list(topology.RoundOf)
+    self.next_win = [getNumber(n) for n in topology.NextWin]
+    self.next_lose = [getNumber(n) for n in topology.NextLose]
+    self.previous = [list(p) for p in topology.Previous]
+    self.is_origin = [int(p == () and rounds[r][5] is not None)
+                      for p, r in zip(topology.Previous, topology.RoundOf)]
+    self.adv_points = [rounds[r][1].AdvPoints for r in topology.RoundOf]
+    self.place_points = [rounds[r][1].PlacePoints for r in topology.RoundOf]
+
+  def GetOrder(self):
+    '''Get the entry numbers sorted so that every entry comes after the entries that can fill it.
+    An entry is filled by the winner from its previous entries, or by a loser of the bout decided
+    in the next win entry of the entry pointing to it with its next lose link.'''
+    n = len(self)
+    after = [[] for i in range(n)]
+    count = [0] * n
+    for x in range(n):
+      for p in self.previous[x]:
+        after[p].append(x)
+        count[x] += 1
+        t = self.next_lose[p]
+        if t >= 0:
+          after[x].append(t)
+          count[t] += 1
+
+    order = [i for i in range(n) if count[i] == 0]
+    for i in order:
+      for x in after[i]:
+        count[x] -= 1
+        if count[x] == 0:
+          order.append(x)
+    return order
+
+  def GetFutureBouts(self):
+    '''Get the bouts that have yet to be decided in the order they can happen. Return a list of
+    (entry, participants) pairs, where the participants are the previous entries that will hold a
+    wrestler when the bout in the entry is decided. One participant means a bye.
+
+    Which entries get filled does not depend on who wins, since both wrestlers in a bout come from
+    entries that send their loser to the same entry in every layout.'''
+    filled = [w >= 0 for w in self.wrestler]
+    bouts = []
+    for x in self.GetOrder():
+      if filled[x] or self.previous[x] == []: continue
+
+      participants = [p for p in self.previous[x] if filled[p]]
+      if participants == []: continue
+      bouts.append((x, participants))
+      filled[x] = True
+
+      # the loser drops to the next lose entry if there is one
+      if len(participants) > 1:
+        t = self.next_lose[participants[0]]
+        if t >= 0:
+          filled[t] = True
+    return bouts
+
+  def GetThreadState(self):
+    '''Get the state of the thread reaching each entry that holds a wrestler. Return two lists
+    indexed by entry. The first tells if the thread counts toward the team score. The second holds
+    the bye points waiting for a real match to follow them.'''
+    n = len(self)
+    counts = [False] * n
+    pending = [0.0] * n
+    w = self.wrestler
+    for e in self.GetOrder():
+      if w[e] < 0: continue
+
+      # continue the thread from the previous entry held by the same wrestler
+      if self.previous[e] == []:
+        counts[e] = bool(self.is_origin[e])
+      else:
+        for p in self.previous[e]:
+          if w[p] == w[e]:
+            counts[e] = counts[p]
+            pending[e] = pending[p]
+            break
+
+      code = self.result_code[e]
+      if self.is_scoring[e] and code != RESULT_NONE:
+        if code == RESULT_BYE:
+          pending[e] += self.result_points[e] + self.adv_points[e] + self.place_points[e]
+        else:
+          pending[e] = 0.0
+    return counts, pending
+
+  def CalcScores(self, num_teams):
+    '''Compute the points for each team in this weight class without NumPy. Return a list indexed
+    by team number.'''
+    scores = [0.0] * num_teams
+    w = self.wrestler
+
+    for i in range(len(self)):
+      if not self.is_origin[i] or w[i] < 0: continue
+
+      # follow the thread while the same wrestler holds the next win entry
+      bye_score = 0.0
+      thread_score = 0.0
+      e = i
+      while True:
+        code = self.result_code[e]
+        if self.is_scoring[e] and code != RESULT_NONE:
+          points = self.result_points[e] + self.adv_points[e] + self.place_points[e]
+          if code != RESULT_BYE:
+            thread_score += bye_score + points
+            bye_score = 0.0
+          else:
+            bye_score += points
+
+        n = self.next_win[e]
+        if n < 0 or w[n] != w[i]: break
+        e = n
+
+      if self.team[i] >= 0:
+        scores[self.team[i]] += thread_score
+
+    return scores
+
+class wnTournamentArrays(object):
+  '''The tournament arrays class holds the arrays for every weight class in a tournament along with
+  the team names and point adjustments.'''
+  def __init__(self, tournament):
+    self.Name = tournament.Name
+    self.Teams = tournament.TeamNames
+    self.Weights = tournament.Weights
+    self.point_adjust = [tournament.Teams[t].PointAdjust for t in self.Teams]
+
+    team_index = dict([(self.Teams[i], i) for i in range(len(self.Teams))])
+    self.weights = [wnWeightArrays(tournament.GetWeightClass(w), team_index, tournament.topology)
+                    for w in self.Weights]
+
+  def CalcWeightScores(self):
+    '''Compute the points every team earned in every weight class. Return a dictionary of weight
+    names to lists of points indexed like the team names.'''
+    if numpy is None:
+      return dict([(wa.Name, wa.CalcScores(len(self.Teams))) for wa in self.weights])
+
+    table = self.calcScoresVectorized()
+    return dict([(self.Weights[i], list(table[i])) for i in range(len(self.Weights))])
+
+  def CalcScores(self):
+    '''Compute the total team scores from scratch. Return a table of score and team name pairs in
+    the same descending order as the tournament itself.'''
+    totals = list(self.point_adjust)
+    for points in self.CalcWeightScores().values():
+      for i in range(len(totals)):
+        totals[i] += points[i]
+
+    score_table = [(totals[i], self.Teams[i]) for i in range(len(self.Teams))]
+    score_table.sort()
+    score_table.reverse()
+    return score_table
+
+  def calcScoresVectorized(self):
+    '''Score all weight classes at once. Return an array of points with a row per weight class and
+    a column per team.'''
+    num_teams = len(self.Teams)
+    num_weights = len(self.weights)
+
+    # join the weights into one set of arrays, shifting links past the entries before them
+    offset = 0
+    next_win = []
+    weight = []
+    for i in range(num_weights):
+      wa = self.weights[i]
+      for e in wa.next_win:
+        if e >= 0: e += offset
+        next_win.append(e)
+      weight += [i] * len(wa)
+      offset += len(wa)
+    n = offset
+    if n == 0 or num_teams == 0:
+      return numpy.zeros((num_weights, num_teams))
+
+    def join(name, dtype):
+      values = []
+      for wa in self.weights:
+        values += getattr(wa, name)
+      return numpy.array(values, dtype=dtype)
+
+    # wrestler numbers are only unique within a weight, so pair them with the weight number
+    wrestler = join('wrestler', numpy.int64)
+    wrestler = numpy.where(wrestler >= 0, wrestler * num_weights + numpy.array(weight), -1)
+    next_win = numpy.array(next_win, dtype=numpy.int64)
+    weight = numpy.array(weight, dtype=numpy.int64)
+    team = join('team', numpy.int64)
+    is_origin = join('is_origin', bool)
+    is_scoring = join('is_scoring', bool)
+    code = join('result_code', numpy.int64)
+    points = join('result_points', float) + join('adv_points', float) + \
+             join('place_points', float)
+    index = numpy.arange(n)
+
+    # an entry continues a thread when the next win entry holds the same wrestler
+    has_next = next_win >= 0
+    cont = has_next & (wrestler >= 0)
+    cont[has_next] &= wrestler[next_win[has_next]] == wrestler[has_next]
+    pred = numpy.full(n, -1, dtype=numpy.int64)
+    pred[next_win[cont]] = index[cont]
+
+    # find the first entry and the depth of every entry in its thread by pointer doubling
+    root = numpy.where(pred >= 0, pred, index)
+    depth = (pred >= 0).astype(numpy.int64)
+    while True:
+      jump = root[root]
+      if (jump == root).all(): break
+      depth = depth + depth[root]
+      root = jump
+
+    # only threads started by a wrestler at an entry that can start a thread are counted
+    counted = is_origin[root] & (wrestler[root] >= 0) & (team[root] >= 0)
+    scoring = counted & is_scoring & (code != RESULT_NONE)
+    real = scoring & (code != RESULT_BYE)
+    bye = scoring & (code == RESULT_BYE)
+
+    # bye points only count when a real match follows them in the thread
+    last_real = numpy.full(n, -1, dtype=numpy.int64)
+    numpy.maximum.at(last_real, root[real], depth[real])
+    earned = real | (bye & (depth < last_real[root]))
+
+    # add up the points by weight and team of the wrestler starting the thread
+    key = weight[earned] * num_teams + team[root[earned]]
+    table = numpy.bincount(key, weights=points[earned], minlength=num_weights * num_teams)
+    return table.reshape((num_weights, num_teams))
@@ -0,0 +1,125 @@
+'''
+The autosave module saves tournaments without holding up the user interface. A save takes the plain
+data sections of the tournament on the calling thread, which is quick and gives a copy that later
+changes cannot touch. Pickling, compressing, and writing the copy to disk happen on a worker thread.
+The autosaver also listens to the tournament so it can skip saves when nothing has changed. A save
+only counts once the worker has written it, so a save that fails leaves the tournament modified.
+Autosaves write a copy beside the tournament file instead of the file itself, so changes the user
+decides not to keep never reach it. Backups to a backup store are written on the same thread.
+'''
+import os
+import Queue
+import threading
+
+from wnEvents import wnTournamentEventReceivable
+import wnSettings
+import wnStorage
+
+def GetAutosaveName(filename):
+  '''Get the name of the copy autosaved beside a tournament file.'''
+  return filename + wnSettings.autosave_extension
+
+def Exists(filename):
+  '''Tell if an autosaved copy was left behind for a tournament file.'''
+  return os.path.exists(GetAutosaveName(filename))
+
+def Remove(filename):
+  '''Remove the autosaved copy of a tournament file, if there is one.'''
+  if Exists(filename):
+    os.remove(GetAutosaveName(filename))
+
+class wnAutosaver(wnTournamentEventReceivable):
+  '''The autosaver class writes snapshots of a tournament to disk on a worker thread. Changes are
+  counted as they are made and a snapshot is only taken by Autosave when the count has moved since
+  the last one.'''
+  def __init__(self, tournament):
+    self.tournament = tournament
+    self.changes = 0
+    self.saved = 0
+    self.copied = 0
+    self.error = None
+    self.queue = Queue.Queue()
+    self.worker = threading.Thread(target=self.run)
+    self.worker.setDaemon(True)
+    self.worker.start()
+    tournament.AddListener(self)
+
+  def Save(self, filename):
+    '''Take a snapshot of the tournament now and write it to the given file in the background. The
+    tournament counts as saved once the file is written.'''
+    self.queue.put((wnStorage.SaveSections, wnStorage.GetSections(self.tournament), filename,
+                    self.changes))
+
+  def Write(self, filename):
+    '''Write a snapshot of the tournament to the given file in the background without counting it
+    as a save, as for a backup copy.'''
+    self.queue.put((wnStorage.SaveSections, wnStorage.GetSections(self.tournament), filename, None))
+
+  def Backup(self, store, label=None):
+    '''Add a backup of the tournament to a backup store in the background.'''
+    self.queue.put((store.Store, wnStorage.GetSections(self.tournament), label, None))
+
+  def Autosave(self, filename):
+    '''Write a copy of the tournament beside the given file in the background if it changed since
+    it was last saved or copied. Return True if a copy was started.'''
+    if not self.IsModified() or self.changes == self.copied:
+      return False
+    self.copied = self.changes
+    self.Write(GetAutosaveName(filename))
+    return True
+
+  def Wait(self):
+    '''Wait for the saves started so far to reach the disk. Raise the error of the last save that
+    failed, if any.'''
+    self.queue.join()
+    error, self.error = self.error, None
+    if error is not None:
+      raise error
+
+  def Close(self):
+    '''Finish the saves started so far and stop the worker thread.'''
+    self.tournament.RemoveListener(self)
+    self.queue.put(None)
+    self.worker.join()
+
+  def IsModified(self):
+    '''Tell if the tournament changed since the last save.'''
+    return self.changes != self.saved
+
+  def SetModified(self):
+    '''Count the tournament as changed, as when it holds changes its file does not.'''
+    self.changes += 1
+
+  def SetSaved(self):
+    '''Count the tournament as saved, as when its changes are written some other way.'''
+    self.saved = self.changes
+
+  def run(self):
+    '''Write the queued snapshots until told to stop.'''
+    while True:
+      job = self.queue.get()
+      try:
+        if job is None:
+          return
+        func, sections, arg, changes = job
+        try:
+          func(sections, arg)
+          if changes is not None:
+            self.saved = changes
+        except EnvironmentError, e:
+          self.error = e
+          self.copied = None
+      finally:
+        self.queue.task_done()
+
+  def OnEntryChange(self, entry):
+    self.changes += 1
+
+  def OnTeamChange(self, team, old_name):
+    self.changes += 1
+
+  def OnWrestlerChange(self, wrestler, old_name):
+    self.changes += 1
+
+  def OnWeightChange(self, weight):
+    self.changes += 1
@@ -0,0 +1,180 @@
+'''
+The backup module keeps many backups of a tournament in one folder without storing the same data
+twice. A tournament is split into chunks: the header, the team table, the wrestler table, the
+result table, and the entries of each weight class. Each chunk is compressed and stored under the
+SHA-1 hash of its contents, so a chunk that did not change since the last backup is not written
+again. A small manifest file per backup lists the chunks that make it up. The wrestlers in a weight
+chunk are numbered in the order they appear in its bracket, and the manifest maps those numbers to
+the wrestler table, so a change to the roster does not touch the chunks of other weights. A backup
+taken after a round only adds the weights and tables touched in that round, and restoring any backup
+reads just its manifest and chunks.
+
+usage: python wnBackup.py folder                       list the backups in a folder
+       python wnBackup.py folder backup file.wnd       restore a backup to a tournament file
+'''
+import cPickle
+import hashlib
+import os
+import sys
+import time
+import zlib
+
+import wnSettings
+import wnStorage
+
+class wnBackupStore(object):
+  '''The backup store class takes and restores backups in a folder. Manifests are kept in the folder
+  itself and chunks in a subfolder named after the first two digits of their hash.'''
+  def __init__(self, folder):
+    self.folder = folder
+    self.chunks = os.path.join(folder, 'chunks')
+
+  def Backup(self, tournament, label=None):
+    '''Take a backup of a tournament. Return the name of the new backup.'''
+    return self.Store(wnStorage.GetSections(tournament), label)
+
+  def Store(self, sections, label=None):
+    '''Take a backup of the plain data sections of a tournament, as from the storage module. Return
+    the name of the new backup.'''
+    header, people = sections[:2]
+
+    # keep the results apart from the wrestlers, they change much more often
+    wrestlers = [w[:4] for w in people['Wrestlers']]
+    results = [w[4] for w in people['Wrestlers']]
+
+    # the wrestler numbers of a weight are kept out of its chunk, they change with the whole roster
+    weights = []
+    numbers = []
+    for s in sections[2:]:
+      s, order = self.numberWeight(s)
+      weights.append(self.putChunk(s))
+      numbers.append(order)
+    chunks = {'Header' : self.putChunk(header), 'Teams' : self.putChunk(people['Teams']),
+              'Wrestlers' : self.putChunk(wrestlers), 'Results' : self.putChunk(results),
+              'Weights' : weights, 'Weight Wrestlers' : numbers}
+
+    # name backups by the time they were taken
+    now = time.time()
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(now))
+    name = stamp
+    i = 1
+    while os.path.exists(self.getManifestName(name)):
+      i += 1
+      name = '%s-%d' % (stamp, i)
+    manifest = {'Name' : header['Name'], 'Time' : now, 'Label' : label, 'Chunks' : chunks}
+    self.writeFile(self.getManifestName(name), zlib.compress(cPickle.dumps(manifest, 2)))
+    return name
+
+  def Restore(self, name):
+    '''Restore the tournament saved in a backup.'''
+    return wnStorage.BuildTournament(self.GetSections(name))
+
+  def GetSections(self, name):
+    '''Get the plain data sections of the tournament saved in a backup.'''
+    chunks = self.readManifest(name)['Chunks']
+    wrestlers = [w + (r,) for w, r in zip(self.getChunk(chunks['Wrestlers']),
+                                          self.getChunk(chunks['Results']))]
+    people = {'Teams' : self.getChunk(chunks['Teams']), 'Wrestlers' : wrestlers}
+    weights = [self.getChunk(key) for key in chunks['Weights']]
+
+    # older backups number the wrestlers of every weight in the wrestler table
+    if chunks.has_key('Weight Wrestlers'):
+      weights = [self.unnumberWeight(s, order)
+                 for s, order in zip(weights, chunks['Weight Wrestlers'])]
+    return [self.getChunk(chunks['Header']), people] + weights
+
+  def GetBackups(self):
+    '''Get the backups in the folder, oldest first. Return a list of (name, tournament name, time
+    taken, label) tuples.'''
+    if not os.path.isdir(self.folder):
+      return []
+    backups = []
+    for fn in os.listdir(self.folder):
+      name, ext = os.path.splitext(fn)
+      if ext == wnSettings.backup_extension:
+        manifest = self.readManifest(name)
+        backups.append((manifest['Time'], name, manifest['Name'], manifest['Label']))
+    backups.sort()
+    return [(name, tourn, when, label) for when, name, tourn, label in backups]
+
+  def numberWeight(self, section):
+    '''Number the wrestlers of a weight section in the order they first appear in its entries.
+    Return the section with the new numbers and the wrestler table numbers in that order.'''
+    order = []
+    local = {}
+    entries = []
+    for r, name, w, result, is_scoring in section['Entries']:
+      if w >= 0:
+        if not local.has_key(w):
+          local[w] = len(order)
+          order.append(w)
+        w = local[w]
+      entries.append((r, name, w, result, is_scoring))
+    return {'Name' : section['Name'], 'Entries' : entries}, order
+
+  def unnumberWeight(self, section, order):
+    '''Give the wrestlers of a weight section their numbers in the wrestler table again.'''
+    entries = []
+    for r, name, w, result, is_scoring in section['Entries']:
+      if w >= 0:
+        w = order[w]
+      entries.append((r, name, w, result, is_scoring))
+    return {'Name' : section['Name'], 'Entries' : entries}
+
+  def getManifestName(self, name):
+    return os.path.join(self.folder, name + wnSettings.backup_extension)
+
+  def getChunkName(self, key):
+    return os.path.join(self.chunks, key[:2], key[2:])
+
+  def readManifest(self, name):
+    return cPickle.loads(zlib.decompress(self.readFile(self.getManifestName(name))))
+
+  def putChunk(self, data):
+    '''Store a chunk unless the store already has it. Return its hash.'''
+    data = cPickle.dumps(data, 2)
+    key = hashlib.sha1(data).hexdigest()
+    fn = self.getChunkName(key)
+    if not os.path.exists(fn):
+      folder = os.path.dirname(fn)
+      if not os.path.isdir(folder):
+        os.makedirs(folder)
+      self.writeFile(fn, zlib.compress(data))
+    return key
+
+  def getChunk(self, key):
+    return cPickle.loads(zlib.decompress(self.readFile(self.getChunkName(key))))
+
+  def readFile(self, fn):
+    f = file(fn, 'rb')
+    try:
+      return f.read()
+    finally:
+      f.close()
+
+  def writeFile(self, fn, data):
+    '''Write a file beside its final name and move it there, so a crash never leaves half of one.'''
+    if not os.path.isdir(self.folder):
+      os.makedirs(self.folder)
+    f = file(fn + '.tmp', 'wb')
+    try:
+      f.write(data)
+    finally:
+      f.close()
+    wnStorage.ReplaceFile(fn + '.tmp', fn)
+
+  Backups = property(fget=GetBackups)
+
+def main(args):
+  if len(args) == 1:
+    for name, tourn, when, label in wnBackupStore(args[0]).Backups:
+      print '%-20s %-30s %s' % (name, tourn, label or '')
+  elif len(args) == 3:
+    wnStorage.Save(wnBackupStore(args[0]).Restore(args[1]), args[2])
+  else:
+    print __doc__[__doc__.index('usage'):].rstrip()
+    return 1
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -8,7 +8,8 @@ from wnEvents import wnMouseEventReceivable, wnFocusEventReceivable, wnMatchMenu
 from wnScoreData import *
 from wnTeamData import *
 from wnTempData import *
-import wnSettings
+from wnScoring import wnScoreEngine, wnLeaderboard, wnScoreLog, wnFallStandings
+from wnArrayData import wnTournamentArrays
 
 # TODO: switch all calculations to a type of renderer (score, bouts, fast fall)
 
@@ -37,6 +38,101 @@ class wnTournament(wnNode):
     self.seeds = seeds
     self.teams = {}
     self.weight_classes = {}
+    self.bout_count = 0
+    self.ready_count = 0
+    self.round_bouts = {}
+    self.round_ready = {}
+    self.loader = None
+    self.topology = None
+    self.batch_depth = 0
+    self.listeners = []
+    self.engine = wnScoreEngine(self)
+    self.leaderboard = wnLeaderboard(self)
+    self.score_log = wnScoreLog(self)
+    self.falls = wnFallStandings(self)
+    self.AddListener(self.engine)
+    self.AddListener(self.leaderboard)
+    self.AddListener(self.score_log)
+    self.AddListener(self.falls)
+    
+  def __getstate__(self):
+    '''Leave the listeners and the cached scoring state out of the pickle. They are rebuilt when
+    the tournament is loaded.'''
+    self.LoadWeights()
+    state = self.__dict__.copy()
+    del state['loader']
+    del state['topology']
+    del state['listeners']
+    del state['engine']
+    del state['leaderboard']
+    del state['score_log']
+    del state['falls']
+    return state
+    
+  def __setstate__(self, state):
+    '''Restore a pickled tournament and rebuild its cached state, including for tournaments saved by
+    older versions.'''
+    self.loader = None
+    self.topology = None
+    self.batch_depth = 0
+    self.__dict__.update(state)
+    self.Reindex()
+    
+  def Reindex(self):
+    '''Rebuild the listeners and all cached scoring state from the bracket data.'''
+    self.listeners = []
+    
+    # recount the pins of every wrestler, including those only left in the brackets
+    for t in self.teams.values():
+      t.tournament = self
+      for w in t.Wrestlers:
+        w.CountFalls()
+    for wc in self.weight_classes.values():
+      for r in wc.Rounds:
+        for e in wc.GetRound(r).Entries:
+          if e.Wrestler is not None:
+            e.Wrestler.CountFalls()
+            
+    self.engine = wnScoreEngine(self)
+    self.leaderboard = wnLeaderboard(self)
+    self.score_log = wnScoreLog(self)
+    self.falls = wnFallStandings(self)
+    self.AddListener(self.engine)
+    self.AddListener(self.leaderboard)
+    self.AddListener(self.score_log)
+    self.AddListener(self.falls)
+    for wc in self.weight_classes.values():
+      wc.BuildThreadIndex()
+    self.engine.Reset()
+    self.RecountBouts()
+    
+  def AddListener(self, obj):
+    '''Register an object to receive change notifications from this tournament.'''
+    self.listeners.append(obj)
+    
+  def RemoveListener(self, obj):
+    try:
+      self.listeners.remove(obj)
+    except ValueError:
+      pass
+    
+  def Notify(self, name, *args):
+    '''Tell all listeners about a change by calling the named method on each of them.'''
+    for obj in self.listeners:
+      getattr(obj, name)(*args)
+      
+  def BeginChanges(self):
+    '''Start a batch of changes listeners should take as one, like all the entries a result
+    changes. Batches can be nested, and listeners are only told about the outermost one.'''
+    self.batch_depth += 1
+    if self.batch_depth == 1:
+      self.Notify('OnBeginChanges')
+      
+  def EndChanges(self):
+    '''End a batch of changes started with BeginChanges.'''
+    self.batch_depth -= 1
+    if self.batch_depth == 0:
+      self.Notify('OnEndChanges')
         
   def NewWeightClass(self, name):
     wc = wnWeightClass(name, self)
@@ -44,73 +140,165 @@ class wnTournament(wnNode):
     
     return wc
   
+  def GetTopology(self):
+    '''Get the compiled layout the weight classes are built from.'''
+    if self.topology is None:
+      # tournaments pickled by older versions only have their brackets to go on
+      import wnBuilder, wnStorage
+      layout = wnStorage.GetLayout(self.GetWeightClass(self.Weights[0]), self.seeds)
+      self.topology = wnBuilder.wnConfig(data=layout).Topology
+    return self.topology
+    
+  def AddWeightClass(self, name):
+    '''Add an empty weight class with the same brackets as the others, as when a weight is added
+    during an event. Every team starts with no points in it.'''
+    if name in self.Weights:
+      raise ValueError('There is already a weight class named %s.' % name)
+    wc = self.GetTopology().CreateWeight(self, name)
+    for t in self.teams.values():
+      t.points.setdefault(name, 0.0)
+    wc.RecountBouts()
+    self.Notify('OnWeightChange', wc)
+    return wc
+    
   def NewTeam(self, name):
     t = wnTeam(name, self)
     self.teams[name] = t
+    self.Notify('OnScoreChange', name, None, t.Score)
+    self.Notify('OnTeamChange', t, None)
     
     return t
   
   def DeleteTeam(self, name):
     try:
-      del self.teams[name]
+      t = self.teams.pop(name)
     except:
-      pass
+      return
+    self.Notify('OnScoreChange', name, t.Score, None)
+    for w in t.Wrestlers:
+      self.Notify('OnFallChange', w)
+    self.Notify('OnTeamChange', t, name)
     
   def ChangeTeam(self, old_name, new_name):
     t = self.teams[old_name]
     del self.teams[old_name]
     t.Name = new_name
     self.teams[new_name] = t
+    self.Notify('OnScoreChange', old_name, t.Score, None)
+    self.Notify('OnScoreChange', new_name, None, t.Score)
+    self.Notify('OnTeamChange', t, old_name)
  
   def GetWeightClass(self, name):
-    return self.weight_classes.get(name)
+    '''Get a weight class by name. A weight class that has not been read from the file yet is
+    loaded first.'''
+    wc = self.weight_classes.get(name)
+    if wc is None and self.loader is not None and self.loader.HasWeight(name):
+      wc = self.loadWeight(name)
+    return wc
+  
+  def LoadWeights(self):
+    '''Load every weight class that has not been read from the file yet.'''
+    if self.loader is not None:
+      for name in self.loader.Weights:
+        self.GetWeightClass(name)
+  
+  def loadWeight(self, name):
+    '''Build a weight class from the file and bring the cached scoring state up to date with it.'''
+    wc = self.loader.LoadWeight(self, name)
+    if self.loader.Weights == []:
+      self.loader = None
+      
+    for r in wc.Rounds:
+      for e in wc.GetRound(r).entries:
+        if e.Wrestler is not None:
+          e.Wrestler.CountFalls()
+    self.engine.RescoreWeight(wc)
+    wc.RecountBouts()
+    return wc
   
   def Paint(self, painter, weight, refresh_labels):
     '''Draw the specified weight class to the screen. Pass the provided painter object to the
-    weight class being drawn. Draw the seed numbers in the given order first.
+    weight class being drawn, along with the bracket geometry every weight shares. Return the size
+    of the drawing.
     '''
     
     #make sure the weight exists first
-    try:
-      wc = self.weight_classes[weight]
-    except:
+    wc = self.GetWeightClass(weight)
+    if wc is None:
       return
       
-    result = wc.Paint(painter, (0, wnSettings.seed_start), wnSettings.initial_step, refresh_labels)    
-      
-    return result
+    return wc.Paint(painter, self.GetTopology().Geometry, refresh_labels)
   
   def CalcScores(self, weight=None):
-    '''Calculate all the scores across this tournament.'''
-    # try to get the weight class that should be updated
-    wc = self.weight_classes.get(weight)
+    '''Get the team scores across this tournament. The score engine keeps the team totals current
+    as results change, so a weight class is only rescored from scratch when one is given.'''
+    # try to get the weight class that should be rescored
+    wc = self.GetWeightClass(weight)
     
     if wc is not None:
-      # tell the current weight class to compute its scores
-      scores = wc.CalcScores()
-      for t in self.teams.keys():
-        self.teams[t].SetWeightScore(weight, scores.get(t) or 0.0)
+      self.engine.RescoreWeight(wc)
 
-    # compute the total scores
-    score_table = []
-    for t in self.teams.keys():      
-      score_table.append((self.teams[t].Score, t))
-    
-    # return for display in descending order
-    score_table.sort()
-    score_table.reverse()
-    return score_table
-  
-  def CalcFastFall(self):
-    '''Compute the fast fall results over all teams and their wrestlers.'''
-    results = []
-    for t in self.teams.values():
-      results += t.CalcFastFall()
-      
-    # the fast fall objects know how to sort by pin and time
-    results.sort()
-    
-    return results
+    # the leaderboard already holds the scores in descending order
+    return self.leaderboard.GetTable()
+  
+  def GetTopTeams(self, n):
+    '''Get the n highest scoring teams as (score, team name) pairs.'''
+    return self.leaderboard.GetTop(n)
+  
+  def GetTeamRank(self, name):
+    '''Get the rank of a team. Teams with the same score share a rank.'''
+    return self.leaderboard.GetRank(name)
+  
+  def GetTiedTeams(self, name):
+    '''Get the names of the teams with the same score as the given team, including it.'''
+    return self.leaderboard.GetTied(name)
+  
+  def GetTieGroups(self):
+    '''Get the groups of teams that share a score, highest score first.'''
+    return self.leaderboard.GetTieGroups()
+  
+  def GetLedger(self, wrestler):
+    '''Get the ledger entries of a wrestler from the earliest to the latest round.'''
+    return self.engine.GetLedger(wrestler)
+  
+  def GetWrestlerPoints(self, wrestler):
+    '''Get the points a wrestler has earned for the team.'''
+    return self.engine.GetWrestlerPoints(wrestler)
+  
+  def GetScoreChanges(self, since):
+    '''Get the changes to the score table after the given version. Return the current version and
+    a list of (team, old score, new score, old rank, new rank) for the teams whose row changed. The
+    list is None when the whole table must be reloaded instead.'''
+    return self.score_log.Version, self.score_log.GetChanges(since)
+  
+  def GetScoreVersion(self):
+    return self.score_log.Version
+  
+  def VerifyScores(self):
+    '''Recompute the points of every team in every weight class from scratch using a flat array
+    copy of the tournament. Return a list of (weight, team, cached points, computed points) for
+    every cached score that does not match.'''
+    arrays = wnTournamentArrays(self)
+    computed = arrays.CalcWeightScores()
+    
+    mismatches = []
+    for w in arrays.Weights:
+      for i in range(len(arrays.Teams)):
+        t = arrays.Teams[i]
+        cached = self.teams[t].points.get(w, 0.0)
+        if cached != computed[w][i]:
+          mismatches.append((w, t, cached, computed[w][i]))
+          
+    return mismatches
+  
+  def CalcFastFall(self, n=None):
+    '''Get the fast fall results for the first n wrestlers, or all of them, from most pins to
+    least and then from least time to most.'''
+    return self.falls.GetTable(n)
+  
+  def GetFastFallLeader(self):
+    '''Get the fast fall result of the leader, or None if nobody has a pin yet.'''
+    return self.falls.GetLeader()
   
   def GetBouts(self, weights, rounds):
     '''Return a list of all the bouts for the given weights and rounds.'''
@@ -118,9 +306,8 @@ class wnTournament(wnNode):
     
     # ask each weight class to compute the bouts for its rounds
     for w in weights:
-      try:
-        wc = self.weight_classes[w]
-      except:
+      wc = self.GetWeightClass(w)
+      if wc is None:
         continue
       bouts += wc.GetBouts(rounds)
       
@@ -132,25 +319,51 @@ class wnTournament(wnNode):
     
     # ask each weight class to compute its placewinners
     for w in weights:
-      try:
-        wc = self.weight_classes[w]
-      except:
+      wc = self.GetWeightClass(w)
+      if wc is None:
         continue
       places.append(wc.GetPlaceWinners())
       
     return places
     
-  def CountBouts(self):
-    '''Get a count of the total number of bouts.'''
-    i = 0
-    for w in self.weight_classes.values():
-      i += w.CountBouts()
-      
-    return i
+  def CountBouts(self, round=None):
+    '''Get a count of the contested bouts, not counting byes, in the whole tournament or in the
+    named round of every weight class.'''
+    self.LoadWeights()
+    if round is None:
+      return self.bout_count
+    return self.round_bouts.get(round, 0)
+  
+  def CountRemainingBouts(self, round=None):
+    '''Get a count of the bouts that are ready to be wrestled, in the whole tournament or in the
+    named round of every weight class.'''
+    self.LoadWeights()
+    if round is None:
+      return self.ready_count
+    return self.round_ready.get(round, 0)
+  
+  def AddBoutCounts(self, round, bouts, ready):
+    '''Add to the counts of contested and ready bouts for a round.'''
+    self.bout_count += bouts
+    self.ready_count += ready
+    self.round_bouts[round] = self.round_bouts.get(round, 0) + bouts
+    self.round_ready[round] = self.round_ready.get(round, 0) + ready
+    
+  def RecountBouts(self):
+    '''Count the contested and ready bouts in every entry from scratch.'''
+    self.bout_count = 0
+    self.ready_count = 0
+    self.round_bouts = {}
+    self.round_ready = {}
+    for wc in self.weight_classes.values():
+      wc.RecountBouts()
 
   def GetWeights(self):
-    '''Return a list of all the weight classes in ascending order.'''
+    '''Return a list of all the weight classes in ascending order, including those not loaded
+    yet.'''
     k = self.weight_classes.keys()
+    if self.loader is not None:
+      k += self.loader.Weights
     k.sort()
     return k
   
@@ -163,11 +376,12 @@ class wnTournament(wnNode):
     return t
   
   def GetRoundNames(self):
-    return self.weight_classes.values()[0].Rounds
+    return self.GetWeightClass(self.Weights[0]).Rounds
   
   Weights = property(fget=GetWeights)
   Teams = property(fget=GetTeams)
   TeamNames = property(fget=GetTeamNames)
+  ScoreVersion = property(fget=GetScoreVersion)
   Rounds = property(fget=GetRoundNames)
   
 class wnWeightClass(wnNode):
@@ -176,6 +390,9 @@ class wnWeightClass(wnNode):
     wnNode.__init__(self, parent, name)    
     self.rounds = {}
     self.order = []
+    self.thread_paths = {}
+    self.bout_count = 0
+    self.ready_count = 0
     
   def NewRound(self, name, points):
     r = wnRound(name, points, self)
@@ -187,50 +404,43 @@ class wnWeightClass(wnNode):
   def GetRound(self, name):
     return self.rounds.get(name)
   
-  def Paint(self, painter, start, initial_step, refresh_labels):
-    '''Go through all of the rounds and draw their bracket lines.'''
-
-    step = initial_step
-    max_x = 0
-    max_y = 0
-    
-    #go through all the rounds in this weight class
-    for i in range(len(self.order)):
-      #get the current round, and the number of entries in the previous and next rounds if they
-      #exist
-      curr = self.rounds[self.order[i]]
-      try:
-        next_num = self.rounds[self.order[i+1]].NumEntries
-      except:
-        next_num = 0
-        
-      if i != 0:
-        prev_num = self.rounds[self.order[i-1]].NumEntries
-      else:
-        prev_num = 1e300
-        
-      #if this round has more entries than the previous, reset drawing to the left side of the
-      #bracket window, but below the first entry
-      if curr.NumEntries > prev_num:
-        step = initial_step
-        start = (0, max_y+step*2)
+  def BuildThreadIndex(self):
+    '''Forget the stored paths of next win entries so they are found again from the links. Paths
+    are only stored once they are asked for, so building a weight class takes time in proportion to
+    its entries even when a deep bracket has many long paths. The rounds must already be
+    connected.'''
+    self.thread_paths = {}
         
-      #make the outermost lines long to fit a full name and team name
-      if i == 0:
-        length = wnSettings.seed_length
-      else:
-        length = wnSettings.match_length
+  def GetThreadPath(self, entry):
+    '''Get the path of entries a thread starting at the given entry can follow to the end of its
+    bracket. Return None if no thread can start at the entry.'''
+    try:
+      return self.thread_paths[entry]
+    except KeyError:
+      pass
+    
+    path = None
+    if entry.Previous == [] and entry.Parent.next_win is not None:
+      # follow the win links without recursion
+      path = [entry]
+      e = entry.NextWin
+      while e is not None:
+        path.append(e)
+        e = e.NextWin
+    self.thread_paths[entry] = path
+    return path
+  
+  def Paint(self, painter, geometry, refresh_labels):
+    '''Draw the bracket lines and seed numbers laid out in the geometry of the layout. Draw the
+    labels of the entries too when they need to be refreshed. Return the size of the drawing.'''
+    painter.DrawGeometry(geometry)
 
-      start, mx, my = curr.Paint(painter, start, length, step, refresh_labels)
-      
-      # line up rounds that have spots for wrestlers that drop down
-      if curr.NumEntries != next_num:
-        step *= 2
-     
-      max_x = max(mx, max_x)
-      max_y = max(my, max_y)
-      
-    return max_x, max_y+initial_step
+    #only the labels change from one weight class to the next
+    if refresh_labels:
+      for r in self.order:
+        for e in self.rounds[r].entries:
+          e.Paint(painter, geometry.Labels[e.ID])
+    return geometry.Size
   
   def CalcScores(self):
     '''Compute all the team scores in this weight class.'''
@@ -265,12 +475,25 @@ class wnWeightClass(wnNode):
     return places
   
   def CountBouts(self):
-    '''Get a count of the total number of bouts.'''
-    i = 0
+    '''Get a count of the contested bouts in this weight class, not counting byes.'''
+    return self.bout_count
+  
+  def CountRemainingBouts(self):
+    '''Get a count of the bouts in this weight class that are ready to be wrestled.'''
+    return self.ready_count
+  
+  def AddBoutCounts(self, round, bouts, ready):
+    '''Add to the counts of contested and ready bouts for a round.'''
+    self.bout_count += bouts
+    self.ready_count += ready
+    self.parent.AddBoutCounts(round, bouts, ready)
+    
+  def RecountBouts(self):
+    '''Count the contested and ready bouts in every entry from scratch.'''
+    self.bout_count = 0
+    self.ready_count = 0
     for r in self.rounds.values():
-      i += r.CountBouts()
-     
-    return i  
+      r.RecountBouts()
   
   def GetRoundNames(self):
     return self.order
@@ -286,6 +509,8 @@ class wnRound(wnNode):
     self.ordered_entries = []
     self.next_win = None
     self.next_lose = None
+    self.bout_count = 0
+    self.ready_count = 0
         
   def GetNumberOfEntries(self):
     return len(self.entries)
@@ -339,32 +564,6 @@ class wnRound(wnNode):
       #link the entry in this round to the proper entry in the next round
       self.entries[i].NextLose = round.Entries[to_map[i]]
 
-  def Paint(self, painter, start, length, step, refresh_labels):
-    '''Draw the bracket for this round only. Return the next starting position so the next round
-    knows where to draw itself.'''
-    
-    #draw the horizontal lines and entries
-    x,y = start
-    for i in range(self.NumEntries):
-      painter.DrawLine(x,y,x+length,y)
-      self.entries[i].Paint(painter, (x,y), refresh_labels)
-      y += step
-
-    #store the maximum positions so the scrollbars can be set properly
-    max_y = y-step
-    max_x = x+length
-  
-    #draw the vertical lines
-    x,y = start
-    for i in range(0,self.NumEntries-1,2):
-      painter.DrawLine(x+length,y,x+length,y+step)
-      y += step*2
-      
-    #compute the next start
-    new_start = start[0] + length, start[1] + step/2
-    
-    return new_start, max_x, max_y
-
   def CalcScores(self, scores):
     '''Start scoring threads in this round if possible.'''
     # quit right away if there is no next win round
@@ -374,32 +573,9 @@ class wnRound(wnNode):
     for entry in self.entries:
       # tell ones that start a thread to calculate their results
       if entry.Previous == [] and entry.Wrestler is not None:
-        results = entry.CalcScores()
-        
-        # the result is a list of all results in a thread sorted from earliest to latest round
-        # go through the list to add up the points, keeping track of byes in a separate count
-        # and only adding them when a non-bye match follows
-        bye_score = 0.0
-        thread_score = 0.0
-        
-        while len(results) != 0:
-          match, round = results.pop(0)
-          
-          # if there was no match, just skip it
-          if match is None: continue
-          
-          # add in non-byes normally and indicate future byes should be counted
-          if match.Name != 'Bye':
-            thread_score += bye_score + match.Points + round.AdvPoints + round.PlacePoints
-            bye_score = 0.0
-            
-          # keep track of bye points for possible addition later
-          elif match.Name == 'Bye':
-            bye_score += match.Points + round.AdvPoints + round.PlacePoints
-                    
         # store the result for this team so far
         tn = entry.Wrestler.Team.Name
-        scores[tn] = scores.get(tn, 0.0) + thread_score
+        scores[tn] = scores.get(tn, 0.0) + entry.CalcThreadScore()
         
   def GetBouts(self):
     '''Return all of the matchups in the given round.'''
@@ -435,12 +611,26 @@ class wnRound(wnNode):
       return []
 
   def CountBouts(self):
-    '''Get a count of the total number of bouts.'''
-    i = 0
+    '''Get a count of the contested bouts in this round, not counting byes.'''
+    return self.bout_count
+  
+  def CountRemainingBouts(self):
+    '''Get a count of the bouts in this round that are ready to be wrestled.'''
+    return self.ready_count
+  
+  def AddBoutCounts(self, bouts, ready):
+    '''Add to the counts of contested and ready bouts in this round.'''
+    self.bout_count += bouts
+    self.ready_count += ready
+    self.parent.AddBoutCounts(self.name, bouts, ready)
+    
+  def RecountBouts(self):
+    '''Count the contested and ready bouts in every entry from scratch.'''
+    self.bout_count = 0
+    self.ready_count = 0
     for e in self.entries:
-      i += e.CountBouts()
-     
-    return i
+      e.counts = (0, 0)
+      e.updateCounts()
   
   def OnMoveIn(self, event):
     '''Go through all the entries in this round and see if any of the wrestlers can be moved in
@@ -493,6 +683,7 @@ class wnEntry(wnNode):
     self.previous = []
     self.result = None
     self.is_scoring = True
+    self.counts = (0, 0)
     
   def GetResult(self):
     return self.result
@@ -506,6 +697,10 @@ class wnEntry(wnNode):
     is exactly the same, then the controls can be reused across weight classes.'''
     return (self.name, self.Parent.Name)
   
+  def GetLabel(self):
+    '''Get the rectangle laid out for the label of this entry.'''
+    return self.Parent.Parent.Parent.GetTopology().Geometry.Labels[self.ID]
+  
   def GetNextLose(self):
     return self.next_lose
   
@@ -541,28 +736,84 @@ class wnEntry(wnNode):
     '''Set the wrestler stored at this entry.'''
     self.wrestler = wrestler
   
-  def CalcScores(self):
-    '''Begin a score calculation thread. Call CalcScores recursively on each following win
-    entry to see if the same wrestler is present there. Collect points won in these rounds
-    and update the team score with them.'''
-    
-    # if the wrestler has continued past this point
-    if (self.next_win is not None) and (self.wrestler == self.next_win.Wrestler):
-      # call calc scores again
-      result = self.next_win.CalcScores()
+  def GetThread(self):
+    '''Get the list of entries held by the wrestler at this entry, starting here and following the
+    next win entries for as long as the same wrestler is present.'''
+    # use the path stored in the weight class if this entry starts a thread
+    path = self.parent.Parent.GetThreadPath(self)
+    if path is None:
+      thread = [self]
+      e = self
+      while e.next_win is not None and e.next_win.Wrestler == self.wrestler:
+        e = e.next_win
+        thread.append(e)
+      return thread
+    
+    # the thread is the part of the path the wrestler has reached so far
+    n = 1
+    while n < len(path) and path[n].wrestler == self.wrestler:
+      n += 1
+    return path[:n]
+    
+  def GetThreadOrigins(self):
+    '''Walk back through the previous entries held by the same wrestler to find the entries that
+    start the scoring threads reaching this one. There is normally at most one.'''
+    if self.wrestler is None: return []
+    
+    origins = []
+    stack = [self]
+    while stack:
+      e = stack.pop()
+      if e.previous == []:
+        origins.append(e)
+      else:
+        stack += [p for p in e.previous if p.Wrestler == self.wrestler]
+    return origins
+  
+  def CalcThreadScore(self, thread=None):
+    '''Add up the points in the scoring thread that starts at this entry. The thread entries can be
+    given if they are already known.'''
+    thread_score = 0.0
+    for row in self.CalcThreadLedger(thread):
+      thread_score += row.Points
+    return thread_score
+  
+  def CalcThreadLedger(self, thread=None):
+    '''Get the ledger entries for the scoring thread that starts at this entry, from the earliest
+    to the latest round. The thread entries can be given if they are already known.'''
+    if thread is None:
+      thread = self.GetThread()
+    
+    # go through the thread from earliest to latest round, keeping track of byes separately and
+    # only crediting them when a non-bye match follows
+    byes = []
+    ledger = []
+    
+    for e in thread:
+      # skip entries that were marked as not scoring
+      if not e.is_scoring: continue
+      match = e.result
       
-      # prepend the result of this entry to the growing list
-      if self.is_scoring:
-        result.insert(0, (self.result, self.parent.RoundPoints))
-      return result
+      # if there was no match, just skip it
+      if match is None: continue
       
-    else:
-      # return the result of this entry
-      if self.is_scoring:
-        return [(self.result, self.parent.RoundPoints)]
+      row = wnLedgerEntry(self.wrestler, e.parent.Name, match, e.parent.RoundPoints)
+      ledger.append(row)
+      
+      # credit earlier byes when a non-bye follows, otherwise hold on to the bye
+      if row.IsCredited:
+        for bye in byes:
+          bye.credited = True
+        byes = []
       else:
-        return []
-
+        byes.append(row)
+        
+    return ledger
+  
+  def CalcScores(self):
+    '''Get the results and round points for the scoring thread starting at this entry, sorted
+    from the earliest to the latest round.'''
+    return [(e.result, e.parent.RoundPoints) for e in self.GetThread() if e.is_scoring]
 
   def CountBouts(self):
     '''Get a count of the total number of bouts.'''
@@ -570,6 +821,33 @@ class wnEntry(wnNode):
       return 0
     else:
       return 1
+    
+  def CountReady(self):
+    '''Get 1 if the bout in this entry is ready to be wrestled, otherwise 0. A bout is ready when
+    all its previous entries hold wrestlers and nobody has moved into this entry yet.'''
+    if self.wrestler is not None or len(self.previous) < 2:
+      return 0
+    for e in self.previous:
+      if e.Wrestler is None:
+        return 0
+    return 1
+  
+  def updateCounts(self):
+    '''Recount the bout in this entry and pass any change up to the round.'''
+    counts = (self.CountBouts(), self.CountReady())
+    if counts != self.counts:
+      self.parent.AddBoutCounts(counts[0] - self.counts[0], counts[1] - self.counts[1])
+      self.counts = counts
+    
+  def notifyChange(self):
+    '''Update the bout counts and tell the tournament the wrestler or result in this entry
+    changed.'''
+    # temporary entries used for moving wrestlers around belong to no tournament
+    if self.parent is None: return
+    self.updateCounts()
+    if self.next_win is not None:
+      self.next_win.updateCounts()
+    self.parent.Parent.Parent.Notify('OnEntryChange', self)
   
   ID = property(fget=GetID)
   NextLose = property(fget=GetNextLose, fset=SetNextLose)
@@ -585,16 +863,13 @@ class wnMatchEntry(wnEntry, wnMouseEventReceivable, wnMatchMenuReceivable):
   def __init__(self, name, parent):
     wnEntry.__init__(self, name, parent)
     
-  def Paint(self, painter, pos=(0,0), refresh_labels=False):
-    '''Paint all of the text controls.'''
+  def Paint(self, painter, label=None):
+    '''Paint the text control in the given label rectangle, or in the one laid out for it.'''
     if self.wrestler is None: text = ''
     else: text = self.wrestler.ShortName
     
-    if refresh_labels:
-      painter.DrawMatchTextControl(text,
-                                   pos[0]+wnSettings.match_offset, pos[1]-wnSettings.match_height,
-                                   wnSettings.match_length-wnSettings.match_offset*2, wnSettings.match_height,
-                                   self.ID, self)
+    x, y, length, height = label or self.GetLabel()
+    painter.DrawMatchTextControl(text, x, y, length, height, self.ID, self)
     
   def OnMouseEnter(self, event):
     '''Show a popup window with the match results if available. Highlight the entry if it can
@@ -675,35 +950,49 @@ class wnMatchEntry(wnEntry, wnMouseEventReceivable, wnMatchMenuReceivable):
       return None
     
   def StoreResult(self, result, event):
-    '''Store a result in this entry.'''
-    # remove any old result first
-    if self.wrestler is not None:
-      self.wrestler.DeleteResult(self.ID)
-    
-    #store the information in the entry
-    self.result = result.Result
-    self.wrestler = result.Winner
-    self.is_scoring = result.IsScoring
-    
-    #store the result for the wrestler
-    self.wrestler.StoreResult(self.ID, self.result)
-    
-    #show the new winner name
-    event.Painter.GetControl(self.ID).SetLabel(self.wrestler.ShortName)
-    
-    #move the loser if he exists and isn't eliminated
-    if result.Loser is not None:
-      for e in self.previous:
-        if e.Wrestler == result.Loser and e.NextLose is not None:
-          e.NextLose.Wrestler = result.Loser
-          e.NextLose.Paint(event.Painter, refresh_labels=True)
+    '''Store a result in this entry. The entries it changes are one batch of changes.'''
+    tournament = self.parent.Parent.Parent
+    tournament.BeginChanges()
+    try:
+      # remove any old result first
+      if self.wrestler is not None:
+        self.wrestler.DeleteResult(self.ID)
+      
+      #store the information in the entry
+      self.result = result.Result
+      self.wrestler = result.Winner
+      self.is_scoring = result.IsScoring
+      
+      #store the result for the wrestler
+      self.wrestler.StoreResult(self.ID, self.result)
+      self.notifyChange()
+      
+      #show the new winner name
+      event.Painter.GetControl(self.ID).SetLabel(self.wrestler.ShortName)
+      
+      #move the loser if he exists and isn't eliminated
+      if result.Loser is not None:
+        for e in self.previous:
+          if e.Wrestler == result.Loser and e.NextLose is not None:
+            e.NextLose.Wrestler = result.Loser
+            e.NextLose.notifyChange()
+            e.NextLose.Paint(event.Painter)
+    finally:
+      tournament.EndChanges()
           
   def DeleteResult(self, event):
-    if self.result is not None:
-      self.wrestler.DeleteResult(self.ID)
-    self.wrestler = None
-    self.result = None
-    event.Painter.GetControl(self.ID).SetLabel('')
+    '''Delete the result in this entry as one batch of changes.'''
+    tournament = self.parent.Parent.Parent
+    tournament.BeginChanges()
+    try:
+      if self.result is not None:
+        self.wrestler.DeleteResult(self.ID)
+      self.wrestler = None
+      self.result = None
+      self.notifyChange()
+      event.Painter.GetControl(self.ID).SetLabel('')
+    finally:
+      tournament.EndChanges()
         
 class wnSeedEntry(wnEntry, wnMouseEventReceivable, wnFocusEventReceivable, wnSeedMenuReceivable):
   '''The seed entry class holds information about seeded wrestlers.'''
@@ -711,25 +1000,18 @@ class wnSeedEntry(wnEntry, wnMouseEventReceivable, wnFocusEventReceivable, wnSee
     wnEntry.__init__(self, name, parent)
     self.is_last = False
     
-  def Paint(self, painter, pos=(0,0), refresh_labels=False, full=True):
-    '''Paint all of the text controls.'''
-    if full:
-      #draw the seed number
-      painter.DrawText(str(self.name), pos[0], pos[1]-wnSettings.seed_height)
- 
-    #draw the text control
-    if refresh_labels:
-      if self.wrestler is None:
-        text = ''
-      else:
-        text = self.wrestler.FormattedName
+  def Paint(self, painter, label=None):
+    '''Paint the text control in the given label rectangle, or in the one laid out for it. The seed
+    number is drawn with the bracket lines.'''
+    if self.wrestler is None:
+      text = ''
+    else:
+      text = self.wrestler.FormattedName
       
-      #get the available teams from the round->weight->tournament
-      teams = self.Teams.keys()      
-      painter.DrawSeedTextControl(text,
-                                  pos[0]+wnSettings.seed_offset, pos[1]-wnSettings.seed_height,
-                                  wnSettings.seed_length-wnSettings.seed_offset, wnSettings.seed_height,
-                                  teams, self.ID, self)
+    #get the available teams from the round->weight->tournament
+    teams = self.Teams.keys()      
+    x, y, length, height = label or self.GetLabel()
+    painter.DrawSeedTextControl(text, x, y, length, height, teams, self.ID, self)
     
   def OnRightUp(self, event):
     '''Show the popup menu.'''
@@ -740,6 +1022,7 @@ class wnSeedEntry(wnEntry, wnMouseEventReceivable, wnFocusEventReceivable, wnSee
     if self.wrestler is not None and self.wrestler.Team is not None:
       self.wrestler.Team.DeleteWrestler(self.wrestler.Name, self.Weight)
     self.wrestler = None
+    self.notifyChange()
     event.Control.ClearValue()
     event.Control.RefreshScores()    
     
@@ -804,6 +1087,7 @@ class wnSeedEntry(wnEntry, wnMouseEventReceivable, wnFocusEventReceivable, wnSee
     if self.wrestler is not None and self.wrestler.Team is not None:
       self.wrestler.Team.DeleteWrestler(self.wrestler.Name, self.Weight)
     self.wrestler = None
+    self.notifyChange()
     event.Control.ClearValue()
         
     # make sure we weren't the last seed
@@ -836,7 +1120,7 @@ class wnSeedEntry(wnEntry, wnMouseEventReceivable, wnFocusEventReceivable, wnSee
     temp = wnSeedEntry(None, None)
     temp.Wrestler = None
     temp.IsLast = False
-    temp.Paint = lambda painter, refresh_labels, full: full
+    temp.Paint = lambda painter, label=None: None
     
     # go through the list and swap wrestlers down
     for i in range(int(self.name)-1, self.parent.NumEntries):
@@ -869,10 +1153,12 @@ class wnSeedEntry(wnEntry, wnMouseEventReceivable, wnFocusEventReceivable, wnSee
     # swap the entry data
     entry.Wrestler, entry.IsLast = w1
     self.wrestler, self.is_last = w2
+    self.notifyChange()
+    entry.notifyChange()
 
     # redraw the text controls    
-    self.Paint(painter, refresh_labels=True, full=False)
-    entry.Paint(painter, refresh_labels=True, full=False)
+    self.Paint(painter)
+    entry.Paint(painter)
       
   def updateData(self, event):
     '''Figure out what needs to be done to store the wrestler properly.'''
@@ -882,6 +1168,7 @@ class wnSeedEntry(wnEntry, wnMouseEventReceivable, wnFocusEventReceivable, wnSee
       if self.wrestler is not None:
         self.wrestler.Team.DeleteWrestler(self.wrestler.Name, self.Weight)
         self.wrestler = None
+        self.notifyChange()
       return
         
     #get the data from the control since it must be valid
@@ -895,11 +1182,13 @@ class wnSeedEntry(wnEntry, wnMouseEventReceivable, wnFocusEventReceivable, wnSee
       if self.wrestler is not None:
         self.wrestler.Team.DeleteWrestler(self.wrestler.Name, self.Weight)
         self.wrestler = None
+        self.notifyChange()
       return
 
     # add a new wrestler
     if self.wrestler is None:
       self.wrestler = self.Teams[t_name].NewWrestler(w_name, self.Weight)
+      self.notifyChange()
     
     # replace an existing wrestler
     elif self.wrestler is not None:
@@ -914,6 +1203,7 @@ class wnSeedEntry(wnEntry, wnMouseEventReceivable, wnFocusEventReceivable, wnSee
         self.wrestler.Team.DeleteWrestler(self.wrestler.Name, self.Weight)
         #and make a new wrestler in the new team
         self.wrestler = self.Teams[t_name].NewWrestler(w_name, self.Weight)
+        self.notifyChange()
       
   def updateFocus(self, event):
     '''Figure out where the focus should go next.'''
@@ -1,7 +1,187 @@
 from wnBracketData import *
 from wnScoreData import *
 from wnTeamData import *
-import wnSettings, yaml, glob
+import wnSettings, yaml, glob, os, cPickle
+try:
+  from yaml import CSafeLoader as SafeLoader
+except ImportError:
+  from yaml import SafeLoader
+
+class wnLayoutError(Exception):
+  '''Raised when a layout file does not describe a tournament that can be built.'''
+  pass
+
+def LoadLayout(fn):
+  '''Read a layout file with the safe YAML loader, which is written in C when LibYAML is
+  installed.'''
+  f = file(fn)
+  try:
+    return yaml.load(f.read(), Loader=SafeLoader)
+  finally:
+    f.close()
+
+def ValidateLayout(data):
+  '''Check that layout data describes brackets that can be built. Raise a wnLayoutError saying what
+  is wrong if it does not.'''
+  if not isinstance(data, dict):
+    raise wnLayoutError('The layout is not a mapping of keys to values.')
+  for key in ['Seeds', 'Rounds']:
+    if not data.has_key(key):
+      raise wnLayoutError('The layout has no %s.' % key)
+  if not isinstance(data['Rounds'], list) or data['Rounds'] == []:
+    raise wnLayoutError('The layout has no rounds.')
+
+  # count the entries of every round first so links can be checked against them
+  sizes = {}
+  for r in data['Rounds']:
+    for key in ['Name', 'Adv Points', 'Place Points', 'Entries']:
+      if not isinstance(r, dict) or not r.has_key(key):
+        raise wnLayoutError('A round has no %s.' % key)
+    if sizes.has_key(r['Name']):
+      raise wnLayoutError('There are two rounds named %s.' % r['Name'])
+    entries = r['Entries']
+    if isinstance(entries, list):
+      # seed entries are numbered from one
+      if sorted(entries) != range(1, len(entries)+1):
+        raise wnLayoutError('The seeds of round %s are not numbered 1 to %d.' %
+                            (r['Name'], len(entries)))
+      sizes[r['Name']] = len(entries)
+    elif isinstance(entries, int) and entries > 0:
+      sizes[r['Name']] = entries
+    else:
+      raise wnLayoutError('Round %s has no entries.' % r['Name'])
+
+  wins = {}
+  for r in data['Rounds']:
+    for link in ['Win', 'Lose']:
+      target = r.get(link + ' Round')
+      order = r.get(link + ' Order')
+      if target is None and order is None:
+        continue
+      if not sizes.has_key(target):
+        raise wnLayoutError('Round %s links to a round named %s that does not exist.' %
+                            (r['Name'], target))
+      if not isinstance(order, list) or len(order) != sizes[r['Name']]:
+        raise wnLayoutError('The %s order of round %s needs one position for each of its %d '
+                            'entries.' % (link.lower(), r['Name'], sizes[r['Name']]))
+      for i in order:
+        if not isinstance(i, int) or i < 0 or i >= sizes[target]:
+          raise wnLayoutError('The %s order of round %s has position %s, but round %s has %d '
+                              'entries.' % (link.lower(), r['Name'], i, target, sizes[target]))
+    wins[r['Name']] = r.get('Win Round')
+
+  # winners must reach the end of the bracket, and a walk stops at a round already known to reach
+  # it, so every round is only walked once
+  finished = {}
+  for start in wins:
+    seen = {}
+    name = start
+    while name is not None and not finished.has_key(name):
+      if seen.has_key(name):
+        raise wnLayoutError('The win rounds after round %s go around in a circle.' % name)
+      seen[name] = True
+      name = wins[name]
+    finished.update(seen)
+
+  # a round with no win round awards a place, so it holds just the winner
+  for r in data['Rounds']:
+    if r.get('Win Round') is None and sizes[r['Name']] != 1:
+      raise wnLayoutError('Round %s has no win round, so it must have one entry for the winner of '
+                          'a place, not %d.' % (r['Name'], sizes[r['Name']]))
+
+  # every round must be filled from the seeds by wins and losses
+  links = {}
+  reached = {}
+  for r in data['Rounds']:
+    links[r['Name']] = [r.get('Win Round'), r.get('Lose Round')]
+    if isinstance(r['Entries'], list):
+      reached[r['Name']] = True
+  todo = reached.keys()
+  while todo:
+    for name in links[todo.pop()]:
+      if name is not None and not reached.has_key(name):
+        reached[name] = True
+        todo.append(name)
+  for r in data['Rounds']:
+    if not reached.has_key(r['Name']):
+      raise wnLayoutError('No wrestler can reach round %s from the seeds.' % r['Name'])
+
+class wnLayoutRegistry(object):
+  '''The layout registry reads the layout files in a folder and keeps the data of the valid ones in
+  a cache file, with the modification time and size of each file. Only files that changed since
+  they were cached are read again, so YAML is not parsed at all when no layout changed. The layouts
+  read so far are kept in memory too.'''
+  def __init__(self, path, cache):
+    self.path = path
+    self.cache = cache
+    self.layouts = None
+    self.configs = {}
+    self.Errors = []
+
+  def GetLayouts(self):
+    '''Get a config for every valid layout in the folder, ordered by file name. Layouts that could
+    not be read are listed in Errors as (file name, message) pairs.'''
+    if self.layouts is None:
+      self.layouts = self.readCache()
+    layouts = {}
+    configs = []
+    changed = False
+    self.Errors = []
+    for fn in sorted(glob.glob(os.path.join(self.path, '*.yml'))):
+      st = os.stat(fn)
+      stamp = (st.st_mtime, st.st_size)
+      cached = self.layouts.get(fn)
+      if cached is None or cached[0] != stamp:
+        changed = True
+        try:
+          data = LoadLayout(fn)
+          ValidateLayout(data)
+          cached = (stamp, data, None)
+        except (yaml.YAMLError, wnLayoutError), e:
+          cached = (stamp, None, str(e))
+      layouts[fn] = cached
+
+      stamp, data, error = cached
+      if error is not None:
+        self.Errors.append((fn, error))
+        continue
+      key = (fn, stamp)
+      if not self.configs.has_key(key):
+        self.configs[key] = wnConfig(data=data)
+      configs.append(self.configs[key])
+
+    if changed or len(layouts) != len(self.layouts):
+      self.layouts = layouts
+      self.writeCache()
+    return configs
+
+  def readCache(self):
+    '''Read the cached layouts, or start over if there is no usable cache.'''
+    try:
+      f = file(self.cache, 'rb')
+      try:
+        data = cPickle.load(f)
+      finally:
+        f.close()
+      if data['Version'] == 1:
+        return data['Layouts']
+    except Exception:
+      pass
+    return {}
+
+  def writeCache(self):
+    '''Write the cache. The layouts folder may not be writable, in which case the files are just
+    read again next time.'''
+    try:
+      f = file(self.cache + '.tmp', 'wb')
+      try:
+        cPickle.dump({'Version' : 1, 'Layouts' : self.layouts}, f, 2)
+      finally:
+        f.close()
+      import wnStorage
+      wnStorage.ReplaceFile(self.cache + '.tmp', self.cache)
+    except EnvironmentError:
+      pass
 
 class wnRoundSetup(object):
   def __init__(self, name, points, num_entries, next_win = None, win_map = None, next_lose = None,
@@ -15,13 +195,15 @@ class wnRoundSetup(object):
     self.LoseMap = lose_map
     
 class wnConfig(object):
-  def __init__(self, fn):
-    f = file(fn)
-    data = yaml.load(f.read())
-    f.close()
+  '''The config class holds a tournament layout read from a YAML file, or from a dictionary with
+  the same keys when the data is given instead.'''
+  def __init__(self, fn=None, data=None):
+    if data is None:
+      data = LoadLayout(fn)
     
-    self.Name = data['Name']
-    self.Description = data['Description']
+    # layouts stored in tournament files have no name or description
+    self.Name = data.get('Name')
+    self.Description = data.get('Description')
     self.Seeds = data['Seeds']
     self.Rounds = []
     for r in data['Rounds']:
@@ -29,14 +211,260 @@ class wnConfig(object):
                         r.get('Win Round'), r.get('Win Order'), r.get('Lose Round'), 
                         r.get('Lose Order'))
       self.Rounds.append(rs)
+    self.topology = None
+      
+  def GetTopology(self):
+    '''Get the brackets of this layout compiled for building weight classes.'''
+    if self.topology is None:
+      self.topology = wnTopology(self)
+    return self.topology
+    
+  Topology = property(fget=GetTopology)
+  
+class wnTopology(object):
+  '''The topology class compiles a layout into a flat table that never changes once it is built.
+  Entries are numbered round by round in layout order, and seed rounds list theirs in the bracket
+  order of the layout. The table holds:
+
+  Rounds: a (name, points, first entry, entry count, seeded, win round, lose round, place) tuple
+    for every round, where the linked rounds are round numbers or None and place is the first
+    place a final round awards
+  Names: the name of every entry, its seed number or its position in its round
+  RoundOf: the round number of every entry
+  Ordered: the entry numbers of every round in the order the win and lose maps count positions
+  NextWin, NextLose: the entry number an entry sends its winner or loser to, or None
+  Previous: the entry numbers that send their winners to an entry
+
+  The layout is validated before it is compiled, so a bad map raises a wnLayoutError instead of
+  failing while the brackets are linked. Weight classes are stamped out from the table by cloning
+  prototype entries and setting their links directly, so building one costs the same however many
+  weights a tournament has.'''
+  def __init__(self, config):
+    # entries are cloned from the attributes of blank ones, so they match what the classes set up
+    self.prototypes = {wnMatchEntry : wnMatchEntry(0, None).__dict__,
+                       wnSeedEntry : wnSeedEntry(0, None).__dict__}
+
+    # describe the layout the way the storage module saves it
+    self.Layout = {'Seeds' : config.Seeds, 'Rounds' : []}
+    for rs in config.Rounds:
+      data = {'Name' : rs.Name, 'Adv Points' : rs.Points.AdvPoints,
+              'Place Points' : rs.Points.PlacePoints, 'Entries' : rs.NumEntries}
+      if rs.WinMap is not None:
+        data['Win Round'] = rs.NextWin
+        data['Win Order'] = list(rs.WinMap)
+      if rs.LoseMap is not None:
+        data['Lose Round'] = rs.NextLose
+        data['Lose Order'] = list(rs.LoseMap)
+      self.Layout['Rounds'].append(data)
+
+    # tournaments saved with no weights have no rounds to check
+    if config.Rounds:
+      ValidateLayout(self.Layout)
+
+    # number the entries of every round
+    index = dict([(config.Rounds[i].Name, i) for i in range(len(config.Rounds))])
+    names = []
+    round_of = []
+    ordered = []
+    firsts = []
+    for i in range(len(config.Rounds)):
+      size = config.Rounds[i].NumEntries
+      first = len(names)
+      firsts.append(first)
+      if type(size) == list or type(size) == tuple:
+        # the maps count seeds by their number
+        names += list(size)
+        order = [None] * len(size)
+        for j in range(len(size)):
+          order[size[j]-1] = first + j
+      else:
+        names += range(size)
+        order = range(first, first + size)
+      round_of += [i] * (len(names) - first)
+      ordered.append(tuple(order))
+
+    # link the entries through the maps
+    next_win = [None] * len(names)
+    next_lose = [None] * len(names)
+    previous = [[] for n in names]
+    rounds = []
+    place = 1
+    for i in range(len(config.Rounds)):
+      rs = config.Rounds[i]
+      first = firsts[i]
+      win = lose = award = None
+      if rs.WinMap is not None:
+        win = index[rs.NextWin]
+        for j in range(len(rs.WinMap)):
+          next_win[first+j] = ordered[win][rs.WinMap[j]]
+      else:
+        # the final rounds award places in layout order, to the winner and the loser before it
+        award = place
+        place += 2
+      if rs.LoseMap is not None:
+        lose = index[rs.NextLose]
+        for j in range(len(rs.LoseMap)):
+          next_lose[first+j] = ordered[lose][rs.LoseMap[j]]
+      rounds.append((rs.Name, rs.Points, first, len(ordered[i]), type(rs.NumEntries) != int,
+                     win, lose, award))
+    for j in range(len(names)):
+      if next_win[j] is not None:
+        previous[next_win[j]].append(j)
+
+    self.Rounds = tuple(rounds)
+    self.Names = tuple(names)
+    self.RoundOf = tuple(round_of)
+    self.Ordered = tuple(ordered)
+    self.NextWin = tuple(next_win)
+    self.NextLose = tuple(next_lose)
+    self.Previous = tuple([tuple(p) for p in previous])
+    self.geometry = None
+
+  def __len__(self):
+    return len(self.Names)
+
+  def CreateWeight(self, tourn, name):
+    '''Build the empty brackets of one weight class in a tournament.'''
+    w = tourn.NewWeightClass(name)
+    rounds = []
+    entries = []
+    for r_name, points, first, count, seeded, win, lose, place in self.Rounds:
+      r = w.NewRound(r_name, points)
+      if seeded:
+        r.entries = self.clone(wnSeedEntry, r, self.Names[first:first+count])
+      else:
+        r.entries = self.clone(wnMatchEntry, r, self.Names[first:first+count])
+      entries += r.entries
+      rounds.append(r)
+
+    for i in range(len(rounds)):
+      r = rounds[i]
+      r_name, points, first, count, seeded, win, lose, place = self.Rounds[i]
+      if seeded:
+        # the ordered entries are by seed number
+        r.ordered_entries = [entries[j] for j in self.Ordered[i]]
+      else:
+        r.ordered_entries = r.entries
+      if win is not None:
+        r.next_win = rounds[win]
+      if lose is not None:
+        r.next_lose = rounds[lose]
+
+    # the links are entry numbers in the table
+    for j in range(len(entries)):
+      e = entries[j]
+      if self.NextWin[j] is not None:
+        e.next_win = entries[self.NextWin[j]]
+      if self.NextLose[j] is not None:
+        e.next_lose = entries[self.NextLose[j]]
+      e.previous = [entries[p] for p in self.Previous[j]]
+
+    #index the scoring threads now that all the links are in place
+    w.BuildThreadIndex()
+    return w
+
+  def clone(self, cls, parent, names):
+    '''Make entries of a class in a round without running their constructors.'''
+    proto = self.prototypes[cls]
+    new = object.__new__
+    entries = []
+    for name in names:
+      e = new(cls)
+      d = proto.copy()
+      d['parent'] = parent
+      d['name'] = name
+      d['previous'] = []
+      e.__dict__ = d
+      entries.append(e)
+    return entries
+
+  def GetGeometry(self):
+    '''Get the positions of the bracket lines and labels, which are the same for every weight.'''
+    if self.geometry is None:
+      self.geometry = wnGeometry(self)
+    return self.geometry
+
+  Geometry = property(fget=GetGeometry)
+
+class wnGeometry(object):
+  '''The geometry class lays out the brackets of a compiled layout once, from the sizes in the
+  settings. Each round is drawn to the right of the one before it. A round with more entries than
+  the one before it starts a new bracket below the others. It holds:
+
+  Lines: the (x1, y1, x2, y2) bracket lines
+  Seeds: the (text, x, y) seed numbers written beside the seed lines
+  Labels: the (x, y, width, height) rectangle of the label of every entry, by entry ID
+  Size: the width and height of the whole drawing'''
+  def __init__(self, topology):
+    lines = []
+    seeds = []
+    self.Labels = {}
+    step = wnSettings.initial_step
+    start = (0, wnSettings.seed_start)
+    max_x = 0
+    max_y = 0
+
+    rounds = topology.Rounds
+    for i in range(len(rounds)):
+      r_name, points, first, count, seeded = rounds[i][:5]
+      if i + 1 < len(rounds):
+        next_num = rounds[i+1][3]
+      else:
+        next_num = 0
+
+      # reset drawing to the left side, below the rest, when this round has more entries
+      if i != 0 and count > rounds[i-1][3]:
+        step = wnSettings.initial_step
+        start = (0, max_y+step*2)
+
+      # make the outermost lines long to fit a full name and team name
+      if i == 0:
+        length = wnSettings.seed_length
+      else:
+        length = wnSettings.match_length
+
+      # the entries sit on the horizontal lines and pairs are joined by vertical ones
+      x, y = start
+      for name in topology.Names[first:first+count]:
+        lines.append((x, y, x+length, y))
+        if seeded:
+          seeds.append((str(name), x, y-wnSettings.seed_height))
+          label = (x+wnSettings.seed_offset, y-wnSettings.seed_height,
+                   wnSettings.seed_length-wnSettings.seed_offset, wnSettings.seed_height)
+        else:
+          label = (x+wnSettings.match_offset, y-wnSettings.match_height,
+                   wnSettings.match_length-wnSettings.match_offset*2, wnSettings.match_height)
+        self.Labels[(name, r_name)] = label
+        y += step
+      max_x = max(x+length, max_x)
+      max_y = max(y-step, max_y)
+      x, y = start
+      for j in range(0, count-1, 2):
+        lines.append((x+length, y, x+length, y+step))
+        y += step*2
+      start = start[0] + length, start[1] + step/2
+
+      # line up rounds that have spots for wrestlers that drop down
+      if count != next_num:
+        step *= 2
+
+    self.Lines = tuple(lines)
+    self.Seeds = tuple(seeds)
+    self.Size = (max_x, max_y+wnSettings.initial_step)
 
 class wnBuilder(object):
+  # the layouts are shared by every builder
+  registry = None
+  
   def GetTournaments(self):
     '''Return the tournaments currently supported.'''
-    #configs = [v for k, v in globals().items() if k.find('Config') > -1]
-    configs = [wnConfig(fn) for fn in glob.glob(wnSettings.layouts_path+'/*.yml')]
-    
-    return configs
+    return self.GetRegistry().GetLayouts()
+  
+  def GetRegistry(self):
+    '''Get the registry of the layouts in the layouts folder.'''
+    if wnBuilder.registry is None:
+      wnBuilder.registry = wnLayoutRegistry(wnSettings.layouts_path, wnSettings.layouts_cache)
+    return wnBuilder.registry
   
   def Create(self, config, name, weights, teams):
     '''Determine the type of tournament to create and then build it.'''
@@ -44,22 +472,13 @@ class wnBuilder(object):
 #     if config not in self.GetTournaments():
 #       raise TypeError('The tournament configuration is invalid.')
     
-    #create the new tournament
+    #create the new tournament, keeping the brackets to add weights later
     tourn = wnTournament(name, config.Seeds)
+    tourn.topology = config.Topology
       
     #build the weights
     for w_name in weights:
-      w = tourn.NewWeightClass(w_name)
-
-      #build the rounds
-      for round in config.Rounds:
-        r = w.NewRound(round.Name, round.Points)
-        
-        #build the entries
-        r.NewEntries(round.NumEntries)
-
-      #connect the rounds
-      self.connectRounds(w, config.Rounds)
+      self.CreateWeight(tourn, config, w_name)
       
     #add the teams
     for t in teams:
@@ -67,23 +486,9 @@ class wnBuilder(object):
     
     return tourn
   
-  def connectRounds(self, weight, rounds):
-    #cycle through all the rounds
-    for round in rounds:
-      #get the round
-      this_round = weight.GetRound(round.Name)
-      
-      if round.WinMap is not None:
-        #get the win round
-        win_round = weight.GetRound(round.NextWin)
-        #and connect it
-        this_round.SetNextWinRound(win_round, round.WinMap)
-
-      if round.LoseMap is not None:
-        #get the lose round
-        lose_round = weight.GetRound(round.NextLose)
-        #and connect it
-        this_round.SetNextLoseRound(lose_round, round.LoseMap)    
+  def CreateWeight(self, tourn, config, name):
+    '''Build the empty brackets of one weight class in a tournament.'''
+    return config.Topology.CreateWeight(tourn, name)
 
 # class wnBCInvitationalConfig:
 #   Name = 'Bristol Central Invitational'
@@ -0,0 +1,165 @@
+'''
+The clinch module defines classes that work out what is still possible in the team race. They find
+the fewest and the most points each team can finish with given the bouts left to wrestle, and
+whether any team has clinched the title.
+'''
+from wnArrayData import wnTournamentArrays
+from wnScoreData import wnResultFactory
+
+# the bonus points for the most and least valuable win
+max_bonus = max([wnResultFactory.Create('Pin', 0).Points, wnResultFactory.Create('Default').Points])
+min_bonus = wnResultFactory.Create('Decision', (1, 0)).Points
+
+class wnWeightSearch(object):
+  '''The weight search class finds the best total a weighted sum of team points can gain from the
+  bouts left in one weight class. Each team has a coefficient, so the same search finds the most
+  points for a team (+1), the fewest (-1), or the largest lead of one team over another (+1 and -1).
+
+  Only wrestlers from teams with a coefficient are followed. Which entries get filled does not
+  depend on who wins, so the search branches only at bouts involving those wrestlers. Each
+  followed wrestler is a token holding its entry, coefficient, waiting bye points, and whether its
+  thread counts. Results are memoized on the set of tokens.'''
+  def __init__(self, arrays):
+    self.arrays = arrays
+    bouts = arrays.GetFutureBouts()
+    self.bouts = dict(bouts)
+    self.positions = dict([(bouts[i][0], i) for i in range(len(bouts))])
+    self.counts, self.pending = arrays.GetThreadState()
+    self.memo = {}
+
+  def GetTokens(self, coef):
+    '''Get the tokens for the wrestlers waiting on a bout whose teams have a coefficient.'''
+    wa = self.arrays
+    tokens = []
+    for e in range(len(wa)):
+      w = wa.wrestler[e]
+      if w < 0 or not wa.wrestler_scoring[w]: continue
+      c = coef.get(wa.wrestler_team[w], 0)
+      if c != 0 and self.isWaiting(e):
+        tokens.append((e, c, self.pending[e], self.counts[e]))
+    tokens.sort()
+    return tuple(tokens)
+
+  def CalcBest(self, coef):
+    '''Get the largest sum of coefficient times points that can still be gained in this weight.'''
+    self.memo = {}
+    return self.best(self.GetTokens(coef))
+
+  def isWaiting(self, e):
+    '''Tell if the wrestler in an entry has a bout left to wrestle.'''
+    x = self.arrays.next_win[e]
+    return x >= 0 and self.bouts.has_key(x) and e in self.bouts[x]
+
+  def best(self, tokens):
+    '''Find the best gain for the given tokens by deciding the earliest bout one of them is in.'''
+    if tokens == (): return 0.0
+    try:
+      return self.memo[tokens]
+    except KeyError:
+      pass
+
+    wa = self.arrays
+    x = min([wa.next_win[t[0]] for t in tokens], key=self.positions.get)
+    participants = self.bouts[x]
+    here = dict([(t[0], t[1:]) for t in tokens if wa.next_win[t[0]] == x])
+    rest = [t for t in tokens if wa.next_win[t[0]] != x]
+    points = wa.adv_points[x] + wa.place_points[x]
+
+    # a bye carries the points along until a real match follows
+    if len(participants) == 1:
+      c, pending, counts = here[participants[0]]
+      if self.isWaiting(x):
+        rest.append((x, c, pending + points, counts))
+      rest.sort()
+      value = self.best(tuple(rest))
+
+    else:
+      p1, p2 = participants[:2]
+      outcomes = [(p1, p2), (p2, p1)]
+
+      # skip the second outcome when both sides look the same to the search
+      if here.get(p1) == here.get(p2) and wa.next_lose[p1] == wa.next_lose[p2]:
+        outcomes.pop()
+
+      value = None
+      for winner, loser in outcomes:
+        gain = 0.0
+        after = rest[:]
+        if here.has_key(winner):
+          c, pending, counts = here[winner]
+          if counts:
+            if c > 0:
+              gain = c * (pending + points + max_bonus)
+            else:
+              gain = c * (pending + points + min_bonus)
+          if self.isWaiting(x):
+            after.append((x, c, 0.0, counts))
+        if here.has_key(loser):
+          t = wa.next_lose[loser]
+          if t >= 0 and self.isWaiting(t):
+            after.append((t, here[loser][0], 0.0, bool(wa.is_origin[t])))
+        after.sort()
+        gain += self.best(tuple(after))
+        if value is None or gain > value:
+          value = gain
+
+    self.memo[tokens] = value
+    return value
+
+class wnClinchCalculator(object):
+  '''The clinch calculator works out the range of final scores for every team and whether a team has
+  clinched the title. It works on a flat array copy of the tournament taken when it is created.'''
+  def __init__(self, tournament):
+    self.arrays = wnTournamentArrays(tournament)
+    self.Teams = self.arrays.Teams
+    self.searches = [wnWeightSearch(wa) for wa in self.arrays.weights]
+    self.scores = dict([(t, s) for s, t in self.arrays.CalcScores()])
+    self.ranges = None
+
+  def CalcRanges(self):
+    '''Get the guaranteed minimum and the maximum attainable score for every team. Return a
+    dictionary of team names to (minimum, maximum) pairs.'''
+    if self.ranges is not None:
+      return self.ranges
+
+    self.ranges = {}
+    for i in range(len(self.Teams)):
+      low = high = self.scores[self.Teams[i]]
+      for s in self.searches:
+        # weights where this team has nobody left to wrestle can't change its score
+        if s.GetTokens({i : 1}) == (): continue
+        high += s.CalcBest({i : 1})
+        low -= s.CalcBest({i : -1})
+      self.ranges[self.Teams[i]] = (low, high)
+    return self.ranges
+
+  def CalcMaxLead(self, team, other):
+    '''Get the largest lead the other team can still take over the given team. A negative number
+    means the other team can no longer catch up.'''
+    i = self.Teams.index(team)
+    j = self.Teams.index(other)
+    lead = self.scores[other] - self.scores[team]
+    for s in self.searches:
+      lead += s.CalcBest({i : -1, j : 1})
+    return lead
+
+  def GetClinched(self):
+    '''Get the name of the team that has clinched the title, or None if the title is still open.'''
+    ranges = self.CalcRanges()
+    if len(self.Teams) < 2:
+      return None
+
+    # only a team with the single highest maximum can have clinched
+    by_max = [(high, t) for t, (low, high) in ranges.items()]
+    by_max.sort()
+    if by_max[-1][0] == by_max[-2][0]:
+      return None
+    leader = by_max[-1][1]
+    low = ranges[leader][0]
+
+    # teams that can't reach the leader's minimum need no closer look
+    for t in self.Teams:
+      if t == leader or ranges[t][1] < low: continue
+      if self.CalcMaxLead(leader, t) >= 0:
+        return None
+    return leader
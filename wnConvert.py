@@ -0,0 +1,184 @@
+'''
+Command line tool that upgrades tournament files saved as whole-graph pickles to the compact file
+format. Every file is loaded in both formats and only written once the scores, place winners, and
+bout counts match. The time to load and save each file and its size in both formats are reported.
+Files are converted in parallel by a pool of processes.
+
+usage: python wnConvert.py [options] file-or-folder ...
+'''
+import cPickle
+import glob
+import optparse
+import os
+import sys
+import time
+try:
+  import multiprocessing
+except ImportError:
+  multiprocessing = None
+
+import wnStorage
+
+def FindFiles(paths):
+  '''Get the tournament files named by the given paths. Folders are searched for .wnd files,
+  including in their subfolders. Return a list of (file name, name relative to the folder) pairs.'''
+  files = []
+  for path in paths:
+    if os.path.isdir(path):
+      for folder, dirs, names in os.walk(path):
+        dirs.sort()
+        for fn in sorted(glob.glob(os.path.join(folder, '*.wnd'))):
+          files.append((fn, os.path.relpath(fn, path)))
+    else:
+      files.append((path, os.path.basename(path)))
+  return files
+
+def Describe(tournament):
+  '''Get the scores, place winners, and bout count of a tournament as plain data for comparing.'''
+  places = []
+  for pw in tournament.GetPlaceWinners(tournament.Weights):
+    places.append((pw.Weight, [(p.Name, p.Team, p.Result) for p in pw]))
+  return {'Scores' : tournament.CalcScores(), 'Place Winners' : places,
+          'Bouts' : tournament.CountBouts()}
+
+def timed(func, *args):
+  '''Call a function and return its result and the seconds it took.'''
+  start = time.time()
+  result = func(*args)
+  return result, time.time() - start
+
+def ConvertFile(job):
+  '''Convert one file. The job is a tuple of the file name, the name to write the converted file
+  to, and whether to write it at all. Return a dictionary describing the conversion. Its Error key
+  holds a message if the file could not be converted, and its Skipped key is set for files that
+  need no conversion.
+
+  This is a module function so a process pool can send jobs to it.'''
+  filename, output, write = job
+  report = {'File' : filename, 'Error' : None, 'Skipped' : False}
+  try:
+    f = file(filename, 'rb')
+    try:
+      data = f.read()
+    finally:
+      f.close()
+    if data.startswith(wnStorage.MAGIC):
+      report['Skipped'] = True
+      return report
+
+    # time both formats the way the program reads and writes them
+    old, report['Old Load'] = timed(cPickle.loads, data)
+    old_data, report['Old Save'] = timed(cPickle.dumps, old, True)
+    new_data, report['New Save'] = timed(wnStorage.Dumps, old)
+    new, report['New Load'] = timed(wnStorage.Loads, new_data)
+    lazy, report['Lazy Load'] = timed(wnStorage.Loads, new_data, True)
+    report['Old Size'] = len(data)
+    report['New Size'] = len(new_data)
+
+    # compare what the tournaments report, not how they are built
+    expected = Describe(old)
+    for name, t in [('the compact format', new), ('a lazy load', lazy)]:
+      found = Describe(t)
+      for key in ['Scores', 'Place Winners', 'Bouts']:
+        if expected[key] != found[key]:
+          report['Error'] = '%s differ after %s' % (key.lower(), name)
+          return report
+
+    if write:
+      folder = os.path.dirname(output)
+      if folder != '' and not os.path.isdir(folder):
+        os.makedirs(folder)
+      f = file(output + '.tmp', 'wb')
+      try:
+        f.write(new_data)
+      finally:
+        f.close()
+      wnStorage.ReplaceFile(output + '.tmp', output)
+  except Exception, e:
+    report['Error'] = '%s: %s' % (e.__class__.__name__, e)
+  return report
+
+def ConvertFiles(files, outdir=None, write=True, processes=0):
+  '''Convert the (file name, relative name) pairs from FindFiles using a pool of processes, or one
+  per CPU when processes is 0. The converted files replace the originals unless an output folder
+  is given, where they keep their relative names. Return the reports in the same order as the
+  files.'''
+  jobs = []
+  for fn, relative in files:
+    if outdir is None:
+      output = fn
+    else:
+      output = os.path.join(outdir, relative)
+    jobs.append((fn, output, write))
+
+  if multiprocessing is None:
+    processes = 1
+  elif processes <= 0:
+    processes = multiprocessing.cpu_count()
+  processes = min(processes, len(jobs))
+  if jobs == []:
+    return []
+
+  if processes <= 1:
+    return map(ConvertFile, jobs)
+  pool = multiprocessing.Pool(processes)
+  try:
+    return pool.map(ConvertFile, jobs, 1)
+  finally:
+    pool.close()
+    pool.join()
+
+def PrintReports(reports, out=sys.stdout):
+  '''Print a table of the sizes and times in the reports followed by the totals.'''
+  columns = ['Old Size', 'New Size', 'Old Load', 'New Load', 'Lazy Load', 'Old Save', 'New Save']
+  print >> out, '%-40s %10s %10s %9s %9s %9s %9s %9s' % tuple(['File'] + columns)
+  totals = dict([(c, 0) for c in columns])
+  failed = 0
+  skipped = 0
+
+  for r in reports:
+    name = r['File']
+    if len(name) > 40:
+      name = '...' + name[-37:]
+    if r['Skipped']:
+      skipped += 1
+      print >> out, '%-40s already in the compact format' % name
+      continue
+    if r['Error'] is not None:
+      failed += 1
+      print >> out, '%-40s %s' % (name, r['Error'])
+      continue
+    for c in columns:
+      totals[c] += r[c]
+    print >> out, '%-40s %10d %10d %8.1fms %8.1fms %8.1fms %8.1fms %8.1fms' % \
+          tuple([name] + [r[c] for c in columns[:2]] + [r[c] * 1000 for c in columns[2:]])
+
+  print >> out, '%-40s %10d %10d %8.1fms %8.1fms %8.1fms %8.1fms %8.1fms' % \
+        tuple(['Total'] + [totals[c] for c in columns[:2]] + [totals[c] * 1000 for c in columns[2:]])
+  print >> out, '%d converted, %d skipped, %d failed' % (len(reports) - failed - skipped, skipped,
+                                                       failed)
+  return failed
+
+def main(args):
+  parser = optparse.OptionParser(usage='%prog [options] file-or-folder ...',
+                                 description='Upgrade pickled tournament files to the compact '
+                                 'format after checking the scores, place winners, and bout '
+                                 'counts match.')
+  parser.add_option('-o', '--output', dest='outdir', default=None,
+                    help='write the converted files to this folder instead of replacing them')
+  parser.add_option('-n', '--dry-run', dest='write', action='store_false', default=True,
+                    help='check and time the files without writing anything')
+  parser.add_option('-j', '--processes', dest='processes', type='int', default=0,
+                    help='number of processes to use, 0 for one per CPU')
+  options, paths = parser.parse_args(args)
+  if paths == []:
+    parser.error('no files or folders given')
+
+  reports = ConvertFiles(FindFiles(paths), options.outdir, options.write, options.processes)
+  return PrintReports(reports) != 0
+
+if __name__ == '__main__':
+  # let worker processes start from a frozen executable
+  if multiprocessing is not None:
+    multiprocessing.freeze_support()
+  sys.exit(main(sys.argv[1:]))
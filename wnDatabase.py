@@ -0,0 +1,336 @@
+'''
+The database module keeps a tournament in a single SQLite file as an alternative to the compact file
+format. The file has tables for the teams, wrestlers, entries, and the results credited to each
+wrestler, with indexes on weight, team, and wrestler name. A database writer listens to the
+tournament and commits every change as its own small transaction, so the file is always up to date
+and another process can open it read-only to answer questions with queries while the tournament
+goes on. SQLite is optional. Without it, database files cannot be opened or saved.
+'''
+import cPickle
+import os
+try:
+  import sqlite3
+except ImportError:
+  sqlite3 = None
+
+from wnEvents import wnTournamentEventReceivable
+from wnJournal import isListed
+import wnSettings
+import wnStorage
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS header (key TEXT PRIMARY KEY, value BLOB);
+CREATE TABLE IF NOT EXISTS teams (id INTEGER PRIMARY KEY, name TEXT, point_adjust REAL,
+                                  listed INTEGER);
+CREATE TABLE IF NOT EXISTS wrestlers (id INTEGER PRIMARY KEY, team INTEGER, name TEXT, weight TEXT,
+                                      listed INTEGER);
+CREATE TABLE IF NOT EXISTS entries (weight TEXT, round TEXT, name, wrestler INTEGER, type TEXT,
+                                    pin_time INTEGER, win_score INTEGER, lose_score INTEGER,
+                                    is_scoring INTEGER, PRIMARY KEY (weight, round, name));
+CREATE TABLE IF NOT EXISTS results (wrestler INTEGER, round TEXT, entry, type TEXT,
+                                    pin_time INTEGER, win_score INTEGER, lose_score INTEGER,
+                                    PRIMARY KEY (wrestler, round, entry));
+CREATE INDEX IF NOT EXISTS teams_name ON teams (name);
+CREATE INDEX IF NOT EXISTS wrestlers_team ON wrestlers (team);
+CREATE INDEX IF NOT EXISTS wrestlers_name ON wrestlers (name);
+CREATE INDEX IF NOT EXISTS wrestlers_weight ON wrestlers (weight);
+CREATE INDEX IF NOT EXISTS entries_wrestler ON entries (wrestler);
+CREATE INDEX IF NOT EXISTS results_type ON results (type, pin_time);
+'''
+
+class wnDatabaseError(Exception):
+  '''Raised when a database file cannot be used.'''
+  pass
+
+def IsDatabase(filename):
+  '''Tell if a file name is for a tournament database.'''
+  return filename.lower().endswith(wnSettings.database_extension)
+
+def Load(filename, ids=None):
+  '''Load a tournament from a database file. When an ids dictionary is given, it is filled with the
+  row of every team and wrestler object, so a writer can be attached without writing the whole
+  tournament again.'''
+  reader = wnDatabaseReader(filename)
+  try:
+    rows = []
+    objects = []
+    tourn = wnStorage.BuildTournament(reader.GetSections(rows), objects=objects)
+  finally:
+    reader.Close()
+  if ids is not None:
+    ids.update(zip(objects, rows))
+  return tourn
+
+def Save(tournament, filename):
+  '''Save a whole tournament to a database file, replacing what it held.'''
+  wnDatabaseWriter(tournament, filename).Close()
+
+def encodeResult(type, args):
+  '''Split a result type and factory value into the type, pin time, and decision score columns.'''
+  if type == 'Pin':
+    return (type, args, None, None)
+  elif type == 'Decision':
+    return (type, None, args[0], args[1])
+  return (type, None, None, None)
+
+def decodeResult(type, pin_time, win_score, lose_score):
+  '''Get the result type and factory value back from their columns.'''
+  if type == 'Pin':
+    return (type, pin_time)
+  elif type == 'Decision':
+    return (type, (win_score, lose_score))
+  return (type, None)
+
+class wnDatabaseReader(object):
+  '''The database reader answers questions about the tournament in a database file. It only runs
+  queries and never creates or changes anything, so it can be used from another process while the
+  tournament is being run.'''
+  def __init__(self, filename):
+    # connecting to a missing file would create it
+    if not os.path.exists(filename):
+      raise wnDatabaseError('There is no database file %s.' % filename)
+    self.connect(filename)
+
+  def connect(self, filename):
+    if sqlite3 is None:
+      raise wnDatabaseError('Tournament databases need the sqlite3 module.')
+    self.db = sqlite3.connect(filename)
+    self.db.text_factory = str
+
+  def Close(self):
+    self.db.close()
+
+  def GetTeamResults(self, team):
+    '''Get the results credited to the wrestlers of a team. Return a list of (weight, wrestler,
+    round, result type, result value) tuples sorted by weight and wrestler.'''
+    rows = self.db.execute('SELECT w.weight, w.name, r.round, r.type, r.pin_time, r.win_score, '
+                           'r.lose_score FROM results r JOIN wrestlers w ON r.wrestler = w.id '
+                           'JOIN teams t ON w.team = t.id WHERE t.name = ? AND t.listed '
+                           'ORDER BY w.weight, w.name, r.round', (team,))
+    return [tuple(r[:3]) + decodeResult(*r[3:]) for r in rows]
+
+  def GetPins(self, max_time=None):
+    '''Get the pins of wrestlers still on a team, fastest first, or only those no longer than the
+    given time in seconds. Return a list of (pin time, wrestler, team, weight, round) tuples.'''
+    query = 'SELECT r.pin_time, w.name, t.name, w.weight, r.round FROM results r ' \
+            'JOIN wrestlers w ON r.wrestler = w.id JOIN teams t ON w.team = t.id ' \
+            'WHERE r.type = ? AND w.listed AND t.listed'
+    args = ['Pin']
+    if max_time is not None:
+      query += ' AND r.pin_time <= ?'
+      args.append(max_time)
+    return self.db.execute(query + ' ORDER BY r.pin_time, w.name', args).fetchall()
+
+  def GetWrestlers(self, weight=None, team=None):
+    '''Get the wrestlers on teams, optionally only those in a weight class or on a team. Return a
+    list of (weight, wrestler, team) tuples.'''
+    query = 'SELECT w.weight, w.name, t.name FROM wrestlers w JOIN teams t ON w.team = t.id ' \
+            'WHERE w.listed AND t.listed'
+    args = []
+    if weight is not None:
+      query += ' AND w.weight = ?'
+      args.append(weight)
+    if team is not None:
+      query += ' AND t.name = ?'
+      args.append(team)
+    return self.db.execute(query + ' ORDER BY w.weight, t.name, w.name', args).fetchall()
+
+  def GetSections(self, ids=None):
+    '''Get the plain data sections of the tournament in the same form as the storage module. When
+    an ids list is given, it is filled with the rows of the teams and then of the wrestlers in the
+    order of the sections.'''
+    # a file no writer has set up has no tables
+    try:
+      rows = self.db.execute('SELECT key, value FROM header').fetchall()
+    except sqlite3.DatabaseError:
+      rows = []
+    header = dict([(key, cPickle.loads(str(value))) for key, value in rows])
+    if header == {}:
+      raise wnDatabaseError('The database holds no tournament.')
+
+    # rows are numbered again in order so the wrestler numbers in the entries can be mapped
+    teams = []
+    team_index = {}
+    team_ids = []
+    for id, name, adjust, listed in self.db.execute('SELECT id, name, point_adjust, listed '
+                                                    'FROM teams ORDER BY id'):
+      team_index[id] = len(teams)
+      team_ids.append(id)
+      teams.append((name, adjust, bool(listed), {}))
+
+    results = {}
+    for row in self.db.execute('SELECT wrestler, entry, round, type, pin_time, win_score, '
+                               'lose_score FROM results ORDER BY wrestler, entry, round'):
+      results.setdefault(row[0], []).append(((row[1], row[2]),) + decodeResult(*row[3:]))
+
+    wrestlers = []
+    wrestler_index = {}
+    wrestler_ids = []
+    for id, team, name, weight, listed in self.db.execute('SELECT id, team, name, weight, listed '
+                                                          'FROM wrestlers ORDER BY id'):
+      wrestler_index[id] = len(wrestlers)
+      wrestler_ids.append(id)
+      wrestlers.append((team_index[team], name, weight, bool(listed), results.get(id, [])))
+
+    entries = dict([(weight, []) for weight in header['Weights']])
+    for row in self.db.execute('SELECT weight, round, name, wrestler, type, pin_time, win_score, '
+                               'lose_score, is_scoring FROM entries ORDER BY rowid'):
+      weight, round, name, w = row[:4]
+      result = None
+      if row[4] is not None:
+        result = decodeResult(*row[4:8])
+      if w is None:
+        w = -1
+      else:
+        w = wrestler_index[w]
+      entries[weight].append((round, name, w, result, bool(row[8])))
+
+    if ids is not None:
+      ids += team_ids + wrestler_ids
+
+    return [header, {'Teams' : teams, 'Wrestlers' : wrestlers}] + \
+           [{'Name' : weight, 'Entries' : entries[weight]} for weight in header['Weights']]
+
+class wnDatabaseWriter(wnDatabaseReader, wnTournamentEventReceivable):
+  '''The database writer keeps a database file in step with a tournament. Creating a writer
+  replaces what the file held with the whole tournament, unless it is given the rows of a tournament
+  just loaded from the file. After that, every entry, team, or wrestler change is written and
+  committed on its own, except that a batch of changes, like all the entries a result moves
+  wrestlers into, is committed once at its end. The writer is the only one to create the
+  tables.'''
+  def __init__(self, tournament, filename, ids=None):
+    self.connect(filename)
+    # readers and the writer don't block each other in write-ahead log mode, which is kept in the
+    # file for the readers
+    self.db.execute('PRAGMA journal_mode=WAL')
+    self.db.executescript(SCHEMA)
+    self.tournament = tournament
+    self.batch = False
+    if ids is None:
+      self.ids = {}
+      self.WriteAll()
+    else:
+      self.ids = ids
+    tournament.AddListener(self)
+
+  def Close(self):
+    self.tournament.RemoveListener(self)
+    wnDatabaseReader.Close(self)
+
+  def WriteAll(self):
+    '''Replace the contents of the database with the whole tournament in one transaction.'''
+    numbers = {}
+    sections = wnStorage.GetSections(self.tournament, numbers)
+    header, people = sections[:2]
+    db = self.db
+    for table in ['header', 'teams', 'wrestlers', 'entries', 'results']:
+      db.execute('DELETE FROM ' + table)
+
+    db.executemany('INSERT INTO header VALUES (?, ?)',
+                   [(key, sqlite3.Binary(cPickle.dumps(value, 2))) for key, value in header.items()])
+    teams = people['Teams']
+    db.executemany('INSERT INTO teams VALUES (?, ?, ?, ?)',
+                   [(i, teams[i][0], teams[i][1], teams[i][2]) for i in range(len(teams))])
+    wrestlers = people['Wrestlers']
+    rows = []
+    for i in range(len(wrestlers)):
+      team, name, weight, listed, results = wrestlers[i]
+      rows.append((i, team, name, weight, listed))
+      db.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                     [(i, round, entry) + encodeResult(type, args)
+                      for (entry, round), type, args in results])
+    db.executemany('INSERT INTO wrestlers VALUES (?, ?, ?, ?, ?)', rows)
+
+    for s in sections[2:]:
+      rows = []
+      for round, name, w, result, is_scoring in s['Entries']:
+        if w < 0:
+          w = None
+        if result is None:
+          result = (None, None)
+        rows.append((s['Name'], round, name, w) + encodeResult(*result) + (is_scoring,))
+      db.executemany('INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', rows)
+    db.commit()
+
+    # remember the rows of the objects so changes can be written to them
+    self.ids = numbers
+
+  def commit(self):
+    '''Commit the changes written so far unless a batch of changes is still going on.'''
+    if not self.batch:
+      self.db.commit()
+
+  def getTeamId(self, team):
+    '''Get the row of a team, adding one for a team the database does not have yet.'''
+    try:
+      return self.ids[team]
+    except KeyError:
+      listed = self.tournament.Teams.get(team.Name) is team
+      cursor = self.db.execute('INSERT INTO teams (name, point_adjust, listed) VALUES (?, ?, ?)',
+                               (team.Name, team.PointAdjust, listed))
+      self.ids[team] = cursor.lastrowid
+      return cursor.lastrowid
+
+  def getWrestlerId(self, wrestler):
+    '''Get the row of a wrestler, adding one for a wrestler the database does not have yet.'''
+    try:
+      return self.ids[wrestler]
+    except KeyError:
+      cursor = self.db.execute('INSERT INTO wrestlers (team, name, weight, listed) '
+                               'VALUES (?, ?, ?, ?)', (self.getTeamId(wrestler.Team),
+                               wrestler.Name, wrestler.Weight, isListed(wrestler)))
+      self.ids[wrestler] = cursor.lastrowid
+      return cursor.lastrowid
+
+  def OnEntryChange(self, entry):
+    '''Write the wrestler and result in an entry and move the result credited to its wrestler.'''
+    db = self.db
+    key = (entry.Weight, entry.Parent.Name, entry.Name)
+
+    # the wrestler that held the entry loses the result it had there
+    row = db.execute('SELECT wrestler FROM entries WHERE weight = ? AND round = ? AND name = ?',
+                     key).fetchone()
+    if row is not None and row[0] is not None:
+      db.execute('DELETE FROM results WHERE wrestler = ? AND round = ? AND entry = ?',
+                 (row[0], key[1], key[2]))
+
+    w = None
+    if entry.Wrestler is not None:
+      w = self.getWrestlerId(entry.Wrestler)
+    result = (None, None, None, None)
+    if entry.Result is not None:
+      result = encodeResult(entry.Result.Name, entry.Result.Args)
+      if w is not None:
+        db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+                   (w, key[1], key[2]) + result)
+
+    # empty entries are left out like they are in other files
+    if w is None and entry.Result is None and entry.is_scoring:
+      db.execute('DELETE FROM entries WHERE weight = ? AND round = ? AND name = ?', key)
+    else:
+      db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                 key + (w,) + result + (entry.is_scoring,))
+    self.commit()
+
+  def OnWeightChange(self, weight):
+    self.db.execute('INSERT OR REPLACE INTO header VALUES (?, ?)',
+                    ('Weights', sqlite3.Binary(cPickle.dumps(self.tournament.Weights, 2))))
+    self.commit()
+
+  def OnTeamChange(self, team, old_name):
+    listed = self.tournament.Teams.get(team.Name) is team
+    self.db.execute('UPDATE teams SET name = ?, point_adjust = ?, listed = ? WHERE id = ?',
+                    (team.Name, team.PointAdjust, listed, self.getTeamId(team)))
+    self.commit()
+
+  def OnWrestlerChange(self, wrestler, old_name):
+    self.db.execute('UPDATE wrestlers SET name = ?, listed = ? WHERE id = ?',
+                    (wrestler.Name, isListed(wrestler), self.getWrestlerId(wrestler)))
+    self.commit()
+
+  def OnBeginChanges(self):
+    self.batch = True
+
+  def OnEndChanges(self):
+    self.batch = False
+    self.db.commit()
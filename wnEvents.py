@@ -79,6 +79,33 @@ class wnMatchMenuReceivable:
   def OnDeleteAll(self, event):
     pass
   
+class wnTournamentEventReceivable:
+  '''Defines an interface that must be implemented for an object to receive change notifications
+  from a tournament.'''
+  def OnEntryChange(self, entry):
+    pass
+  
+  def OnScoreChange(self, name, old, new):
+    pass
+  
+  def OnFallChange(self, wrestler):
+    pass
+  
+  def OnTeamChange(self, team, old_name):
+    pass
+  
+  def OnWrestlerChange(self, wrestler, old_name):
+    pass
+  
+  def OnWeightChange(self, weight):
+    pass
+  
+  def OnBeginChanges(self):
+    pass
+  
+  def OnEndChanges(self):
+    pass
+  
 class wnEventManager(wx.EvtHandler):
   def __init__(self, painter):
     wx.EvtHandler.__init__(self)
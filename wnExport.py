@@ -41,11 +41,10 @@ class wnExportPlainText(object):
     
     # now save the fast fall leader
     self.file.write('--- Fastest Fall Winner ---\n')
-    ff = self.tournament.CalcFastFall()
-    try:
-      leader = ff[0]
+    leader = self.tournament.GetFastFallLeader()
+    if leader is None:
+      self.file.write('No winner')
+    else:
       text = '%s from %s\n%s lbs, %d pins, %s' % (leader.Name, leader.Team,
                                                   leader.Weight, leader.Pins, leader.TimeText)
-      self.file.write(text)
-    except:
-      self.file.write('No winner')
\ No newline at end of file
+      self.file.write(text)
\ No newline at end of file
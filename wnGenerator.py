@@ -0,0 +1,216 @@
+'''
+The generator module writes tournament layouts for draws of 8, 16, 32, 64, or 128 seeds, so big
+opens do not need their seed orders and win and lose maps written by hand. A generated layout has
+the usual championship bracket with the seeds in standard order, so the top seeds meet as late as
+possible. The losers of the championship rounds from a given round on wrestle back through a
+consolation bracket for third place. The losers that drop in are crossed over from one round to the
+next, so wrestlers from the same part of the bracket do not meet again right away. Bouts for fifth
+and seventh place can be added too.
+
+Generated layouts are checked like any other layout and are written in the same form as the files
+in the layouts folder, where the wizard picks them up.
+
+usage: python wnGenerator.py [options] seeds filename
+'''
+import optparse
+import sys
+import yaml
+
+from wnBuilder import ValidateLayout, wnLayoutError
+
+# names of the championship rounds by their number of entries
+ROUND_NAMES = {2 : 'Finals', 4 : 'Semi-Finals', 8 : 'Quarter-Finals', 16 : 'Sixteen',
+               32 : 'Thirty-Two', 64 : 'Sixty-Four', 128 : 'One Twenty-Eight'}
+ORDINALS = ['First', 'Second', 'Third', 'Fourth', 'Fifth', 'Sixth', 'Seventh', 'Eighth', 'Ninth',
+            'Tenth']
+PLACE_WORDS = {2 : 'two', 4 : 'four', 6 : 'six', 8 : 'eight'}
+
+def GetSeedOrder(seeds):
+  '''Get the seed numbers in bracket order for a draw of a power of two, with the pairs of each
+  round adding up to one more than the number of entries in that round.'''
+  order = [1]
+  size = 1
+  while size < seeds:
+    size *= 2
+    pairs = []
+    for i in range(len(order)):
+      # swap every other pair so the top seeds are kept in opposite halves
+      if i % 2 == 0:
+        pairs += [order[i], size + 1 - order[i]]
+      else:
+        pairs += [size + 1 - order[i], order[i]]
+    order = pairs
+  return order
+
+def GenerateLayout(seeds, double=None, places=6, name=None, description=None):
+  '''Generate the data of a layout, as from a layout file. The losers of the championship round with
+  the double number of entries and of every later round up to the semi-finals wrestle back. The
+  default is for double-elimination to begin immediately. Places can be two, four, six, or eight.
+  Raise a wnLayoutError if the bracket cannot be made.'''
+  if seeds < 8 or not ROUND_NAMES.has_key(seeds):
+    raise wnLayoutError('Layouts can be generated for 8, 16, 32, 64, or 128 seeds, not %s.' % seeds)
+  if not PLACE_WORDS.has_key(places):
+    raise wnLayoutError('Layouts can award two, four, six, or eight places, not %s.' % places)
+  if double is None:
+    double = seeds
+  lowest = [4, 8][places > 4]
+  if places > 2 and (not ROUND_NAMES.has_key(double) or double > seeds or double < lowest):
+    raise wnLayoutError('Double-elimination for %d places must begin in a round of %d to %d '
+                        'entries, not %s.' % (places, lowest, seeds, double))
+
+  rounds = []
+  def addRound(adv, place, entries, name=None):
+    r = {'Name' : name, 'Adv Points' : adv, 'Place Points' : place, 'Entries' : entries}
+    rounds.append(r)
+    return r
+  def link(r, kind, target, order):
+    # rounds are linked by the round itself until they all have names
+    r[kind + ' Round'] = target
+    r[kind + ' Order'] = order
+
+  # the championship bracket halves every round
+  seed_order = GetSeedOrder(seeds)
+  champ = [addRound(0, 0, seed_order, ROUND_NAMES[seeds] + ' Champion')]
+  size = seeds / 2
+  while size > 1:
+    place = 0
+    if size == 2:
+      place = 9
+    elif size == 4 and places > 4:
+      place = 3
+    champ.append(addRound(2, place, size, ROUND_NAMES[size] + ' Champion'))
+    size /= 2
+  champ.append(addRound(0, 4, 1, 'First Place'))
+  for i in range(len(champ) - 1):
+    link(champ[i], 'Win', champ[i+1], halve(entryCount(champ[i])))
+
+  if places > 2:
+    # the losers of the first round to wrestle back start the consolation bracket
+    drops = [r for r in champ if 4 <= entryCount(r) <= double]
+    cons = [addRound(1, 0, double / 2)]
+    link(drops[0], 'Lose', cons[0], halve(double))
+
+    reverse = True
+    for r in drops[1:]:
+      size = entryCount(r)
+      while cons[-1]['Entries'] > size:
+        cons.append(addRound(1, 0, cons[-1]['Entries'] / 2))
+        link(cons[-2], 'Win', cons[-1], halve(cons[-2]['Entries']))
+
+      # the winners so far take the even positions and the losers dropping in the odd ones
+      merged = addRound(1, 0, size)
+      link(cons[-1], 'Win', merged, [i / 2 * 2 for i in range(size)])
+      pairs = range(size / 2)
+      if reverse:
+        pairs.reverse()
+      link(r, 'Lose', merged, [pairs[i / 2] * 2 + 1 for i in range(size)])
+      reverse = not reverse
+      cons.append(merged)
+    while cons[-1]['Entries'] > 2:
+      cons.append(addRound(1, 0, cons[-1]['Entries'] / 2))
+      link(cons[-2], 'Win', cons[-1], halve(cons[-2]['Entries']))
+
+    # the last rounds are named for what they lead to and the earlier ones are counted
+    names = ['Finals Consolation', 'Semi-Finals Consolation', 'Quarter-Finals Consolation']
+    for i in range(len(cons)):
+      if len(cons) - 1 - i < len(names):
+        cons[i]['Name'] = names[len(cons) - 1 - i]
+      else:
+        cons[i]['Name'] = '%s Consolation' % ORDINALS[i]
+    cons[-1]['Place Points'] = 4
+    if places > 4:
+      cons[-2]['Place Points'] = 3
+    link(cons[-1], 'Win', addRound(0, 2, 1, 'Third Place'), [0, 0])
+
+    # the losers of the consolation semi-finals and quarter-finals wrestle for the lower places
+    for place, points, index in [(5, 2, -2), (7, 1, -3)][:places / 2 - 2]:
+      ordinal = ORDINALS[place - 1]
+      final = addRound(0, 0, 2, 'Finals %s' % ordinal)
+      link(cons[index], 'Lose', final, halve(4))
+      link(final, 'Win', addRound(0, points, 1, '%s Place' % ordinal), [0, 0])
+
+  for r in rounds:
+    for key in ['Win Round', 'Lose Round']:
+      if r.has_key(key):
+        r[key] = r[key]['Name']
+
+  if name is None:
+    name = '%d-Man Bracket' % seeds
+  if description is None:
+    if places == 2:
+      start = 'there are no wrestle-backs'
+    elif double == seeds:
+      start = 'double-elimination begins immediately'
+    else:
+      start = 'double-elimination begins in the %s' % {4 : 'semi finals', 8 : 'quarter finals'}.get(
+        double, 'round of %d' % double)
+    description = 'A generated bracket format. The outbracket has %d seed slots, and %s. There ' \
+                  'are %s places.' % (seeds, start, PLACE_WORDS[places])
+  data = {'Name' : name, 'Description' : description, 'Seeds' : seed_order, 'Rounds' : rounds}
+  ValidateLayout(data)
+  return data
+
+def entryCount(r):
+  if type(r['Entries']) == list:
+    return len(r['Entries'])
+  return r['Entries']
+
+def halve(size):
+  '''Get the map sending the winner of each pair in a round to the next round in order.'''
+  return [i / 2 for i in range(size)]
+
+def FormatLayout(data):
+  '''Write layout data as YAML in the form of the layout files, with the seeds given once.'''
+  def quote(value):
+    # let YAML quote any text that needs it
+    return yaml.safe_dump(value, width=1000).split('\n')[0]
+  def flow(values):
+    return '[%s]' % ', '.join([str(v) for v in values])
+
+  lines = ['---', 'Name: %s' % quote(data['Name']), 'Description: %s' % quote(data['Description']),
+           'Seeds: &seeds %s' % flow(data['Seeds']), 'Rounds:']
+  for r in data['Rounds']:
+    entries = r['Entries']
+    if entries == data['Seeds']:
+      entries = '*seeds'
+    elif type(entries) == list:
+      entries = flow(entries)
+    lines += ['  - Name: %s' % quote(r['Name']),
+              '    Adv Points: %s' % r['Adv Points'],
+              '    Place Points: %s' % r['Place Points'],
+              '    Entries: %s' % entries]
+    for kind in ['Win', 'Lose']:
+      if r.has_key(kind + ' Round'):
+        lines += ['    %s Round: %s' % (kind, quote(r[kind + ' Round'])),
+                  '    %s Order: %s' % (kind, flow(r[kind + ' Order']))]
+  return '\n'.join(lines) + '\n'
+
+def main(args):
+  parser = optparse.OptionParser(usage='%prog [options] seeds filename',
+                                 description='Generate a tournament layout for a draw of 8, 16, 32, '
+                                 '64, or 128 seeds and write it to a layout file.')
+  parser.add_option('-d', '--double', dest='double', type='int', default=None,
+                    help='the number of entries in the first round whose losers wrestle back, '
+                    'all seeds by default')
+  parser.add_option('-p', '--places', dest='places', type='int', default=6,
+                    help='the number of places awarded, 2, 4, 6, or 8 (default 6)')
+  parser.add_option('-n', '--name', dest='name', default=None,
+                    help='the name of the layout shown in the new tournament wizard')
+  options, args = parser.parse_args(args)
+  if len(args) != 2:
+    parser.error('give the number of seeds and a file name')
+  try:
+    data = GenerateLayout(int(args[0]), options.double, options.places, options.name)
+  except (ValueError, wnLayoutError), e:
+    parser.error(str(e))
+
+  f = file(args[1], 'w')
+  try:
+    f.write(FormatLayout(data))
+  finally:
+    f.close()
+  print '%s: %d rounds' % (args[1], len(data['Rounds']))
+  return 0
+
+if __name__ == '__main__':
+  sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,252 @@
+'''
+The journal module keeps a write-ahead journal beside a saved tournament so the changes made since the
+last save survive a crash. The journal listens to the tournament and appends one small record for
+every entry, wrestler, or team that changes. Each record is flushed to disk before the program goes
+on, so the cost of keeping the journal does not grow with the size of the tournament.
+
+A journal file starts with a magic string and the format version. The first record is a full
+snapshot of the tournament in the compact storage format and the rest describe the changes made
+after it. Records are a length followed by a pickle of plain lists, tuples, strings, and numbers.
+Recovery loads the snapshot and replays the changes on top of it. Once enough changes pile up, the
+journal is compacted by replacing it with a new snapshot.
+'''
+import cPickle
+import os
+import struct
+
+from wnEvents import wnTournamentEventReceivable
+from wnScoreData import wnResultFactory
+from wnTeamData import wnTeam, wnWrestler
+import wnSettings
+import wnStorage
+
+MAGIC = 'WNJL'
+VERSION = 1
+
+def GetJournalName(filename):
+  '''Get the name of the journal file kept for a saved tournament.'''
+  return filename + wnSettings.journal_extension
+
+def Exists(filename):
+  '''Tell if a journal was left behind for a saved tournament, meaning the program did not close
+  cleanly while the tournament was open.'''
+  return os.path.exists(GetJournalName(filename))
+
+def ReadRecords(filename):
+  '''Read all the complete records in a journal file. A record cut short by a crash is dropped.'''
+  f = file(filename, 'rb')
+  try:
+    data = f.read()
+  finally:
+    f.close()
+  if not data.startswith(MAGIC):
+    raise wnStorage.wnStorageError('The file is not a journal.')
+  pos = len(MAGIC)
+  version = struct.unpack('<H', data[pos:pos+2])[0]
+  if version > VERSION:
+    raise wnStorage.wnStorageError('The journal was written in format version %d, but only '
+                                   'versions up to %d can be read.' % (version, VERSION))
+  pos += 2
+
+  records = []
+  while pos + 4 <= len(data):
+    size = struct.unpack('<I', data[pos:pos+4])[0]
+    pos += 4
+    if pos + size > len(data): break
+    records.append(cPickle.loads(data[pos:pos+size]))
+    pos += size
+  return records
+
+def Recover(filename):
+  '''Rebuild the tournament kept in the journal for a saved tournament.'''
+  records = ReadRecords(GetJournalName(filename))
+  tourn = wnStorage.Loads(records[0][1])
+  wnReplay(tourn).Apply(records[1:])
+  return tourn
+
+def isListed(wrestler):
+  '''Tell if a wrestler is in the list of its team. Wrestlers taken off a team stay in the brackets
+  they reached.'''
+  for w in wrestler.Team.wrestlers.get(wrestler.Weight, []):
+    if w is wrestler:
+      return True
+  return False
+
+class wnReplay(object):
+  '''The replay class applies journal records to a tournament. Records are applied to the bracket
+  and team data directly and the cached scoring state is rebuilt once at the end.'''
+  def __init__(self, tournament):
+    self.tournament = tournament
+    self.entries = {}
+
+    # index the teams and wrestlers by name, including those only left in the brackets
+    self.teams = dict(tournament.Teams)
+    self.wrestlers = {}
+    for t in tournament.Teams.values():
+      for w in t.Wrestlers:
+        self.addWrestler(w, True)
+    for wc in tournament.weight_classes.values():
+      for r in wc.Rounds:
+        for e in wc.GetRound(r).entries:
+          w = e.Wrestler
+          if w is not None and not isListed(w):
+            self.teams.setdefault(w.Team.Name, w.Team)
+            self.addWrestler(w, False)
+
+  def Apply(self, records):
+    '''Apply a list of records and rebuild the scores.'''
+    for record in records:
+      getattr(self, 'apply' + record[0])(*record[1:])
+    self.tournament.Reindex()
+
+  def addWrestler(self, w, listed):
+    self.wrestlers[(id(w.Team), w.Weight, w.Name, listed)] = w
+
+  def getTeam(self, name):
+    '''Get a team by name, making an unlisted one if it is not known.'''
+    try:
+      return self.teams[name]
+    except KeyError:
+      t = wnTeam(name, self.tournament)
+      self.teams[name] = t
+      return t
+
+  def getWrestler(self, team, weight, name, listed):
+    '''Get a wrestler by team, weight, and name, making one if it is not known. A wrestler taken
+    off a team can have the same name as one still on it, so a wrestler with the given listing is
+    looked for first.'''
+    t = self.getTeam(team)
+    for key in [(id(t), weight, name, listed), (id(t), weight, name, not listed)]:
+      if self.wrestlers.has_key(key):
+        return self.wrestlers[key]
+    w = wnWrestler(name, weight, t)
+    self.addWrestler(w, listed)
+    return w
+
+  def applyTeam(self, old_name, name, adjust, listed):
+    teams = self.tournament.teams
+    t = None
+    if old_name is not None:
+      t = self.teams.get(old_name)
+    if t is None:
+      t = wnTeam(name, self.tournament)
+    if teams.get(old_name) is t:
+      del teams[old_name]
+
+    t.name = name
+    t.point_adjust = adjust
+    self.teams[name] = t
+    if listed:
+      teams[name] = t
+
+  def applyWrestler(self, team, weight, old_name, name, listed):
+    t = self.getTeam(team)
+    if old_name is None:
+      w = wnWrestler(name, weight, t)
+    else:
+      # a wrestler taken off a team keeps its name, a renamed one keeps its listing
+      w = self.getWrestler(team, weight, old_name, listed or old_name == name)
+    w.name = name
+    self.addWrestler(w, listed)
+
+    # add the wrestler to the team list or take it out
+    present = isListed(w)
+    if listed and not present:
+      t.wrestlers.setdefault(weight, []).append(w)
+    elif not listed and present:
+      w_list = t.wrestlers[weight]
+      w_list[:] = [x for x in w_list if x is not w]
+      if w_list == []:
+        del t.wrestlers[weight]
+
+  def applyWeight(self, name):
+    self.tournament.AddWeightClass(name)
+
+  def applyEntry(self, weight, round, name, wrestler, result, is_scoring):
+    key = (weight, round)
+    if not self.entries.has_key(key):
+      r = self.tournament.GetWeightClass(weight).GetRound(round)
+      self.entries[key] = dict([(e.Name, e) for e in r.entries])
+    e = self.entries[key][name]
+
+    # the wrestlers keep their own copy of the result in the entry
+    if e.wrestler is not None:
+      e.wrestler.results.pop(e.ID, None)
+    e.wrestler = None
+    e.result = None
+    if wrestler is not None:
+      e.wrestler = self.getWrestler(wrestler[0], weight, wrestler[1], wrestler[2])
+    if result is not None:
+      e.result = wnResultFactory.Create(*result)
+    e.is_scoring = is_scoring
+    if e.wrestler is not None and e.result is not None:
+      e.wrestler.results[e.ID] = e.result
+
+class wnJournal(wnTournamentEventReceivable):
+  '''The journal class records the changes to a tournament in the journal file of a saved
+  tournament. Creating a journal writes a snapshot of the tournament to start the file.'''
+  def __init__(self, tournament, filename):
+    self.tournament = tournament
+    self.filename = GetJournalName(filename)
+    self.file = None
+    self.count = 0
+    self.Compact()
+    tournament.AddListener(self)
+
+  def Compact(self):
+    '''Replace the journal with one holding only a snapshot of the tournament as it is now. The new
+    journal is written beside the old one and moved over it, so a crash leaves one or the other.'''
+    if self.file is not None:
+      self.file.close()
+    temp = self.filename + '.tmp'
+    f = file(temp, 'wb')
+    f.write(MAGIC + struct.pack('<H', VERSION))
+    self.write(f, ('Snapshot', wnStorage.Dumps(self.tournament)))
+    f.close()
+    wnStorage.ReplaceFile(temp, self.filename)
+
+    self.file = file(self.filename, 'ab')
+    self.count = 0
+
+  def Close(self):
+    '''Stop recording and remove the journal. Call this once the tournament is saved or the changes
+    are to be thrown away.'''
+    self.tournament.RemoveListener(self)
+    if self.file is not None:
+      self.file.close()
+      self.file = None
+      os.remove(self.filename)
+
+  def Record(self, record):
+    '''Append a record to the journal and make sure it reaches the disk.'''
+    self.write(self.file, record)
+    self.count += 1
+    if self.count >= wnSettings.journal_compact_records:
+      self.Compact()
+
+  def write(self, f, record):
+    data = cPickle.dumps(record, 2)
+    f.write(struct.pack('<I', len(data)) + data)
+    f.flush()
+    os.fsync(f.fileno())
+
+  def OnEntryChange(self, entry):
+    w = entry.Wrestler
+    if w is not None:
+      w = (w.Team.Name, w.Name, isListed(w))
+    result = entry.Result
+    if result is not None:
+      result = (result.Name, result.Args)
+    self.Record(('Entry', entry.Weight, entry.Parent.Name, entry.Name, w, result,
+                 entry.is_scoring))
+
+  def OnTeamChange(self, team, old_name):
+    listed = self.tournament.Teams.get(team.Name) is team
+    self.Record(('Team', old_name, team.Name, team.PointAdjust, listed))
+
+  def OnWrestlerChange(self, wrestler, old_name):
+    self.Record(('Wrestler', wrestler.Team.Name, wrestler.Weight, old_name, wrestler.Name,
+                 isListed(wrestler)))
+
+  def OnWeightChange(self, weight):
+    self.Record(('Weight', weight.Name))
@@ -14,6 +14,16 @@ class wnRenderer(object):
   def DrawLine(self, x1, y1, x2, y2):
     pass
   
+  def DrawLines(self, lines):
+    for line in lines:
+      self.DrawLine(*line)
+  
+  def DrawGeometry(self, geometry):
+    '''Draw the bracket lines and seed numbers of a layout.'''
+    self.DrawLines(geometry.Lines)
+    for text, x, y in geometry.Seeds:
+      self.DrawText(text, x, y)
+  
   def DrawText(self, text, x, y):
     pass
   
@@ -35,6 +45,9 @@ class wnPainter(wnRenderer):
 
     self.controls = {}
     self.event_man = wnEventManager(self)
+    
+    # the bracket lines of the last layout drawn, kept as a bitmap
+    self.bitmap = None
 
   def ResetControls(self):
     '''Clean out any stored controls and registered events.'''
@@ -73,6 +86,30 @@ class wnPainter(wnRenderer):
     if self.dc is None: return
     self.dc.DrawLine(x1, y1, x2, y2)
   
+  def DrawLines(self, lines):
+    '''Draw all the bracket lines in one call.'''
+    if self.dc is None: return
+    self.dc.DrawLineList(lines)
+    
+  def DrawGeometry(self, geometry):
+    '''Copy the bracket lines and seed numbers to the screen from a bitmap drawn the first time
+    the layout was, so switching weights or scrolling does not draw them again.'''
+    if self.dc is None: return
+    if self.bitmap is None or self.bitmap[0] is not geometry:
+      w, h = geometry.Size
+      bitmap = wx.EmptyBitmap(w, h)
+      dc = wx.MemoryDC()
+      dc.SelectObject(bitmap)
+      dc.SetBackground(wx.Brush(self.canvas.GetBackgroundColour()))
+      dc.Clear()
+      dc.SetFont(wx.SWISS_FONT)
+      dc.DrawLineList(geometry.Lines)
+      for text, x, y in geometry.Seeds:
+        dc.DrawText(text, x, y)
+      dc.SelectObject(wx.NullBitmap)
+      self.bitmap = (geometry, bitmap)
+    self.dc.DrawBitmap(self.bitmap[1], 0, 0)
+    
   def DrawText(self, text, x, y):
     if self.dc is None: return
     self.dc.SetFont(wx.SWISS_FONT)
@@ -221,6 +258,9 @@ class wnPrinter(wnRenderer):
     if self.dc is None: return
     self.dc.DrawLine(x1, y1, x2, y2)
 
+  def DrawLines(self, lines):
+    if self.dc is None: return
+    self.dc.DrawLineList(lines)
   
   def DrawText(self, text, x, y):
     if self.dc is None: return
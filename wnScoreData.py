@@ -17,6 +17,77 @@ class wnPoints(object):
   AdvPoints = property(fget=GetAdvancementPoints)
   PlacePoints = property(fget=GetPlacementPoints)
   
+class wnLedgerEntry(object):
+  '''The ledger entry class holds the points a wrestler earned from the result of one round. Bye
+  points are deferred until a real match follows them in the same thread and are only credited to
+  the team after that.'''
+  def __init__(self, wrestler, round, result, points):
+    self.wrestler = wrestler
+    self.round = round
+    self.result = result
+    self.adv_points = points.AdvPoints
+    self.place_points = points.PlacePoints
+    self.bonus_points = result.Points
+    self.credited = (result.Name != 'Bye')
+    
+  def __repr__(self):
+    return '<Ledger Wrestler: %s Round: %s Points: %s>' % (self.wrestler.Name, self.round,
+                                                           self.TotalPoints)
+    
+  def GetWrestler(self):
+    return self.wrestler
+  
+  def GetRound(self):
+    return self.round
+  
+  def GetResult(self):
+    return self.result
+  
+  def GetAdvancementPoints(self):
+    return self.adv_points
+  
+  def GetPlacementPoints(self):
+    return self.place_points
+  
+  def GetBonusPoints(self):
+    return self.bonus_points
+  
+  def GetTotalPoints(self):
+    '''Get all the points from this round whether they are credited yet or not.'''
+    return self.adv_points + self.place_points + self.bonus_points
+  
+  def GetPoints(self):
+    '''Get the points from this round credited to the team.'''
+    if self.credited:
+      return self.TotalPoints
+    else:
+      return 0.0
+  
+  def GetDeferredPoints(self):
+    '''Get the bye points from this round still waiting for a real match.'''
+    if self.credited:
+      return 0.0
+    else:
+      return self.TotalPoints
+    
+  def GetIsBye(self):
+    return self.result.Name == 'Bye'
+  
+  def GetIsCredited(self):
+    return self.credited
+  
+  Wrestler = property(fget=GetWrestler)
+  Round = property(fget=GetRound)
+  Result = property(fget=GetResult)
+  AdvPoints = property(fget=GetAdvancementPoints)
+  PlacePoints = property(fget=GetPlacementPoints)
+  BonusPoints = property(fget=GetBonusPoints)
+  TotalPoints = property(fget=GetTotalPoints)
+  Points = property(fget=GetPoints)
+  DeferredPoints = property(fget=GetDeferredPoints)
+  IsBye = property(fget=GetIsBye)
+  IsCredited = property(fget=GetIsCredited)
+  
 class wnResultFactory(object):
   def Create(cls, type, args=None):
     
@@ -46,10 +117,15 @@ class wnResult(object):
   
   def GetValue(self):
     return None
+  
+  def GetArgs(self):
+    '''Get the value the result factory needs to create the same result again.'''
+    return None
     
   Points = property(fget=GetPoints)
   TextValue = property(fget=GetTextValue)
   Value = property(fget=GetValue)
+  Args = property(fget=GetArgs)
     
 class wnResultPin(wnResult):
   '''This class holds information about a pin win.'''
@@ -79,10 +155,14 @@ class wnResultPin(wnResult):
   def GetValue(self):
     return self.pin_time
   
+  def GetArgs(self):
+    return self.pin_time
+  
   Points = property(fget=GetPoints)
   Name = property(fget=GetName)
   Value = property(fget=GetValue)
   TextValue = property(fget=GetTextValue)
+  Args = property(fget=GetArgs)
 
 class wnResultDecision(wnResult):
   '''This class holds information about a decision.'''
@@ -110,10 +190,14 @@ class wnResultDecision(wnResult):
 
   def GetName(self):
     return 'Decision'
+  
+  def GetArgs(self):
+    return (self.win_score, self.lose_score)
 
   TextValue = property(fget=GetTextValue)
   Points = property(fget=GetPoints)
   Name = property(fget=GetName)    
+  Args = property(fget=GetArgs)
     
 class wnResultBye(wnResult):
   '''This class holds information about a bye.'''
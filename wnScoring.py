@@ -0,0 +1,347 @@
+'''
+The scoring module defines the engine that keeps team scores up to date as results are entered. The
+engine listens for entry changes from the tournament and rescores only the threads they touch. The
+leaderboard keeps the teams in score order as their totals change, and the score log remembers the
+changes so score displays can update only what changed. The fall standings keep the fast fall
+table in order as pins are entered.
+'''
+import bisect
+import itertools
+from wnEvents import wnTournamentEventReceivable
+from wnTempData import wnFastFall
+
+# versions are unique across all tournaments so a version from one log is never valid in another
+versions = itertools.count(1)
+
+class wnScoreEngine(wnTournamentEventReceivable):
+  '''The score engine caches the points earned by every scoring thread in a tournament. A thread
+  starts at an entry with no previous entries and follows one wrestler through the win rounds. When
+  an entry changes, only the threads that pass through it are rescored and the difference is applied
+  to the running team totals. The ledger entries of each thread are kept by wrestler so the points
+  of a wrestler and where they came from can be looked up without rescoring.'''
+  def __init__(self, tournament):
+    self.tournament = tournament
+    self.threads = {}
+    self.members = {}
+    self.ledgers = {}
+    self.wrestler_points = {}
+
+  def Reset(self):
+    '''Throw away all cached threads and rescore every weight class from scratch.'''
+    self.threads = {}
+    self.members = {}
+    self.ledgers = {}
+    self.wrestler_points = {}
+    for wc in self.tournament.weight_classes.values():
+      self.RescoreWeight(wc)
+
+  def RescoreWeight(self, weight):
+    '''Rescore all the threads in the given weight class from scratch.'''
+    # find every entry that can start a thread
+    origins = []
+    for r in weight.Rounds:
+      round = weight.GetRound(r)
+      if round.next_win is None: continue
+      for entry in round.entries:
+        if entry.Previous == []:
+          origins.append(entry)
+
+    # forget the threads currently cached for this weight and start it from zero for all teams
+    for origin in origins:
+      self.dropThread(origin)
+    for t in self.tournament.teams.values():
+      t.SetWeightScore(weight.Name, 0.0)
+
+    for origin in origins:
+      self.scoreThread(origin)
+
+  def OnEntryChange(self, entry):
+    '''Rescore the threads that counted this entry before the change and the threads that reach it
+    now. These are usually the same single thread.'''
+    origins = self.members.get(entry, [])[:]
+    for origin in entry.GetThreadOrigins():
+      if origin not in origins:
+        origins.append(origin)
+
+    for origin in origins:
+      self.dropThread(origin)
+      self.scoreThread(origin)
+
+  def GetThreadScore(self, origin):
+    '''Get the cached points for the thread starting at the given entry.'''
+    try:
+      return self.threads[origin][2]
+    except KeyError:
+      return 0.0
+
+  def GetLedger(self, wrestler):
+    '''Get the cached ledger entries of a wrestler from the earliest to the latest round.'''
+    ledgers = self.ledgers.get(wrestler, {})
+    ledger = []
+    for rows in ledgers.values():
+      ledger += rows
+    if ledger == []:
+      return ledger
+
+    # the threads are kept by origin in no order, so sort the rows by the rounds of the weight
+    rounds = ledgers.keys()[0].Parent.Parent.Rounds
+    index = dict(zip(rounds, range(len(rounds))))
+    ledger.sort(key=lambda row: index[row.Round])
+    return ledger
+
+  def GetWrestlerPoints(self, wrestler):
+    '''Get the cached points a wrestler has earned for the team.'''
+    return self.wrestler_points.get(wrestler, 0.0)
+
+  def dropThread(self, origin):
+    '''Remove the cached points of a thread from its team total.'''
+    try:
+      team, wrestler, points, entries = self.threads.pop(origin)
+    except KeyError:
+      return
+
+    team.AddWeightScore(origin.Weight, -points)
+    ledgers = self.ledgers[wrestler]
+    del ledgers[origin]
+    if ledgers == {}:
+      del self.ledgers[wrestler]
+      del self.wrestler_points[wrestler]
+    else:
+      self.wrestler_points[wrestler] -= points
+    for e in entries:
+      origins = self.members[e]
+      origins.remove(origin)
+      if origins == []:
+        del self.members[e]
+
+  def scoreThread(self, origin):
+    '''Score the thread starting at the given entry and add its points to the team total.'''
+    # only threads started by a wrestler in a round that leads somewhere count
+    if origin.Wrestler is None or origin.Parent.next_win is None:
+      return
+
+    entries = origin.GetThread()
+    ledger = origin.CalcThreadLedger(entries)
+    points = 0.0
+    for row in ledger:
+      points += row.Points
+    wrestler = origin.Wrestler
+    team = wrestler.Team
+
+    self.threads[origin] = (team, wrestler, points, entries)
+    team.AddWeightScore(origin.Weight, points)
+    self.ledgers.setdefault(wrestler, {})[origin] = ledger
+    self.wrestler_points[wrestler] = self.wrestler_points.get(wrestler, 0.0) + points
+    for e in entries:
+      self.members.setdefault(e, []).append(origin)
+
+class wnLeaderboard(wnTournamentEventReceivable):
+  '''The leaderboard keeps the teams of a tournament sorted by total score. A team is moved to its
+  new place when its total changes, so the score table, the top teams, the rank of a team, and the
+  teams tied with it are all found without sorting.
+
+  Teams are held in ascending order of (score, name), the reverse of the score table. The row of a
+  team is its position in the score table starting at 1. Its rank is one more than the number of
+  teams with a higher score, so tied teams share a rank.'''
+  def __init__(self, tournament):
+    self.tournament = tournament
+    self.Reset()
+
+  def Reset(self):
+    '''Rebuild the leaderboard from the current team totals.'''
+    self.keys = dict([(name, (t.Score, name)) for name, t in self.tournament.Teams.items()])
+    self.table = self.keys.values()
+    self.table.sort()
+    self.scores = [score for score, name in self.table]
+
+  def OnScoreChange(self, name, old, new):
+    '''Move a team to its place for its new total. A score of None means the team was added or
+    removed.'''
+    if self.keys.has_key(name):
+      key = self.keys.pop(name)
+      i = bisect.bisect_left(self.table, key)
+      del self.table[i]
+      del self.scores[i]
+    elif old is not None:
+      # a team that is no longer in the tournament
+      return
+
+    if new is not None:
+      key = (new, name)
+      i = bisect.bisect_left(self.table, key)
+      self.table.insert(i, key)
+      self.scores.insert(i, new)
+      self.keys[name] = key
+
+  def GetTable(self):
+    '''Get the score table as a list of (score, team name) pairs in descending order.'''
+    table = self.table[:]
+    table.reverse()
+    return table
+
+  def GetTop(self, n):
+    '''Get the first n rows of the score table.'''
+    table = self.table[max(len(self.table)-n, 0):]
+    table.reverse()
+    return table
+
+  def GetScore(self, name):
+    return self.keys[name][0]
+
+  def GetRow(self, name):
+    '''Get the row of a team in the score table, starting at 1.'''
+    return self.CountAbove(self.keys[name]) + 1
+
+  def GetRank(self, name):
+    '''Get the rank of a team. Teams with the same score share a rank.'''
+    return len(self.scores) - bisect.bisect_right(self.scores, self.keys[name][0]) + 1
+
+  def GetTied(self, name):
+    '''Get the names of all the teams with the same score as the given team, including it, in
+    score table order.'''
+    score = self.keys[name][0]
+    names = [n for s, n in self.table[bisect.bisect_left(self.scores, score):
+                                      bisect.bisect_right(self.scores, score)]]
+    names.reverse()
+    return names
+
+  def GetTieGroups(self):
+    '''Get the groups of teams that share a score, in score table order.'''
+    groups = []
+    i = len(self.scores)
+    while i > 0:
+      j = bisect.bisect_left(self.scores, self.scores[i-1])
+      if i - j > 1:
+        names = [n for s, n in self.table[j:i]]
+        names.reverse()
+        groups.append(names)
+      i = j
+    return groups
+
+  def CountAbove(self, key):
+    '''Count the teams placed above the given (score, name) key.'''
+    return len(self.table) - bisect.bisect_right(self.table, key)
+
+class wnScoreLog(wnTournamentEventReceivable):
+  '''The score log numbers every change to a team total and remembers the most recent ones. A
+  score display keeps the version it last showed and asks for the teams whose score or rank has
+  changed since then.'''
+  max_changes = 10000
+
+  def __init__(self, tournament):
+    self.tournament = tournament
+    self.start = versions.next()
+    self.Version = self.start
+    self.versions = []
+    self.changes = []
+
+  def OnScoreChange(self, name, old, new):
+    '''Record a change to the total score of a team. A score of None means the team was added or
+    removed.'''
+    self.Version = versions.next()
+    self.versions.append(self.Version)
+    self.changes.append((name, old, new))
+
+    # forget the oldest half when the log gets long
+    if len(self.changes) > self.max_changes:
+      half = len(self.changes) / 2
+      self.start = self.versions[half-1]
+      del self.versions[:half]
+      del self.changes[:half]
+
+  def GetChanges(self, since):
+    '''Get the teams whose score or rank changed after the given version. Return a list of (team,
+    old score, new score, old rank, new rank) in order of new rank, where a rank of 1 is the first
+    row of the score table. Return None if the version is unknown or teams were added or removed,
+    in which case the whole table must be reloaded.'''
+    if since is None or since < self.start or since > self.Version:
+      return None
+
+    # find the score each changed team had at the given version
+    teams = self.tournament.Teams
+    old_scores = {}
+    for i in range(bisect.bisect_right(self.versions, since), len(self.changes)):
+      name, old, new = self.changes[i]
+      if old is None or new is None:
+        return None
+      if teams.has_key(name) and not old_scores.has_key(name):
+        old_scores[name] = old
+    if old_scores == {}:
+      return []
+
+    # work out the old rows from the current ones without sorting
+    board = self.tournament.leaderboard
+    old_keys = [(old_scores[name], name) for name in old_scores]
+    new_keys = [board.keys[name] for name in old_scores]
+    def old_row(key):
+      above = board.CountAbove(key)
+      above -= len([k for k in new_keys if k > key])
+      above += len([k for k in old_keys if k > key])
+      return above + 1
+
+    # only the teams between the highest and lowest moved rows can have a new row
+    rows = [board.GetRow(name) for name in old_scores] + [old_row(k) for k in old_keys]
+
+    changes = []
+    for i in range(min(rows)-1, max(rows)):
+      new, name = board.table[-i-1]
+      old = old_scores.get(name, new)
+      row = old_row((old, name))
+      if old != new or row != i+1:
+        changes.append((name, old, new, row, i+1))
+    return changes
+
+class wnFallStandings(wnTournamentEventReceivable):
+  '''The fall standings keep the wrestlers with at least one pin sorted for the fast fall award,
+  most pins first and then least total pin time. A wrestler is moved to its new place whenever its
+  pins change, so the leader and the table are ready without sorting.'''
+  def __init__(self, tournament):
+    self.tournament = tournament
+    self.Reset()
+
+  def Reset(self):
+    '''Rebuild the standings from the pins of every wrestler on every team.'''
+    self.count = itertools.count()
+    self.keys = {}
+    self.table = []
+    teams = self.tournament.Teams
+    for name in self.tournament.TeamNames:
+      for w in teams[name].Wrestlers:
+        self.OnFallChange(w)
+
+  def OnFallChange(self, wrestler):
+    '''Move a wrestler to its place for its current pins. Wrestlers without pins and wrestlers no
+    longer on a team are taken out.'''
+    if self.keys.has_key(wrestler):
+      del self.table[bisect.bisect_left(self.table, self.keys.pop(wrestler))]
+
+    if wrestler.Pins > 0 and self.isListed(wrestler):
+      # ties go by name, and the count keeps keys unique so wrestlers are never compared
+      key = (-wrestler.Pins, wrestler.PinTime, wrestler.Name, wrestler.Team.Name,
+             self.count.next(), wrestler)
+      bisect.insort(self.table, key)
+      self.keys[wrestler] = key
+
+  def GetTable(self, n=None):
+    '''Get the fast fall results for the first n wrestlers, or all of them.'''
+    if n is None:
+      n = len(self.table)
+    return [wnFastFall(key[-1], -key[0], key[1]) for key in self.table[:n]]
+
+  def GetLeader(self):
+    '''Get the fast fall result of the leader, or None if nobody has a pin.'''
+    try:
+      key = self.table[0]
+    except IndexError:
+      return None
+    return wnFastFall(key[-1], -key[0], key[1])
+
+  def isListed(self, wrestler):
+    '''Tell if a wrestler is still on a team in the tournament.'''
+    team = wrestler.Team
+    if self.tournament.Teams.get(team.Name) is not team:
+      return False
+    for w in team.wrestlers.get(wrestler.Weight, []):
+      if w is wrestler:
+        return True
+    return False
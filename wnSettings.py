@@ -23,4 +23,20 @@ no_scoring_prefix = 'JV'                              # prefix that defaults wre
 bout_bitmap_filename = 'WrestlingNerd_wdr/bout.png'   # filename of bout sheet image
 icon_filename = 'WrestlingNerd_wdr/nerd16.ico'        # filename of the program icon
 layouts_path = './layouts'                            # folder holding tournament configurations
-splash_bitmap_filename = 'WrestlingNerd_wdr/LogoBitmaps_0.png'
\ No newline at end of file
+layouts_cache = './layouts/layouts.cache'             # file caching the layouts read from the folder
+splash_bitmap_filename = 'WrestlingNerd_wdr/LogoBitmaps_0.png'
+simulation_runs = 10000                               # number of times to play out remaining bouts
+simulation_processes = 0                              # processes for simulations, 0 for one per CPU
+simulation_results = [('Decision', (5, 2), 60),       # result type, value, and relative weight of
+                      ('Decision', (12, 3), 12),      #   the results drawn for simulated bouts
+                      ('Decision', (17, 1), 3),
+                      ('Pin', 90, 22),
+                      ('Default', None, 3)]
+journal_extension = '.journal'                        # extension added to the journal file name
+journal_compact_records = 2000                        # journal records kept before a new snapshot
+autosave_interval = 120000                            # milliseconds between autosaves, 0 for none
+autosave_extension = '.autosave'                      # extension added to the autosaved copy
+database_extension = '.wndb'                          # extension of tournaments kept in a database
+backup_extension = '.wnb'                             # extension of backup manifests in a backup folder
+season_index_name = 'season.wni'                      # name of the index kept in a folder of tournaments
+snapshot_filename = None                              # file to publish the live tournament to, None for none
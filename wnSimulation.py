@@ -0,0 +1,166 @@
+'''
+The simulation module defines classes that play out the bouts left in a tournament many times at
+random to estimate how likely each team is to finish in each place. The work is spread over a pool of
+processes that are sent a flat array copy of the tournament instead of the bracket objects.
+'''
+import bisect
+import random
+try:
+  import multiprocessing
+except ImportError:
+  multiprocessing = None
+
+from wnArrayData import wnTournamentArrays
+from wnScoreData import wnResultFactory
+import wnSettings
+
+class wnResultDistribution(object):
+  '''The result distribution class draws the bonus points for simulated wins. It is built from a list
+  of (result type, value, weight) triples. The type and value are passed to the result factory and
+  the weights give the relative chance of each result.'''
+  def __init__(self, results=None):
+    if results is None:
+      results = wnSettings.simulation_results
+
+    self.points = []
+    self.cumulative = []
+    total = 0.0
+    for type, args, weight in results:
+      total += weight
+      self.points.append(float(wnResultFactory.Create(type, args).Points))
+      self.cumulative.append(total)
+    self.total = total
+
+  def Draw(self, rnd):
+    '''Draw the bonus points for one win using the given random number generator.'''
+    i = bisect.bisect_right(self.cumulative, rnd.random() * self.total)
+    return self.points[min(i, len(self.points)-1)]
+
+class wnWeightPlan(object):
+  '''The weight plan class holds what a simulation needs to play out one weight class: the bouts
+  left in the order they can happen and the state of the threads reaching the filled entries.'''
+  def __init__(self, arrays):
+    self.arrays = arrays
+    self.bouts = arrays.GetFutureBouts()
+    self.counts, self.pending = arrays.GetThreadState()
+    self.points = [arrays.adv_points[i] + arrays.place_points[i] for i in range(len(arrays))]
+
+  def Play(self, scores, dist, rnd):
+    '''Play out the bouts left once, adding the points gained by every team to the scores list.'''
+    wa = self.arrays
+    team = wa.wrestler_team
+    scoring = wa.wrestler_scoring
+    next_lose = wa.next_lose
+    is_origin = wa.is_origin
+    points = self.points
+    random = rnd.random
+    occ = wa.wrestler[:]
+    counts = self.counts[:]
+    pending = self.pending[:]
+
+    for x, participants in self.bouts:
+      # a bye moves the wrestler along and holds the points until a real match follows
+      if len(participants) == 1:
+        p = participants[0]
+        occ[x] = occ[p]
+        counts[x] = counts[p]
+        pending[x] = pending[p] + points[x]
+        continue
+
+      if random() < 0.5:
+        winner, loser = participants[:2]
+      else:
+        loser, winner = participants[:2]
+
+      w = occ[winner]
+      occ[x] = w
+      counts[x] = counts[winner]
+      pending[x] = 0.0
+      if scoring[w] and counts[winner] and team[w] >= 0:
+        scores[team[w]] += pending[winner] + points[x] + dist.Draw(rnd)
+
+      # the loser starts a new thread if the entry it drops to can start one
+      t = next_lose[loser]
+      if t >= 0 and occ[t] < 0:
+        occ[t] = occ[loser]
+        counts[t] = bool(is_origin[t])
+        pending[t] = 0.0
+
+def simulateRuns(job):
+  '''Play out a tournament the given number of times. The job is a tuple of the tournament arrays,
+  the current team scores, the result distribution, the number of runs, and a random seed. Return a
+  table with a row per team counting the times it finished in each place.
+
+  This is a module function so a process pool can send jobs to it.'''
+  arrays, current, dist, runs, seed = job
+  rnd = random.Random(seed)
+  plans = [wnWeightPlan(wa) for wa in arrays.weights if wa.GetFutureBouts() != []]
+  num_teams = len(current)
+  table = [[0] * num_teams for i in range(num_teams)]
+
+  for run in xrange(runs):
+    scores = current[:]
+    for plan in plans:
+      plan.Play(scores, dist, rnd)
+
+    # teams with the same score share the higher place
+    order = range(num_teams)
+    order.sort(key=scores.__getitem__, reverse=True)
+    place = 0
+    for i in range(num_teams):
+      if i > 0 and scores[order[i]] != scores[order[i-1]]:
+        place = i
+      table[order[i]][place] += 1
+
+  return table
+
+class wnSimulator(object):
+  '''The simulator class estimates the chance of every team finishing in every place by playing out
+  the bouts left in a tournament at random. Winners are picked with even odds and the bonus points
+  for each win are drawn from a result distribution. It works on a flat array copy of the tournament
+  taken when it is created.'''
+  def __init__(self, tournament, results=None, processes=None):
+    self.arrays = wnTournamentArrays(tournament)
+    self.Teams = self.arrays.Teams
+    self.distribution = wnResultDistribution(results)
+    if processes is None:
+      processes = wnSettings.simulation_processes
+    self.processes = processes
+
+    scores = dict([(t, s) for s, t in self.arrays.CalcScores()])
+    self.current = [scores[t] for t in self.Teams]
+
+  def CalcPlaceOdds(self, runs=None, seed=None):
+    '''Simulate the rest of the tournament the given number of times. Return a dictionary of team
+    names to lists holding the chance of finishing in each place, first place first.'''
+    if runs is None:
+      runs = wnSettings.simulation_runs
+    rnd = random.Random(seed)
+
+    # split the runs into a few jobs per process so they finish at about the same time
+    processes = self.processes
+    if multiprocessing is None:
+      processes = 1
+    elif processes <= 0:
+      processes = multiprocessing.cpu_count()
+    num_jobs = min(runs, processes * 4) or 1
+    jobs = []
+    for i in range(num_jobs):
+      count = runs / num_jobs + (i < runs % num_jobs)
+      jobs.append((self.arrays, self.current, self.distribution, count, rnd.random()))
+
+    if processes == 1:
+      tables = map(simulateRuns, jobs)
+    else:
+      pool = multiprocessing.Pool(processes)
+      try:
+        tables = pool.map(simulateRuns, jobs)
+      finally:
+        pool.close()
+        pool.join()
+
+    odds = {}
+    for i in range(len(self.Teams)):
+      counts = [sum([table[i][j] for table in tables]) for j in range(len(self.Teams))]
+      odds[self.Teams[i]] = [float(c) / max(runs, 1) for c in counts]
+    return odds
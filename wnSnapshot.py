@@ -0,0 +1,320 @@
+'''
+The snapshot module publishes the live state of a tournament in a memory-mapped file so other
+processes, like score displays, printers, or a results web page, can read it while the tournament
+is run. The file has a fixed layout of packed records that readers take straight from the map.
+There are no pickles to decode and no locks.
+
+The file starts with a header holding a generation counter. The writer makes the counter odd before
+it changes the file and even again once it is done. A reader copies the part of the file it needs
+and checks the counter did not move and was even. If the check fails, the reader tries again. A
+change to an entry or a team score rewrites a single record. A change to the teams or wrestlers
+rewrites the whole file, because the names are kept in a string table. The layout counter in the
+header tells readers when that happened.
+
+The header is followed by tables of teams, wrestlers, weights, rounds, and entries, then the
+strings. Names are given as an (offset, length) pair into the strings. Rounds list their entries as
+a range of the entry table, and weights list their rounds the same way.
+'''
+import mmap
+import os
+import struct
+import time
+
+from wnEvents import wnTournamentEventReceivable
+from wnTeamData import wnWrestler
+import wnStorage
+
+MAGIC = 'WNSS'
+VERSION = 1
+
+# magic, version, generation, used size, layout counter, team, wrestler, weight, round, and entry
+# counts, and the offsets of the tables and the strings
+HEADER = struct.Struct('<4sH2xQII5I6I')
+GENERATION = struct.Struct('<Q')
+GENERATION_OFFSET = 8
+TEAM = struct.Struct('<dIIB3x')         # score, name offset, name length, still in the tournament
+WRESTLER = struct.Struct('<iII')        # team number, name offset, name length
+WEIGHT = struct.Struct('<IIII')         # name offset, name length, first round, round count
+ROUND = struct.Struct('<IIII')          # name offset, name length, first entry, entry count
+ENTRY = struct.Struct('<iiiii')         # entry name, wrestler number, result code, two values
+
+# result codes in the entry records, 0 is no result
+RESULT_CODES = {'Pin' : 1, 'Decision' : 2, 'Bye' : 3, 'Default' : 4}
+RESULT_TYPES = dict([(code, type) for type, code in RESULT_CODES.items()])
+
+class wnSnapshotError(Exception):
+  '''Raised when a snapshot file cannot be read.'''
+  pass
+
+def encodeEntry(entry, wrestler):
+  '''Pack the record of an entry given the number of its wrestler.'''
+  code, a, b = 0, 0, 0
+  result = entry.Result
+  if result is not None:
+    code = RESULT_CODES[result.Name]
+    if result.Name == 'Pin':
+      a = result.Args
+    elif result.Name == 'Decision':
+      a, b = result.Args
+  return ENTRY.pack(entry.Name, wrestler, code, a, b)
+
+def decodeResult(code, a, b):
+  '''Get the result type and factory value of an entry record, or None if it has no result.'''
+  type = RESULT_TYPES.get(code)
+  if type == 'Pin':
+    return (type, a)
+  elif type == 'Decision':
+    return (type, (a, b))
+  elif type is not None:
+    return (type, None)
+  return None
+
+class wnSnapshotWriter(wnTournamentEventReceivable):
+  '''The snapshot writer keeps a snapshot file up to date with a tournament. The file only ever
+  grows, even when a new writer takes over the file of an earlier one, so readers never touch a page
+  that was cut off.'''
+  def __init__(self, tournament, filename):
+    self.tournament = tournament
+    self.filename = filename
+    self.generation = 0
+    self.layout = 0
+    self.entries = {}
+    self.wrestlers = {}
+    self.teams = {}
+    self.entries_offset = 0
+    self.teams_offset = 0
+
+    # a file left by an earlier writer may still be mapped by readers, so it is never cut short
+    if os.path.exists(filename):
+      self.file = file(filename, 'r+b')
+    else:
+      self.file = file(filename, 'w+b')
+    size = os.fstat(self.file.fileno()).st_size
+    if size < HEADER.size:
+      self.file.seek(size)
+      self.file.write('\0' * (HEADER.size - size))
+      self.file.flush()
+      size = HEADER.size
+    self.map = mmap.mmap(self.file.fileno(), size)
+
+    # carry on the counters of the earlier writer so readers see the change
+    header = HEADER.unpack(self.map[:HEADER.size])
+    if header[0] == MAGIC:
+      self.generation = header[2] + header[2] % 2
+      self.layout = header[4]
+    self.Publish()
+    tournament.AddListener(self)
+
+  def Close(self):
+    '''Stop updating the snapshot. The file is left with the last state written to it.'''
+    self.tournament.RemoveListener(self)
+    self.map.close()
+    self.file.close()
+
+  def Publish(self):
+    '''Write the whole state of the tournament to the file.'''
+    t = self.tournament
+    numbers = {}
+    sections = wnStorage.GetSections(t, numbers)
+    people = sections[1]
+    strings = []
+    size = [0]
+    def addString(s):
+      strings.append(s)
+      size[0] += len(s)
+      return size[0] - len(s), len(s)
+
+    # number every team and wrestler, including those only left in the brackets
+    teams = []
+    self.teams = {}
+    for name, adjust, listed, points in people['Teams']:
+      score = 0.0
+      if listed:
+        score = t.Teams[name].Score
+        self.teams[name] = len(teams)
+      teams.append(TEAM.pack(*((score,) + addString(name) + (listed,))))
+    wrestlers = []
+    for team, name, weight, listed, results in people['Wrestlers']:
+      wrestlers.append(WRESTLER.pack(*((team,) + addString(name))))
+    self.wrestlers = {}
+    for obj, n in numbers.items():
+      if isinstance(obj, wnWrestler):
+        self.wrestlers[obj] = n
+
+    # list every entry in bracket order so each one keeps its place in the file
+    weights = []
+    rounds = []
+    entries = []
+    self.entries = {}
+    for weight in t.Weights:
+      wc = t.GetWeightClass(weight)
+      weights.append(WEIGHT.pack(*(addString(weight) + (len(rounds), len(wc.Rounds)))))
+      for r in wc.Rounds:
+        round = wc.GetRound(r)
+        rounds.append(ROUND.pack(*(addString(r) + (len(entries), len(round.entries)))))
+        for e in round.entries:
+          self.entries[e] = len(entries)
+          entries.append(encodeEntry(e, self.getWrestler(e)))
+
+    # lay the tables out one after the other
+    offsets = []
+    pos = HEADER.size
+    for table in [teams, wrestlers, weights, rounds, entries, strings]:
+      offsets.append(pos)
+      pos += sum([len(x) for x in table])
+    self.teams_offset = offsets[0]
+    self.entries_offset = offsets[4]
+    self.layout += 1
+
+    self.begin()
+    if pos > len(self.map):
+      self.map.resize(pos)
+    body = ''.join(teams + wrestlers + weights + rounds + entries + strings)
+    self.map[HEADER.size:pos] = body
+    header = HEADER.pack(MAGIC, VERSION, self.generation, pos, self.layout, len(teams),
+                         len(wrestlers), len(weights), len(rounds), len(entries), *offsets)
+    self.map[:HEADER.size] = header
+    self.end()
+
+  def getWrestler(self, entry):
+    if entry.Wrestler is None:
+      return -1
+    return self.wrestlers[entry.Wrestler]
+
+  def begin(self):
+    '''Mark the file as being changed.'''
+    self.generation += 1
+    self.map[GENERATION_OFFSET:GENERATION_OFFSET+8] = GENERATION.pack(self.generation)
+
+  def end(self):
+    '''Mark the change as done.'''
+    self.generation += 1
+    self.map[GENERATION_OFFSET:GENERATION_OFFSET+8] = GENERATION.pack(self.generation)
+
+  def OnEntryChange(self, entry):
+    # a wrestler the file does not know yet needs a new string table
+    if entry.Wrestler is not None and not self.wrestlers.has_key(entry.Wrestler):
+      self.Publish()
+      return
+    pos = self.entries_offset + self.entries[entry] * ENTRY.size
+    self.begin()
+    self.map[pos:pos+ENTRY.size] = encodeEntry(entry, self.getWrestler(entry))
+    self.end()
+
+  def OnScoreChange(self, name, old, new):
+    # teams that are renamed or deleted are written again with the team table
+    if new is None or not self.teams.has_key(name):
+      return
+    pos = self.teams_offset + self.teams[name] * TEAM.size
+    self.begin()
+    self.map[pos:pos+8] = struct.pack('<d', new)
+    self.end()
+
+  def OnTeamChange(self, team, old_name):
+    # a new point adjustment only changes the score, which is written when it changes
+    if old_name == team.Name and self.teams.has_key(old_name) and \
+       self.tournament.Teams.get(old_name) is team:
+      return
+    self.Publish()
+
+  def OnWrestlerChange(self, wrestler, old_name):
+    self.Publish()
+
+  def OnWeightChange(self, weight):
+    self.Publish()
+
+class wnSnapshotReader(object):
+  '''The snapshot reader reads a snapshot file written by another process. Reading never blocks
+  the writer.'''
+  def __init__(self, filename):
+    self.file = file(filename, 'rb')
+    self.map = None
+    self.remap()
+
+  def Close(self):
+    self.map.close()
+    self.file.close()
+
+  def remap(self):
+    '''Map the whole file as it is now, since the writer may have made it longer.'''
+    if self.map is not None:
+      self.map.close()
+    size = os.fstat(self.file.fileno()).st_size
+    if size < HEADER.size:
+      raise wnSnapshotError('The file is not a tournament snapshot.')
+    self.map = mmap.mmap(self.file.fileno(), size, access=mmap.ACCESS_READ)
+    if self.map[:4] != MAGIC:
+      raise wnSnapshotError('The file is not a tournament snapshot.')
+
+  def GetGeneration(self):
+    '''Get the generation counter, which changes every time the snapshot does.'''
+    return GENERATION.unpack(self.map[GENERATION_OFFSET:GENERATION_OFFSET+8])[0]
+
+  def copy(self, start=0, end=None, tries=1000):
+    '''Get a copy of the header and the given part of the file the writer was not changing. Return
+    the generation, the header fields, and the copied bytes.'''
+    for i in range(tries):
+      generation = self.GetGeneration()
+      if generation % 2 == 0:
+        header = HEADER.unpack(self.map[:HEADER.size])
+        if header[3] > len(self.map):
+          self.remap()
+          continue
+        if end is None:
+          end = header[3]
+        data = self.map[start:end]
+        if self.GetGeneration() == generation:
+          return generation, header, data
+      time.sleep(0.001)
+    raise wnSnapshotError('The snapshot is not being updated consistently.')
+
+  def GetScores(self):
+    '''Get the scores of the teams in the tournament, highest first. Return the generation and a
+    list of (score, team) pairs.'''
+    generation, header, data = self.copy()
+    teams = self.readTeams(header, data)
+    scores = [(score, name) for name, score, listed in teams if listed]
+    scores.sort(lambda a, b: cmp(b[0], a[0]) or cmp(a[1], b[1]))
+    return generation, scores
+
+  def Read(self):
+    '''Get everything in the snapshot. Return a dictionary with the generation, the teams as (name,
+    score, listed) tuples, the wrestlers as (name, team name) pairs, the weight names in order,
+    and the entries of each round of each weight as (entry name, wrestler number, result)
+    tuples, with results as (type, value) pairs from the result factory.'''
+    generation, header, data = self.copy()
+    counts = header[5:10]
+    offsets = header[10:16]
+    def getString(offset, length):
+      start = offsets[5] + offset
+      return data[start:start+length]
+    def getTable(n, record):
+      start = offsets[n]
+      return [record.unpack_from(data, start + i * record.size) for i in range(counts[n])]
+
+    teams = self.readTeams(header, data)
+    wrestlers = [(getString(offset, length), teams[team][0])
+                 for team, offset, length in getTable(1, WRESTLER)]
+    rounds = getTable(3, ROUND)
+    entries = getTable(4, ENTRY)
+    weights = []
+    brackets = {}
+    for offset, length, first, count in getTable(2, WEIGHT):
+      name = getString(offset, length)
+      weights.append(name)
+      brackets[name] = {}
+      for r_offset, r_length, first_entry, num_entries in rounds[first:first+count]:
+        brackets[name][getString(r_offset, r_length)] = \
+          [(e[0], e[1], decodeResult(*e[2:])) for e in entries[first_entry:first_entry+num_entries]]
+    return {'Generation' : generation, 'Teams' : teams, 'Wrestlers' : wrestlers,
+            'Weights' : weights, 'Entries' : brackets}
+
+  def readTeams(self, header, data):
+    strings = header[15]
+    teams = []
+    for i in range(header[5]):
+      score, offset, length, listed = TEAM.unpack_from(data, header[10] + i * TEAM.size)
+      teams.append((data[strings+offset:strings+offset+length], score, bool(listed)))
+    return teams
+
+  Generation = property(fget=GetGeneration)
@@ -0,0 +1,355 @@
+'''
+The storage module saves and loads tournaments in the compact wrestling nerd file format. Instead of
+pickling the whole bracket object graph, a file holds the layout of the brackets once and flat tables
+of the teams, wrestlers, and the entries that hold wrestlers or results. The brackets are built again
+with the builder when a file is loaded. Only plain lists, tuples, strings, and numbers are stored, so
+renaming a class does not break old files.
+
+A file starts with a magic string, the format version, and the number of sections. An index with
+the length of every section follows, then the sections themselves as zlib compressed pickles. The
+first section is the header, the second holds the teams and wrestlers, and there is one more section
+for the entries of each weight class. The teams also hold their points in every weight class, so a
+tournament can be opened with only the first two sections read. Each weight class is then built the
+first time it is asked for. Version 1 files keep the length in front of each section instead of in
+an index. Files saved by older versions are whole-graph pickles and are still loaded.
+
+Dumps and Loads save and load a tournament without pickling its object graph, so they are the
+functions to use for deep brackets. Saving walks the rounds and entries in plain loops, storing
+links as positions, and loading builds the brackets first and then fills them in from the flat
+tables. Neither follows the links between entries one call deeper at a time, so deep brackets do not
+run into the recursion limit and the time taken grows with the number of entries.
+'''
+import cPickle
+import os
+import struct
+import zlib
+
+from wnBuilder import wnBuilder, wnConfig
+from wnScoreData import wnResultFactory
+from wnTeamData import wnTeam, wnWrestler
+
+MAGIC = 'WNRD'
+VERSION = 2
+
+class wnStorageError(Exception):
+  '''Raised when a file is not in a format this version can read.'''
+  pass
+
+def Save(tournament, filename):
+  '''Save a tournament to the given file in the compact format.'''
+  SaveSections(GetSections(tournament), filename)
+
+def SaveSections(sections, filename):
+  '''Save the plain data sections of a tournament to the given file. The file is written beside the
+  old one and moved over it, so a failed save leaves the old file as it was.'''
+  temp = filename + '.tmp'
+  f = file(temp, 'wb')
+  try:
+    f.write(DumpSections(sections))
+  finally:
+    f.close()
+  ReplaceFile(temp, filename)
+
+def ReplaceFile(source, target):
+  '''Move a file over another one. Renaming over an existing file fails on Windows, so the target is
+  removed first there.'''
+  try:
+    os.rename(source, target)
+  except OSError:
+    os.remove(target)
+    os.rename(source, target)
+
+def Load(filename, lazy=False):
+  '''Load a tournament from the given file, in either the compact or the old pickle format. When
+  lazy is set, weight classes are only built when they are first asked for.'''
+  f = file(filename, 'rb')
+  try:
+    data = f.read()
+  finally:
+    f.close()
+  return Loads(data, lazy)
+
+def Dumps(tournament):
+  '''Get a tournament in the compact format as a string.'''
+  return DumpSections(GetSections(tournament))
+
+def DumpSections(sections):
+  '''Get the plain data sections of a tournament in the compact format as a string.'''
+  chunks = [zlib.compress(cPickle.dumps(s, 2)) for s in sections]
+  sizes = [len(chunk) for chunk in chunks]
+  index = struct.pack('<HI%dI' % len(sizes), VERSION, len(sizes), *sizes)
+  return ''.join([MAGIC, index] + chunks)
+
+def Loads(data, lazy=False):
+  '''Get a tournament from a string in either the compact or the old pickle format. When lazy is
+  set, weight classes are only built when they are first asked for.'''
+  if not data.startswith(MAGIC):
+    return cPickle.loads(data)
+  version, index = ReadIndex(data)
+
+  # version 1 files have no team points to show before the weights are built
+  if lazy and version >= 2:
+    sections = [readSection(data, index[i]) for i in range(2)]
+    return BuildTournament(sections, wnWeightLoader(data, index, sections))
+  return BuildTournament([readSection(data, pos) for pos in index])
+
+def ReadSections(data):
+  '''Split a string in the compact format into its decoded sections.'''
+  return [readSection(data, pos) for pos in ReadIndex(data)[1]]
+
+def ReadIndex(data):
+  '''Read the format version and find the sections in a string in the compact format. Return the
+  version and a list of (offset, length) pairs, one per section.'''
+  pos = len(MAGIC)
+  version, count = struct.unpack('<HI', data[pos:pos+6])
+  if version > VERSION:
+    raise wnStorageError('The file was saved in format version %d, but only versions up to %d '
+                         'can be read.' % (version, VERSION))
+  pos += 6
+
+  index = []
+  if version == 1:
+    # the length is in front of each section
+    for i in range(count):
+      size = struct.unpack('<I', data[pos:pos+4])[0]
+      index.append((pos+4, size))
+      pos += 4 + size
+  else:
+    sizes = struct.unpack('<%dI' % count, data[pos:pos+4*count])
+    pos += 4 * count
+    for size in sizes:
+      index.append((pos, size))
+      pos += size
+  return version, index
+
+def readSection(data, section):
+  '''Decode the section at the given (offset, length) pair.'''
+  pos, size = section
+  return cPickle.loads(zlib.decompress(data[pos:pos+size]))
+
+def GetSections(tournament, numbers=None):
+  '''Get the plain data sections describing a tournament: the header, the teams and wrestlers, and
+  the entries of each weight class. When a numbers dictionary is given, it is filled with the
+  number given to every team and wrestler object.'''
+  weights = tournament.Weights
+
+  # the layout is the same in every weight class
+  loader = tournament.loader
+  if tournament.topology is not None:
+    layout = tournament.topology.Layout
+  elif weights == []:
+    layout = {'Seeds' : tournament.seeds, 'Rounds' : []}
+  elif loader is not None:
+    layout = loader.Layout
+  else:
+    layout = GetLayout(tournament.GetWeightClass(weights[0]), tournament.seeds)
+  header = {'Name' : tournament.Name, 'Layout' : layout, 'Weights' : weights}
+
+  # number the teams, keeping teams that were deleted but still have wrestlers in the brackets
+  teams = []
+  team_index = {}
+  def addTeam(t, listed):
+    team_index[id(t)] = len(teams)
+    # only teams still in the tournament have points that count
+    points = {}
+    if listed:
+      points = t.points.copy()
+    teams.append((t.Name, t.PointAdjust, listed, points))
+    if numbers is not None:
+      numbers[t] = team_index[id(t)]
+  for name in tournament.TeamNames:
+    addTeam(tournament.Teams[name], True)
+
+  # number the wrestlers the same way
+  wrestlers = []
+  wrestler_index = {}
+  def addWrestler(w, listed):
+    if not team_index.has_key(id(w.Team)):
+      addTeam(w.Team, False)
+    results = [(key, r.Name, r.Args) for key, r in w.results.items() if r is not None]
+    results.sort()
+    wrestler_index[id(w)] = len(wrestlers)
+    wrestlers.append((team_index[id(w.Team)], w.Name, w.Weight, listed, results))
+    if numbers is not None:
+      numbers[w] = wrestler_index[id(w)]
+  for name in tournament.TeamNames:
+    t = tournament.Teams[name]
+    for w in t.Wrestlers:
+      addWrestler(w, True)
+
+  # store only the entries that hold something
+  entry_sections = []
+  for weight in weights:
+    entries = []
+    # weights not loaded yet are copied from the file with their wrestlers numbered again
+    if loader is not None and loader.HasWeight(weight):
+      for r, name, w, result, is_scoring in loader.GetEntries(weight):
+        if w is not None:
+          if not wrestler_index.has_key(id(w)):
+            addWrestler(w, False)
+          w = wrestler_index[id(w)]
+        else:
+          w = -1
+        entries.append((r, name, w, result, is_scoring))
+      entry_sections.append({'Name' : weight, 'Entries' : entries})
+      continue
+
+    wc = tournament.GetWeightClass(weight)
+    for r in wc.Rounds:
+      for e in wc.GetRound(r).entries:
+        if e.Wrestler is None and e.Result is None and e.is_scoring:
+          continue
+        w = -1
+        if e.Wrestler is not None:
+          if not wrestler_index.has_key(id(e.Wrestler)):
+            addWrestler(e.Wrestler, False)
+          w = wrestler_index[id(e.Wrestler)]
+        result = None
+        if e.Result is not None:
+          result = (e.Result.Name, e.Result.Args)
+        entries.append((r, e.Name, w, result, e.is_scoring))
+    entry_sections.append({'Name' : weight, 'Entries' : entries})
+
+  return [header, {'Teams' : teams, 'Wrestlers' : wrestlers}] + entry_sections
+
+def GetLayout(weight, seeds):
+  '''Describe the rounds of a weight class the same way a layout file does.'''
+  rounds = []
+  for name in weight.Rounds:
+    r = weight.GetRound(name)
+    data = {'Name' : name, 'Adv Points' : r.RoundPoints.AdvPoints,
+            'Place Points' : r.RoundPoints.PlacePoints}
+
+    # seed rounds list their seeds in bracket order, other rounds just give their size
+    if r.Entries is r.entries:
+      data['Entries'] = len(r.entries)
+    else:
+      data['Entries'] = [e.Name for e in r.entries]
+
+    # store links as positions in the ordered entries of the next round
+    if r.next_win is not None:
+      order = getPositions(r.next_win.Entries)
+      data['Win Round'] = r.next_win.Name
+      data['Win Order'] = [order[id(e.NextWin)] for e in r.entries]
+    if r.next_lose is not None:
+      order = getPositions(r.next_lose.Entries)
+      data['Lose Round'] = r.next_lose.Name
+      data['Lose Order'] = [order[id(e.NextLose)] for e in r.entries]
+    rounds.append(data)
+
+  return {'Seeds' : seeds, 'Rounds' : rounds}
+
+def getPositions(entries):
+  '''Map the ids of entries to their positions in a list, so links can be found without searching.'''
+  return dict([(id(entries[i]), i) for i in range(len(entries))])
+
+def BuildTournament(sections, loader=None, objects=None):
+  '''Build a tournament from its plain data sections. When a loader is given, only the header and
+  the teams are needed and the weight classes are left to the loader. When an objects list is
+  given, it is filled with the team objects and then the wrestler objects in the order of the
+  sections.'''
+  header = sections[0]
+  config = wnConfig(data=header['Layout'])
+
+  # make the teams still in the tournament
+  teams = sections[1]['Teams']
+  names = [team[0] for team in teams if team[2]]
+  builder = wnBuilder()
+  tourn = builder.Create(config, header['Name'], [], names)
+
+  team_objs = []
+  for team in teams:
+    name, adjust, listed = team[:3]
+    if listed:
+      t = tourn.Teams[name]
+    else:
+      t = wnTeam(name, tourn)
+    t.point_adjust = adjust
+    # the points of weights not built yet come from the file
+    if loader is not None:
+      t.points = team[3].copy()
+    team_objs.append(t)
+
+  wrestler_objs = []
+  for team, name, weight, listed, results in sections[1]['Wrestlers']:
+    t = team_objs[team]
+    if listed:
+      w = t.NewWrestler(name, weight)
+    else:
+      w = wnWrestler(name, weight, t)
+    for key, type, args in results:
+      w.results[key] = wnResultFactory.Create(type, args)
+    wrestler_objs.append(w)
+  if objects is not None:
+    objects += team_objs + wrestler_objs
+
+  # build the brackets now or leave them to the loader
+  if loader is None:
+    for s in sections[2:]:
+      wc = builder.CreateWeight(tourn, config, s['Name'])
+      fillEntries(wc, s['Entries'], wrestler_objs)
+  else:
+    loader.Start(config, wrestler_objs)
+    tourn.loader = loader
+
+  # rebuild the scores and everything else derived from the brackets
+  tourn.Reindex()
+  return tourn
+
+def fillEntries(wc, entries, wrestler_objs):
+  '''Store the wrestlers and results of a weight section in the entries of its weight class.'''
+  rounds = {}
+  for round, name, w, result, is_scoring in entries:
+    if not rounds.has_key(round):
+      rounds[round] = dict([(e.Name, e) for e in wc.GetRound(round).entries])
+    e = rounds[round][name]
+    if w >= 0:
+      e.wrestler = wrestler_objs[w]
+    if result is not None:
+      e.result = wnResultFactory.Create(*result)
+    e.is_scoring = is_scoring
+
+class wnWeightLoader(object):
+  '''The weight loader holds the sections of a file for the weight classes of a tournament that
+  have not been built yet. A section is only decoded when its weight class is built or when the
+  tournament is saved again before then.'''
+  def __init__(self, data, index, sections):
+    self.data = data
+    self.Layout = sections[0]['Layout']
+    names = sections[0]['Weights']
+    self.index = dict([(names[i], index[i+2]) for i in range(len(names))])
+    self.config = None
+    self.wrestlers = None
+
+  def Start(self, config, wrestlers):
+    '''Remember the layout and the wrestlers the weight sections refer to by number.'''
+    self.config = config
+    self.wrestlers = wrestlers
+
+  def HasWeight(self, name):
+    '''Tell if a weight class is still waiting to be built.'''
+    return self.index.has_key(name)
+
+  def GetWeights(self):
+    return self.index.keys()
+
+  def GetEntries(self, name):
+    '''Get the stored entries of a weight class not built yet, with wrestler objects in place of
+    wrestler numbers.'''
+    entries = []
+    for r, n, w, result, is_scoring in readSection(self.data, self.index[name])['Entries']:
+      if w >= 0:
+        w = self.wrestlers[w]
+      else:
+        w = None
+      entries.append((r, n, w, result, is_scoring))
+    return entries
+
+  def LoadWeight(self, tourn, name):
+    '''Build a weight class of the given tournament from its section.'''
+    s = readSection(self.data, self.index.pop(name))
+    wc = wnBuilder().CreateWeight(tourn, self.config, name)
+    fillEntries(wc, s['Entries'], self.wrestlers)
+    return wc
+
+  Weights = property(fget=GetWeights)
@@ -8,6 +8,7 @@ class wnTeam(object):
   '''The team class holds wrestlers and points.'''
   def __init__(self, name, tournament):
     self.name = name
+    self.tournament = tournament
     self.wrestlers = {}
     self.point_adjust = 0.0
     self.points = dict([(w, 0.0) for w in tournament.Weights])
@@ -40,7 +41,10 @@ class wnTeam(object):
     return s
   
   def SetPointAdjust(self, value):
+    old = self.Score
     self.point_adjust = value
+    self.notifyChange(old)
+    self.tournament.Notify('OnTeamChange', self, self.name)
     
   def GetPointAdjust(self):
     return self.point_adjust
@@ -59,13 +63,28 @@ class wnTeam(object):
   
   def SetWeightScore(self, weight_name, value):
     '''Set the score for a weight to a certain value.'''
+    old = self.Score
     self.points[weight_name] = value
+    self.notifyChange(old)
+    
+  def AddWeightScore(self, weight_name, value):
+    '''Add a number of points to the score for a weight.'''
+    old = self.Score
+    self.points[weight_name] = self.points.get(weight_name, 0.0) + value
+    self.notifyChange(old)
+    
+  def notifyChange(self, old):
+    '''Tell the tournament that the total score of this team changed.'''
+    new = self.Score
+    if new != old:
+      self.tournament.Notify('OnScoreChange', self.name, old, new)
   
   def NewWrestler(self, name, weight):
     '''Add a new wrestler to the team. Make the wrestler scoring if he is the first to be added.'''
     w = wnWrestler(name, weight, self)
     self.wrestlers.setdefault(weight, [])
     self.wrestlers[weight].append(w)
+    self.tournament.Notify('OnWrestlerChange', w, None)
     
     return w
   
@@ -84,12 +103,17 @@ class wnTeam(object):
     # search all the wrestlers in this weight class
     for i in range(len(w_list)):
       if w_list[i].Name == name:
+        w = w_list[i]
         # remove empty weight class lists
         if len(w_list) == 1:
           del self.wrestlers[weight]
         # otherwise just deleted the desired wrestler
         else:
           del w_list[i]
+        
+        # take the wrestler out of the fast fall standings
+        self.tournament.Notify('OnFallChange', w)
+        self.tournament.Notify('OnWrestlerChange', w, name)
         break
       
   Name = property(fget=GetName, fset=SetName)  
@@ -104,6 +128,8 @@ class wnWrestler(object):
     self.weight = weight
     self.team = team
     self.results = {}
+    self.pins = 0
+    self.pin_time = 0
     
   def __repr__(self):
     return '<Wrestler Name: %s Weight: %s Team: %s>' % (self.name, self.weight, self.team.Name)
@@ -124,27 +150,48 @@ class wnWrestler(object):
     
   def StoreResult(self, id, result):
     '''Store a result for a particular match ID.'''
+    old = self.results.get(id)
     self.results[id] = result
+    self.updateFalls(old, result)
     
   def DeleteResult(self, id):
     '''Delete a result for a particular match ID.'''
     try:
-      del self.results[id]
+      old = self.results.pop(id)
     except:
-      pass
+      return
+    self.updateFalls(old, None)
     
-  def CalcFastFall(self):
-    '''Get the total number of pins and pin times.'''
-    total = [0, 0]
+  def CountFalls(self):
+    '''Count the pins and the total pin time from scratch.'''
+    self.pins = 0
+    self.pin_time = 0
     for r in self.results.values():
       if r is not None and r.Name == 'Pin':
-        total[0] += 1
-        total[1] += r.Value
-
-    if total[0] == 0:
+        self.pins += 1
+        self.pin_time += r.Value
+    
+  def updateFalls(self, old, new):
+    '''Update the pin count and time when a result is replaced and tell the tournament.'''
+    changed = False
+    if old is not None and old.Name == 'Pin':
+      self.pins -= 1
+      self.pin_time -= old.Value
+      changed = True
+    if new is not None and new.Name == 'Pin':
+      self.pins += 1
+      self.pin_time += new.Value
+      changed = True
+      
+    if changed:
+      self.team.tournament.Notify('OnFallChange', self)
+    
+  def CalcFastFall(self):
+    '''Get the total number of pins and pin times.'''
+    if self.pins == 0:
       return None
     else:
-      return wnFastFall(self, total[0], total[1])
+      return wnFastFall(self, self.pins, self.pin_time)
     
   def GetFormattedName(self):
     n_fill = wnSettings.max_name_length - len(self.name)
@@ -162,7 +209,9 @@ class wnWrestler(object):
     return self.name
   
   def SetName(self, name):
+    old = self.name
     self.name = name
+    self.team.tournament.Notify('OnWrestlerChange', self, old)
 
   def GetTeam(self):
     return self.team
@@ -173,9 +222,17 @@ class wnWrestler(object):
   def GetIsScoring(self):
     return (self.name.find(wnSettings.no_scoring_prefix) != 0)
   
+  def GetPins(self):
+    return self.pins
+  
+  def GetPinTime(self):
+    return self.pin_time
+  
   Weight = property(fget=GetWeight)
   Team = property(fget=GetTeam)  
   Name = property(fget=GetName, fset=SetName)
   FormattedName = property(fget=GetFormattedName)
   ShortName = property(fget=GetShortName)
-  IsScoring = property(fget=GetIsScoring)
\ No newline at end of file
+  IsScoring = property(fget=GetIsScoring)
+  Pins = property(fget=GetPins)
+  PinTime = property(fget=GetPinTime)
\ No newline at end of file
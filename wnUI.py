@@ -2,6 +2,7 @@
 The UI module defines classes that present the major user interface components to the user including
 the main frame, the bracket canvas, and the side panel.
 '''
+import os
 import wx
 import wx.wizard
 from wnBuilder import *
@@ -10,7 +11,15 @@ from wnPrinting import *
 from wnExport import *
 import WrestlingNerd_wdr as GUI
 import wnSettings
-import cPickle
+import wnStorage
+import wnJournal
+import wnAutosave
+import wnDatabase
+import wnBackup
+import wnSnapshot
+
+# menu items added to the ones made in the designer
+ID_ADDWEIGHT_MENU = wx.NewId()
 
 class wnFrame(wx.Frame):
   '''Class that creates and manages the main WN window.'''
@@ -22,6 +31,8 @@ class wnFrame(wx.Frame):
   
     #set the menu bar
     mb = GUI.CreateMenuBar()
+    tools = mb.GetMenu(mb.FindMenu('Tools'))
+    tools.Insert(2, ID_ADDWEIGHT_MENU, 'Add a &weight class...', '')
     self.SetMenuBar(mb)
     
     #correct the background color
@@ -49,6 +60,11 @@ class wnFrame(wx.Frame):
     #create class variables
     self.tournament = None
     self.filename = None
+    self.journal = None
+    self.autosaver = None
+    self.backup_store = None
+    self.snapshot = None
+    self.score_version = None
     self.weights = self.FindWindowById(GUI.ID_WEIGHTS_CHOICE)
     self.teams = self.FindWindowById(GUI.ID_TEAMS_LIST)
     
@@ -62,6 +78,11 @@ class wnFrame(wx.Frame):
     #disable menu items
     self.ChangeMenuState('on start')
     
+    #save the tournament in the background at a set interval
+    self.autosave_timer = wx.Timer(self, 0)
+    if wnSettings.autosave_interval > 0:
+      self.autosave_timer.Start(wnSettings.autosave_interval)
+    
     wx.EVT_CLOSE(self, self.OnClose)
     wx.EVT_MENU(self, GUI.ID_EXIT_MENU, self.OnClose)
     wx.EVT_MENU(self, GUI.ID_NEW_MENU, self.OnNew)
@@ -77,19 +98,23 @@ class wnFrame(wx.Frame):
     wx.EVT_MENU(self, GUI.ID_SCOREWIN_MENU, self.OnScoreWindow)
     wx.EVT_MENU(self, GUI.ID_ADDTEAM_MENU, self.OnAddTeam)
     wx.EVT_MENU(self, GUI.ID_REMOVETEAM_MENU, self.OnRemoveTeam)
+    wx.EVT_MENU(self, ID_ADDWEIGHT_MENU, self.OnAddWeight)
     wx.EVT_MENU(self, GUI.ID_TEAMSPELLING_MENU, self.OnChangeTeamSpelling)
     wx.EVT_MENU(self, GUI.ID_WRESTLERSPELLING_MENU, self.OnChangeWrestlerSpelling)
     wx.EVT_MENU(self, GUI.ID_TOURNAMENTNAME_MENU, self.OnChangeTournamentName)
     wx.EVT_MENU(self, GUI.ID_ABOUT_MENU, self.OnAbout)
     wx.EVT_CHOICE(self, GUI.ID_WEIGHTS_CHOICE, self.OnSelectWeight)
     wx.EVT_LIST_ITEM_ACTIVATED(self, GUI.ID_TEAMS_LIST, self.OnSelectTeam)
+    wx.EVT_TIMER(self, 0, self.OnAutosave)
     
   def OnClose(self, event):
     '''Handle a window close event.'''
-    # quit immediately if there is no tournament
-    if self.tournament is None:
-      self.canvas.Close()
-      self.Destroy()
+    # quit immediately if there is no tournament or nothing to save, but only once the saves being
+    # written have reached the disk, since quitting removes the journal
+    if self.tournament is None or \
+       (self.filename is not None and wnDatabase.IsDatabase(self.filename)) or \
+       (self.filename is not None and self.WaitForSave() and not self.autosaver.IsModified()):
+      self.Quit()
       return
       
     # ask if we want to save before closing
@@ -102,17 +127,23 @@ class wnFrame(wx.Frame):
       # don't quit
       event.Veto()
     elif result == wx.ID_YES:
-      if self.OnSave(event):
+      if self.OnSave(event) and self.WaitForSave():
         # save and quit
-        self.canvas.Close()
-        self.Destroy()
+        self.Quit()
       else:
         # cancel the save and don't quit
         event.Veto()
     elif result == wx.ID_NO:
       # don't save and quit
-      self.canvas.Close()
-      self.Destroy()
+      self.Quit()
+      
+  def Quit(self):
+    '''Stop recording changes, throw away the autosaved copy, and close the window.'''
+    self.StopJournal()
+    self.StopAutosave()
+    self.DiscardAutosave()
+    self.canvas.Close()
+    self.Destroy()
     
   def OnNew(self, event):
     '''Show the new tournament wizard.'''
@@ -122,6 +153,15 @@ class wnFrame(wx.Frame):
     wiz = wnNewTournamentWizard(self)
     wiz.SetAvailableLayouts(builder.GetTournaments())
     
+    #tell the user about layouts that could not be read
+    errors = builder.GetRegistry().Errors
+    if errors != []:
+      text = '\n'.join(['%s: %s' % (os.path.basename(fn), e) for fn, e in errors])
+      dlg = wx.MessageDialog(self, 'These layouts could not be read and are left out:\n\n' + text,
+                             'Layout errors', style=wx.OK|wx.ICON_WARNING)
+      dlg.ShowModal()
+      dlg.Destroy()
+    
     #if the wizard completes successfully
     if wiz.RunWizard():
       name = wiz.GetName()
@@ -130,7 +170,12 @@ class wnFrame(wx.Frame):
       layout = wiz.GetLayout()
         
       #create the tournament
+      self.StopJournal()
+      self.StopAutosave()
+      self.DiscardAutosave()
+      self.backup_store = None
       self.tournament = builder.Create(layout, name, weights, teams)
+      self.StartAutosave()
       
       #reset the GUI
       self.ResetAfterNew()
@@ -138,57 +183,169 @@ class wnFrame(wx.Frame):
       self.filename = None
       
   def OnSave(self, event):
-    '''Save the current tournament to disk by pickling it.'''
+    '''Save the current tournament to disk in the compact file format. The file is written in the
+    background. A database already holds every change, so there is nothing to write.'''
     if self.filename is None:
       return self.OnSaveAs(event)
+    elif wnDatabase.IsDatabase(self.filename):
+      self.autosaver.SetSaved()
     else:
-      f = file(self.filename, 'wb')
-      cPickle.dump(self.tournament, f, True)
-      f.close()
-      return True
+      self.autosaver.Save(self.filename)
+    return True
 
   def OnSaveAs(self, event):
     saved = False
     dlg = wx.FileDialog(self, 'Save tournament', 
-                        wildcard='Wrestling Nerd files (*.wnd)|*.wnd',
+                        wildcard='Wrestling Nerd files (*.wnd)|*.wnd|'
+                                 'Wrestling Nerd databases (*.wndb)|*.wndb',
                         style=wx.SAVE|wx.OVERWRITE_PROMPT)
       
     if dlg.ShowModal() == wx.ID_OK:
-      f = file(dlg.GetPath(), 'wb')
-      cPickle.dump(self.tournament, f, True)
-      f.close()
-      self.ChangeMenuState('on save')
+      self.StopJournal()
       self.filename = dlg.GetPath()
+      # starting a database writes the whole tournament to it
+      if wnDatabase.IsDatabase(self.filename):
+        self.autosaver.SetSaved()
+      else:
+        self.autosaver.Save(self.filename)
+      self.ChangeMenuState('on save')
+      self.StartJournal()
       saved = True
       
     dlg.Destroy()
     return saved
     
   def OnBackup(self, event):
-    dlg = wx.FileDialog(self, 'Backup tournament', wildcard='Wrestling Nerd files (*.wnd)|*.wnd',
-                         style=wx.SAVE|wx.OVERWRITE_PROMPT)
+    '''Add a backup of the current tournament to a backup folder. Only the parts that changed since
+    the last backup in the folder are written, and later autosaves add backups to it too.'''
+    path = ''
+    if self.backup_store is not None:
+      path = self.backup_store.folder
+    dlg = wx.DirDialog(self, 'Backup tournament to folder', defaultPath=path,
+                       style=wx.DD_NEW_DIR_BUTTON)
       
     if dlg.ShowModal() == wx.ID_OK:
-      f = file(dlg.GetPath(), 'wb')
-      cPickle.dump(self.tournament, f, True)
-      f.close()
+      self.backup_store = wnBackup.wnBackupStore(dlg.GetPath())
+      self.autosaver.Backup(self.backup_store)
       
     dlg.Destroy()
       
   def OnOpen(self, event):
     '''Open a tournament from disk.'''
-    dlg = wx.FileDialog(self, 'Open tournament', wildcard='Wrestling Nerd files (*.wnd)|*.wnd',
+    dlg = wx.FileDialog(self, 'Open tournament',
+                        wildcard='Wrestling Nerd files (*.wnd)|*.wnd|'
+                                 'Wrestling Nerd databases (*.wndb)|*.wndb',
                         style=wx.OPEN|wx.HIDE_READONLY)
     
     if dlg.ShowModal() == wx.ID_OK:
-      f = file(dlg.GetPath(), 'rb')
-      self.tournament = cPickle.load(f)
-      f.close()
+      self.StopJournal()
+      self.StopAutosave()
+      self.DiscardAutosave()
+      self.backup_store = None
+      self.filename = dlg.GetPath()
+      
+      # a journal left behind holds changes made after the last save, and without one the last
+      # autosaved copy holds some of them
+      journal = wnJournal.Exists(self.filename)
+      recovered = False
+      ids = None
+      if journal and self.AskRecover():
+        recovered = True
+        self.tournament = wnJournal.Recover(self.filename)
+      elif not journal and wnAutosave.Exists(self.filename) and self.AskRecover():
+        recovered = True
+        self.tournament = wnStorage.Load(wnAutosave.GetAutosaveName(self.filename), lazy=True)
+      elif wnDatabase.IsDatabase(self.filename):
+        # the database already holds the tournament, so its writer only needs the rows
+        ids = {}
+        self.tournament = wnDatabase.Load(self.filename, ids)
+      else:
+        # files saved by older versions are still read, and weights are built when first shown
+        self.tournament = wnStorage.Load(self.filename, lazy=True)
+      self.StartJournal(ids)
+      self.StartAutosave()
+      if recovered:
+        self.autosaver.SetModified()
       self.ResetAfterNew()
       self.ChangeMenuState('on open')
-      self.filename = dlg.GetPath()
       
     dlg.Destroy()
+    
+  def AskRecover(self):
+    '''Ask if the unsaved changes found in the journal or autosaved copy of a tournament should be
+    recovered.'''
+    dlg = wx.MessageDialog(self, 'This tournament was not closed properly. Do you want to recover '
+                           'the changes made after it was last saved?', 'Recover tournament',
+                           wx.ICON_QUESTION|wx.YES_DEFAULT|wx.YES_NO)
+    result = dlg.ShowModal()
+    dlg.Destroy()
+    return result == wx.ID_YES
+    
+  def StartJournal(self, ids=None):
+    '''Start recording changes to the current tournament in the journal beside its file. A database
+    needs no journal because it commits every change itself, so its writer is started instead. The
+    writer is given the rows of a tournament just loaded from the database so it is not written
+    again.'''
+    self.StopJournal()
+    if wnDatabase.IsDatabase(self.filename):
+      self.journal = wnDatabase.wnDatabaseWriter(self.tournament, self.filename, ids)
+    else:
+      self.journal = wnJournal.wnJournal(self.tournament, self.filename)
+    
+  def StopJournal(self):
+    '''Stop recording changes and remove the journal, or close the database.'''
+    if self.journal is not None:
+      self.journal.Close()
+      self.journal = None
+      
+  def DiscardAutosave(self):
+    '''Remove the copy autosaved beside the current file, once its changes are saved or thrown
+    away.'''
+    if self.filename is not None:
+      wnAutosave.Remove(self.filename)
+      
+  def StartAutosave(self):
+    '''Start tracking changes to the current tournament so it can be saved in the background and,
+    when a snapshot file is set, read by other programs.'''
+    self.autosaver = wnAutosave.wnAutosaver(self.tournament)
+    if wnSettings.snapshot_filename is not None:
+      self.snapshot = wnSnapshot.wnSnapshotWriter(self.tournament, wnSettings.snapshot_filename)
+    
+  def StopAutosave(self):
+    '''Finish any saves still being written and stop tracking changes.'''
+    if self.autosaver is not None:
+      self.autosaver.Close()
+      self.autosaver = None
+    if self.snapshot is not None:
+      self.snapshot.Close()
+      self.snapshot = None
+      
+  def WaitForSave(self):
+    '''Wait for the saves being written in the background. Tell the user and return False if one
+    of them failed.'''
+    try:
+      self.autosaver.Wait()
+    except EnvironmentError, e:
+      dlg = wx.MessageDialog(self, 'The tournament could not be saved. ' + str(e), 'Save failed',
+                             style=wx.OK|wx.ICON_ERROR)
+      dlg.ShowModal()
+      dlg.Destroy()
+      return False
+    return True
+    
+  def OnAutosave(self, event):
+    '''Write a copy of the current tournament beside its file in the background if it changed since
+    the last save, and back it up if a backup folder was chosen. The file itself is only written
+    when the user saves. Only tournaments that already have a file are autosaved.'''
+    if self.autosaver is None or self.filename is None:
+      return
+    modified = self.autosaver.IsModified()
+    if wnDatabase.IsDatabase(self.filename):
+      self.autosaver.SetSaved()
+    else:
+      self.autosaver.Autosave(self.filename)
+    if modified and self.backup_store is not None:
+      self.autosaver.Backup(self.backup_store)
       
   def OnExport(self, event):
     '''Show the export dialog. Right now, only export to plain text.'''
@@ -234,6 +391,13 @@ class wnFrame(wx.Frame):
       msg = 'There is 1 bout in the tournament.'
     else:
       msg = 'There are ' + str(i) + ' bouts in the tournament.'
+      
+    # add the bouts waiting to be wrestled
+    i = self.tournament.CountRemainingBouts()
+    if i == 1:
+      msg += ' 1 bout is ready to wrestle.'
+    else:
+      msg += ' ' + str(i) + ' bouts are ready to wrestle.'
     
     dlg = wx.MessageDialog(self, msg, 'Bout count', style=wx.OK)
     dlg.ShowModal()
@@ -281,6 +445,24 @@ class wnFrame(wx.Frame):
       
     dlg.Destroy()
     
+  def OnAddWeight(self, event):
+    '''Add an empty weight class to the tournament, as when one is added during an event.'''
+    dlg = wx.TextEntryDialog(self, 'Enter the name of the new weight class.', 'Add weight class')
+    if dlg.ShowModal() == wx.ID_OK:
+      name = dlg.GetValue()
+      if name in self.tournament.Weights:
+        msg = wx.MessageDialog(self, 'There is already a weight class with that name.',
+                               'Add weight class')
+        msg.ShowModal()
+        msg.Destroy()
+      elif name != '':
+        self.tournament.AddWeightClass(name)
+        self.ResetAfterNew()
+        self.weights.SetStringSelection(name)
+        self.canvas.RefreshBracket()
+      
+    dlg.Destroy()
+    
   def OnChangeTeamSpelling(self, event):
     '''Show the dialog that allows a user to change the spelling of a team name.'''
     dlg = wnTeamSpellingDialog(self, self.tournament.TeamNames)
@@ -349,10 +531,19 @@ class wnFrame(wx.Frame):
     
   def RefreshScores(self):
     '''Refresh the team scores.'''
-    # tell the tournament to update the scores for the current weight
-    scores = self.tournament.CalcScores(self.GetCurrentWeight())
+    # get the rows that changed since the last refresh
+    version, changes = self.tournament.GetScoreChanges(self.score_version)
+    self.score_version = version
+    
+    # update only the changed rows if the teams are the same
+    if changes is not None and self.teams.GetItemCount() == len(self.tournament.Teams):
+      for name, old, new, old_rank, new_rank in changes:
+        self.teams.SetStringItem(new_rank-1, 0, name)
+        self.teams.SetStringItem(new_rank-1, 1, str(new))
+      return
     
-    # refresh the score display
+    # otherwise rebuild the score display
+    scores = self.tournament.CalcScores()
     self.teams.DeleteAllItems()
     for i in range(len(scores)):
       score, name = scores[i]
@@ -393,6 +584,7 @@ class wnFrame(wx.Frame):
       mb.FindItemById(GUI.ID_SCOREWIN_MENU).Enable(False)
       mb.FindItemById(GUI.ID_ADDTEAM_MENU).Enable(False)
       mb.FindItemById(GUI.ID_REMOVETEAM_MENU).Enable(False)
+      mb.FindItemById(ID_ADDWEIGHT_MENU).Enable(False)
       mb.FindItemById(GUI.ID_TEAMSPELLING_MENU).Enable(False)
       mb.FindItemById(GUI.ID_WRESTLERSPELLING_MENU).Enable(False)
     
@@ -408,6 +600,7 @@ class wnFrame(wx.Frame):
       mb.FindItemById(GUI.ID_SCOREWIN_MENU).Enable(True)
       mb.FindItemById(GUI.ID_ADDTEAM_MENU).Enable(True)
       mb.FindItemById(GUI.ID_REMOVETEAM_MENU).Enable(True)
+      mb.FindItemById(ID_ADDWEIGHT_MENU).Enable(True)
       mb.FindItemById(GUI.ID_TEAMSPELLING_MENU).Enable(True)
       mb.FindItemById(GUI.ID_WRESTLERSPELLING_MENU).Enable(True)
             
@@ -423,6 +616,7 @@ class wnFrame(wx.Frame):
       mb.FindItemById(GUI.ID_SCOREWIN_MENU).Enable(True)
       mb.FindItemById(GUI.ID_ADDTEAM_MENU).Enable(True)
       mb.FindItemById(GUI.ID_REMOVETEAM_MENU).Enable(True)
+      mb.FindItemById(ID_ADDWEIGHT_MENU).Enable(True)
       mb.FindItemById(GUI.ID_TEAMSPELLING_MENU).Enable(True)
       mb.FindItemById(GUI.ID_WRESTLERSPELLING_MENU).Enable(True)
 
@@ -727,6 +921,7 @@ class wnTeamDialog(wx.Dialog):
     # set up the list control
     self.wrestlers.InsertColumn(0, 'Weight', width=-2)
     self.wrestlers.InsertColumn(1, 'Name', width=100)
+    self.wrestlers.InsertColumn(2, 'Points', width=-2)
     
     # show the current team stats
     self.pa_text.SetValue(str(self.team.PointAdjust))
@@ -736,6 +931,7 @@ class wnTeamDialog(wx.Dialog):
       w = wrestlers[i]
       self.wrestlers.InsertStringItem(i, w.Weight)
       self.wrestlers.SetStringItem(i, 1, w.Name)      
+      self.wrestlers.SetStringItem(i, 2, str(self.team.tournament.GetWrestlerPoints(w)))
     
     # set events
     wx.EVT_SPIN_UP(self, GUI.ID_POINTADJUST_SPIN, self.OnPointUp)
@@ -800,6 +996,7 @@ class wnScoreWindow(wx.Frame):
     # create object variables
     self.index = 0
     self.parent = parent
+    self.score_version = None
     
     # set the window title
     self.SetTitle(self.parent.GetTournament().Name)
@@ -813,10 +1010,20 @@ class wnScoreWindow(wx.Frame):
     wx.EVT_TIMER(self, 0, self.OnDrawScores)
     
   def OnDrawScores(self, event):
-    # get the current scores
-    scores = self.parent.GetTournament().CalcScores()
+    # get the rows that changed since the last refresh
+    tournament = self.parent.GetTournament()
+    version, changes = tournament.GetScoreChanges(self.score_version)
+    self.score_version = version
+    
+    # update only the changed rows if the teams are the same
+    if changes is not None and self.scores.GetItemCount() == len(tournament.Teams):
+      for name, old, new, old_rank, new_rank in changes:
+        self.scores.SetStringItem(new_rank-1, 1, name)
+        self.scores.SetStringItem(new_rank-1, 2, str(new))
+      return
     
-    # fill the list box with the current scores
+    # otherwise fill the list box with the current scores
+    scores = tournament.CalcScores()
     self.scores.DeleteAllItems()
     for i in range(len(scores)):
       score, name = scores[i]